@@ -0,0 +1,30 @@
+"""import lookup indexes
+
+Revision ID: 3f9a7c1e5d42
+Revises: e6b4c2d8f190
+Create Date: 2026-10-18 15:02:31.540917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a7c1e5d42'
+down_revision: Union[str, Sequence[str], None] = 'e6b4c2d8f190'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_buildings_address_coords', 'buildings', ['address', 'latitude', 'longitude'], unique=False)
+    op.create_index('ix_organization_phones_organization_id', 'organization_phones', ['organization_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organization_phones_organization_id', table_name='organization_phones')
+    op.drop_index('ix_buildings_address_coords', table_name='buildings')
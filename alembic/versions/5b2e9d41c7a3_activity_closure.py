@@ -0,0 +1,51 @@
+"""activity closure table
+
+Revision ID: 5b2e9d41c7a3
+Revises: c0638efa24f3
+Create Date: 2026-10-18 10:12:31.402117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e9d41c7a3'
+down_revision: Union[str, Sequence[str], None] = 'c0638efa24f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('activity_closure',
+    sa.Column('ancestor_id', sa.Integer(), nullable=False),
+    sa.Column('descendant_id', sa.Integer(), nullable=False),
+    sa.Column('depth', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['descendant_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index('ix_activity_closure_descendant_id', 'activity_closure', ['descendant_id'], unique=False)
+    op.create_index('ix_org_activity_activity_id', 'org_activity', ['activity_id'], unique=False)
+
+    # Заполняем замыкание для уже существующих деятельностей
+    op.execute("""
+        INSERT INTO activity_closure (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE activity_tree(ancestor_id, descendant_id, depth) AS (
+            SELECT id, id, 0 FROM activities
+            UNION ALL
+            SELECT t.ancestor_id, a.id, t.depth + 1
+            FROM activity_tree t JOIN activities a ON a.parent_id = t.descendant_id
+        )
+        SELECT ancestor_id, descendant_id, depth FROM activity_tree
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_org_activity_activity_id', table_name='org_activity')
+    op.drop_index('ix_activity_closure_descendant_id', table_name='activity_closure')
+    op.drop_table('activity_closure')
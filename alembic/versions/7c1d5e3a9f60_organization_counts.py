@@ -0,0 +1,53 @@
+"""organization counts
+
+Revision ID: 7c1d5e3a9f60
+Revises: 3f9a7c1e5d42
+Create Date: 2026-10-18 18:41:07.215364
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c1d5e3a9f60'
+down_revision: Union[str, Sequence[str], None] = '3f9a7c1e5d42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('activity_organization_counts',
+    sa.Column('activity_id', sa.Integer(), nullable=False),
+    sa.Column('organizations', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('version', sa.Integer(), server_default='1', nullable=False),
+    sa.ForeignKeyConstraint(['activity_id'], ['activities.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('activity_id')
+    )
+    op.create_table('building_organization_counts',
+    sa.Column('building_id', sa.Integer(), nullable=False),
+    sa.Column('organizations', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['building_id'], ['buildings.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('building_id')
+    )
+
+    # Заполняем счётчики по уже существующим данным
+    op.execute("""
+        INSERT INTO activity_organization_counts (activity_id, organizations)
+        SELECT c.ancestor_id, count(DISTINCT oa.organization_id)
+        FROM activity_closure c JOIN org_activity oa ON oa.activity_id = c.descendant_id
+        GROUP BY c.ancestor_id
+    """)
+    op.execute("""
+        INSERT INTO building_organization_counts (building_id, organizations)
+        SELECT building_id, count(*) FROM organizations GROUP BY building_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('building_organization_counts')
+    op.drop_table('activity_organization_counts')
@@ -0,0 +1,28 @@
+"""organizations building_id index
+
+Revision ID: 8d3f1a6e2b90
+Revises: 5b2e9d41c7a3
+Create Date: 2026-10-18 11:40:07.118254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f1a6e2b90'
+down_revision: Union[str, Sequence[str], None] = '5b2e9d41c7a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_organizations_building_id', 'organizations', ['building_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_organizations_building_id', table_name='organizations')
@@ -0,0 +1,59 @@
+"""activity counts version
+
+Revision ID: d2a7f4c81b6e
+Revises: 7c1d5e3a9f60
+Create Date: 2026-10-18 21:12:44.502917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7f4c81b6e'
+down_revision: Union[str, Sequence[str], None] = '7c1d5e3a9f60'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+EVENTS = (('insert', 'NEW'), ('update', 'NEW'), ('delete', 'OLD'))
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('activity_counts_version',
+    sa.Column('id', sa.Integer(), server_default='1', nullable=False),
+    sa.Column('version', sa.BigInteger(), server_default='1', nullable=False),
+    sa.CheckConstraint('id = 1', name='ck_activity_counts_version_single_row'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO activity_counts_version (id, version) VALUES (1, 1)")
+
+    # Триггеры уровня оператора: один UPDATE на оператор, а не на каждую строку счётчиков.
+    # Оператор, не изменивший ни одной строки (пересчёт без изменений), версию не трогает
+    op.execute("""
+        CREATE FUNCTION bump_activity_counts_version() RETURNS trigger AS $$
+        BEGIN
+            IF EXISTS (SELECT 1 FROM changed_rows) THEN
+                UPDATE activity_counts_version SET version = version + 1 WHERE id = 1;
+            END IF;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for event, table in EVENTS:
+        op.execute(f"""
+            CREATE TRIGGER activity_counts_version_{event}
+            AFTER {event.upper()} ON activity_organization_counts
+            REFERENCING {table} TABLE AS changed_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_activity_counts_version()
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for event, _ in EVENTS:
+        op.execute(f"DROP TRIGGER activity_counts_version_{event} ON activity_organization_counts")
+    op.execute("DROP FUNCTION bump_activity_counts_version()")
+    op.drop_table('activity_counts_version')
@@ -0,0 +1,32 @@
+"""entity versions
+
+Revision ID: e6b4c2d8f190
+Revises: a41c7e9b3d25
+Create Date: 2026-10-18 14:21:07.118452
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6b4c2d8f190'
+down_revision: Union[str, Sequence[str], None] = 'a41c7e9b3d25'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('buildings', 'activities', 'organization_phones', 'organizations')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.drop_column(table, 'version')
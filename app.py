@@ -1,10 +1,29 @@
-from fastapi import FastAPI
-from routers import building, activity, organization
+from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.status import HTTP_409_CONFLICT
+from routers import building, activity, organization, metrics
+from utils.compression import CompressionMiddleware
+from utils.metrics import MetricsMiddleware
+from utils.querystats import QueryStatsMiddleware
+
+# Ответы проходят response_model маршрута (pydantic-core) и кодируются orjson
+app = FastAPI(debug=False, default_response_class=ORJSONResponse)
+# Сжатие — самое внутреннее: метрики видят размер ответа на проводе
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(StaleDataError)
+async def stale_data_handler(request: Request, exc: StaleDataError):
+    # version_id_col: строку параллельно изменили или удалили между чтением и записью
+    return ORJSONResponse({"detail": "resource was modified concurrently, retry"}, status_code=HTTP_409_CONFLICT)
 
-app = FastAPI(debug=False)
 
 app.include_router(building.router)
 app.include_router(activity.router)
 app.include_router(organization.router)
+app.include_router(metrics.router)
 
 
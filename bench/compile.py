@@ -0,0 +1,81 @@
+"""
+Цена сборки SQL-конструкций горячих обработчиков, без базы
+
+    python -m bench.compile --iterations 2000
+    python -m bench.compile --loader json
+
+По каждому запросу из db/handler/get.py три числа в микросекундах:
+  rebuild — сборка конструкции заново и расчёт её ключа кеша SQLAlchemy
+            (так обработчики работали до кеширования конструкций);
+  cached  — готовая конструкция из *_statement и её запомненный ключ (текущий путь);
+  compile — полная компиляция в SQL, то есть промах кеша скомпилированных запросов
+            (DB_QUERY_CACHE_SIZE): столько стоит первый вызов формы в процессе.
+Подготовку запроса в asyncpg (DB_PREPARED_STATEMENT_CACHE_SIZE) показывает bench.run:
+она требует обращения к серверу.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("DB_ECHO", "false")
+
+
+def per_call_us(func, iterations: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def cases(loader: str):
+    from db.handler import get
+    from db.models import Activity, Building, activity_organization_counts
+
+    return [
+        ("organizations page", get.organizations_page_statement, ("list", loader, True)),
+        ("organizations page fields=id,name", get.organizations_page_statement, ("list", loader, True, ("id", "name"))),
+        ("organizations by building", get.organizations_page_statement, ("by_building", loader, False)),
+        ("organizations by activity tree", get.organizations_page_statement, ("by_activity_tree", loader, False)),
+        ("organizations nearby (bbox)", get.query_statement, (("bbox",), loader, False)),
+        ("organizations by ids", get.organizations_by_ids_statement, (loader,)),
+        ("organizations query (all filters)", get.query_statement, (("building", "radius", "phone", "name", "activity"), loader, True)),
+        ("organizations query count", get.query_count_statement, (("bbox_wrap", "name", "activity"),)),
+        ("organization version", get.organization_version_statement, ()),
+        ("organization points", get.organization_points_statement, (True,)),
+        ("search", get.search_statement, (True,)),
+        ("autocomplete", get.autocomplete_statement, ()),
+        ("phones", get.phones_statement, ()),
+        ("buildings page", get.page_statement, (Building, True)),
+        ("building by id", get.by_id_statement, (Building,)),
+        ("buildings by ids", get.by_ids_statement, (Building,)),
+        ("activities version", get.activities_version_statement, ()),
+        ("activity by id", get.by_id_statement, (Activity,)),
+        ("organizations count by activity", get.organization_count_statement, (Activity, activity_organization_counts)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сборка и компиляция SQL-конструкций горячих обработчиков")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--loader", choices=("joined", "selectin", "json"), default="joined")
+    args = parser.parse_args()
+
+    from sqlalchemy.dialects.postgresql.asyncpg import dialect
+
+    pg = dialect()
+    print(f"{'statement':<34} {'rebuild us':>12} {'cached us':>12} {'compile us':>12}")
+    totals = [0.0, 0.0]
+    for name, builder, builder_args in cases(args.loader):
+        statement = builder(*builder_args)
+        rebuild = per_call_us(lambda: builder.__wrapped__(*builder_args)._generate_cache_key(), args.iterations)
+        cached = per_call_us(lambda: builder(*builder_args)._generate_cache_key(), args.iterations)
+        compile_ = per_call_us(lambda: statement.compile(dialect=pg), max(args.iterations // 20, 10))
+        totals[0] += rebuild
+        totals[1] += cached
+        print(f"{name:<34} {rebuild:>12.1f} {cached:>12.2f} {compile_:>12.1f}")
+    print(f"{'total':<34} {totals[0]:>12.1f} {totals[1]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
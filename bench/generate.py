@@ -0,0 +1,97 @@
+"""
+Генератор синтетического справочника для нагрузочных замеров
+
+    python -m bench.generate data.ndjson --organizations 1000000 --buildings 200000 --seed 1
+    python import_data.py data.ndjson
+
+Пишет NDJSON в формате import_data.py. При одинаковых параметрах и seed файл
+получается байт-в-байт одинаковым, поэтому замеры на разных ревизиях сравнимы.
+
+Здания распределяются вокруг нескольких «городов» (нормальное распределение
+с --spread-km) — так радиус-запросы видят и плотные, и пустые области. Дерево
+деятельностей имеет --activity-depth уровней по --activity-fanout детей.
+"""
+import argparse
+import json
+import math
+import random
+import sys
+
+# Не из db.spatial: генератор не должен тянуть настройки приложения и подключение к БД
+EARTH_RADIUS_KM = 6371.0
+
+STREETS = ("Ленина", "Мира", "Гагарина", "Садовая", "Лесная", "Школьная", "Советская", "Новая", "Полевая", "Заречная")
+WORDS = ("Рога", "Копыта", "Молоко", "Мясо", "Авто", "Строй", "Торг", "Сервис", "Трейд", "Групп", "Сибирь", "Волга")
+FORMS = ("ООО", "ИП", "АО", "ЗАО")
+
+
+def activity_paths(depth: int, fanout: int) -> list[list[str]]:
+    """Все пути дерева от корня; имена уникальны, как требует activities.name"""
+    paths, level = [], [[f"Деятельность {i + 1}"] for i in range(fanout)]
+    for _ in range(depth):
+        paths.extend(level)
+        level = [path + [f"{path[-1]}.{i + 1}"] for path in level for i in range(fanout)]
+    return paths
+
+
+def offset(lat: float, lon: float, north_km: float, east_km: float) -> tuple[float, float]:
+    lat2 = lat + math.degrees(north_km / EARTH_RADIUS_KM)
+    lon2 = lon + math.degrees(east_km / (EARTH_RADIUS_KM * max(math.cos(math.radians(lat)), 1e-6)))
+    return max(-90.0, min(90.0, lat2)), (lon2 + 180.0) % 360.0 - 180.0
+
+
+def generate(args, out):
+    rng = random.Random(args.seed)
+    cities = [
+        (rng.uniform(args.min_lat, args.max_lat), rng.uniform(args.min_lon, args.max_lon))
+        for _ in range(args.cities)
+    ]
+    buildings = []
+    for i in range(args.buildings):
+        lat, lon = offset(*rng.choice(cities), rng.gauss(0, args.spread_km), rng.gauss(0, args.spread_km))
+        buildings.append((f"г. Город, ул. {rng.choice(STREETS)} {i + 1}", round(lat, 6), round(lon, 6)))
+    paths = ["/".join(path) for path in activity_paths(args.activity_depth, args.activity_fanout)]
+
+    for i in range(args.organizations):
+        address, lat, lon = rng.choice(buildings)
+        record = {
+            "name": f"{rng.choice(FORMS)} {rng.choice(WORDS)}{rng.choice(WORDS).lower()} {i + 1}",
+            "address": address,
+            "latitude": lat,
+            "longitude": lon,
+            "phones": [
+                f"8-{rng.randint(800, 999)}-{rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}"
+                for _ in range(rng.randint(0, args.phones))
+            ],
+            "activities": rng.sample(paths, min(len(paths), rng.randint(1, args.activities))),
+        }
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Синтетические данные в формате import_data.py")
+    parser.add_argument("output", nargs="?", help="файл .ndjson (по умолчанию stdout)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--organizations", type=int, default=100000)
+    parser.add_argument("--buildings", type=int, default=20000)
+    parser.add_argument("--activity-depth", type=int, default=3)
+    parser.add_argument("--activity-fanout", type=int, default=5)
+    parser.add_argument("--activities", type=int, default=3, help="максимум деятельностей у организации")
+    parser.add_argument("--phones", type=int, default=3, help="максимум телефонов у организации")
+    parser.add_argument("--cities", type=int, default=10)
+    parser.add_argument("--spread-km", type=float, default=15.0, help="разброс зданий вокруг города")
+    parser.add_argument("--min-lat", type=float, default=43.0)
+    parser.add_argument("--max-lat", type=float, default=60.0)
+    parser.add_argument("--min-lon", type=float, default=30.0)
+    parser.add_argument("--max-lon", type=float, default=90.0)
+    args = parser.parse_args()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            generate(args, out)
+    else:
+        generate(args, sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""
+Замер всех маршрутов приложения в одном процессе через ASGI
+
+    python -m bench.run --requests 500 --concurrency 16 --output bench/results/$(git rev-parse --short HEAD).json
+    python -m bench.run --compare bench/results/old.json --output bench/results/new.json
+
+Запросы идут в app через httpx.ASGITransport, без сети, к базе из настроек
+приложения (заполните её через bench.generate и import_data.py). По каждому
+маршруту: пропускная способность, p50/p95/p99 задержки и пик выделенной
+Python-памяти (tracemalloc). Кеш ответов по умолчанию выключен, чтобы мерить
+запросы к базе, а не попадания в кеш (--cache включает его).
+
+Маршруты, меняющие данные, запускаются только с --writes: они создают, меняют и
+удаляют собственные записи, но часть записей из bulk-маршрутов остаётся в базе.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass, field
+from typing import Callable
+
+PERCENTILES = (50, 95, 99)
+
+
+@dataclass
+class Scenario:
+    """Как построить запрос к маршруту; record видит ответ (например, чтобы запомнить созданный id)"""
+    route: str
+    request: Callable[[random.Random], tuple[str, dict]]
+    query: str = ""
+    writes: bool = False
+    record: Callable | None = None
+    requires: str | None = None
+
+    @property
+    def name(self) -> str:
+        return f"{self.route}{'?' + self.query if self.query else ''}"
+
+
+@dataclass
+class Samples:
+    """Существующие id и значения из базы, из которых строятся запросы"""
+    organization_ids: list[int]
+    building_ids: list[int]
+    activity_ids: list[int]
+    root_activity_names: list[str]
+    name_words: list[str]
+    points: list[tuple[float, float]]
+    created: dict[str, list] = field(default_factory=dict)
+
+    def pop_created(self, kind: str, rng: random.Random):
+        pool = self.created.get(kind)
+        return pool.pop(rng.randrange(len(pool))) if pool else None
+
+
+async def load_samples(limit: int = 5000) -> Samples:
+    from sqlalchemy import func, select
+
+    from db.engine import SessionLocal
+    from db.models import Activity, Building, Organization
+
+    async with SessionLocal() as session:
+        async def sample(query):
+            return list((await session.execute(query.order_by(func.random()).limit(limit))).all())
+
+        organizations = await sample(select(Organization.id, Organization.name))
+        buildings = await sample(select(Building.id, Building.latitude, Building.longitude))
+        activities = await sample(select(Activity.id, Activity.name, Activity.parent_id))
+    if not organizations or not buildings or not activities:
+        raise SystemExit("database is empty: load data with bench.generate and import_data.py first")
+    words = sorted({word for _, name in organizations for word in name.split() if len(word) >= 3})
+    return Samples(
+        organization_ids=[row.id for row in organizations],
+        building_ids=[row.id for row in buildings],
+        activity_ids=[row.id for row in activities],
+        root_activity_names=[row.name for row in activities if row.parent_id is None] or [activities[0].name],
+        name_words=words,
+        points=[(row.latitude, row.longitude) for row in buildings],
+    )
+
+
+def scenarios(samples: Samples, run_id: str) -> list[Scenario]:
+    s = samples
+
+    def get(path: Callable[[random.Random], str], params: Callable[[random.Random], dict] | None = None):
+        return lambda rng: ("GET", {"url": path(rng), "params": params(rng) if params else None})
+
+    def point(rng):
+        return rng.choice(s.points)
+
+    def nearby_radius(rng):
+        lat, lon = point(rng)
+        return {"lat": lat, "lon": lon, "radius": rng.choice((1, 5, 20))}
+
+    def nearby_bbox(rng):
+        lat, lon = point(rng)
+        return {"lat": lat, "lon": lon, "min_lat": lat - 0.05, "max_lat": lat + 0.05, "min_lon": lon - 0.08, "max_lon": lon + 0.08}
+
+    def nearest(rng):
+        lat, lon = point(rng)
+        return {"lat": lat, "lon": lon, "k": 10}
+
+    def remember(kind: str, key: Callable[[dict], object] = lambda body: body["id"]):
+        def record(response):
+            s.created.setdefault(kind, []).append(key(response.json()))
+        return record
+
+    def building_body(rng):
+        lat, lon = point(rng)
+        return {"address": f"bench {run_id} {rng.random()}", "latitude": lat, "longitude": lon}
+
+    def with_created(kind: str, build: Callable):
+        def request(rng):
+            created = s.pop_created(kind, rng)
+            return build(rng, created)
+        return request
+
+    return [
+        Scenario("GET /buildings/", get(lambda rng: "/buildings/")),
+        Scenario("GET /buildings/", get(lambda rng: "/buildings/", lambda rng: {"stream": 1}), query="stream=1"),
+        Scenario("GET /buildings/", get(lambda rng: "/buildings/", lambda rng: {"fields": "latitude,longitude"}), query="fields=latitude,longitude"),
+        Scenario("GET /buildings/{building_id}", get(lambda rng: f"/buildings/{rng.choice(s.building_ids)}")),
+        Scenario("GET /activities/", get(lambda rng: "/activities/")),
+        Scenario("GET /activities/", get(lambda rng: "/activities/", lambda rng: {"stream": 1}), query="stream=1"),
+        Scenario("GET /activities/{activity_id}", get(lambda rng: f"/activities/{rng.choice(s.activity_ids)}")),
+        Scenario("GET /organizations/", get(lambda rng: "/organizations/")),
+        Scenario("GET /organizations/", get(lambda rng: "/organizations/", lambda rng: {"stream": 1}), query="stream=1"),
+        Scenario("GET /organizations/", get(lambda rng: "/organizations/", lambda rng: {"fields": "id,name"}), query="fields=id,name"),
+        Scenario("GET /organizations/search", get(lambda rng: "/organizations/search", lambda rng: {"name": rng.choice(s.name_words)})),
+        Scenario("GET /organizations/autocomplete", get(lambda rng: "/organizations/autocomplete", lambda rng: {"q": rng.choice(s.name_words)[:3]})),
+        Scenario("GET /organizations/nearby", get(lambda rng: "/organizations/nearby", nearby_radius), query="radius"),
+        Scenario("GET /organizations/nearby", get(lambda rng: "/organizations/nearby", nearby_bbox), query="bbox"),
+        Scenario("GET /organizations/nearest", get(lambda rng: "/organizations/nearest", nearest)),
+        Scenario("GET /organizations/{organization_id}", get(lambda rng: f"/organizations/{rng.choice(s.organization_ids)}")),
+        Scenario("GET /organizations/by-building/{building_id}", get(lambda rng: f"/organizations/by-building/{rng.choice(s.building_ids)}")),
+        Scenario("GET /organizations/by-activity/{activity_id}", get(lambda rng: f"/organizations/by-activity/{rng.choice(s.activity_ids)}")),
+        Scenario("GET /organizations/by_activity_tree/{activity_name}", get(lambda rng: f"/organizations/by_activity_tree/{rng.choice(s.root_activity_names)}")),
+        Scenario("GET /organizations/{organization_id}/phones", get(lambda rng: f"/organizations/{rng.choice(s.organization_ids)}/phones")),
+        Scenario("GET /metrics", get(lambda rng: "/metrics")),
+
+        Scenario(
+            "POST /buildings/", lambda rng: ("POST", {"url": "/buildings/", "json": building_body(rng)}),
+            writes=True, record=remember("building"),
+        ),
+        Scenario(
+            "PUT /buildings/{building_id}",
+            with_created("building", lambda rng, building_id: ("PUT", {"url": f"/buildings/{building_id}", "json": building_body(rng)})),
+            writes=True, record=remember("building"), requires="building",
+        ),
+        Scenario(
+            "DELETE /buildings/{building_id}",
+            with_created("building", lambda rng, building_id: ("DELETE", {"url": f"/buildings/{building_id}"})),
+            writes=True, requires="building",
+        ),
+        Scenario(
+            "POST /buildings/bulk",
+            lambda rng: ("POST", {"url": "/buildings/bulk", "json": [building_body(rng) for _ in range(100)]}),
+            writes=True, record=lambda response: s.created.setdefault("building", []).extend(b["id"] for b in response.json()),
+        ),
+        Scenario(
+            "POST /activities/",
+            lambda rng: ("POST", {"url": "/activities/", "json": {"name": f"bench {run_id} {rng.random()}", "parent_id": rng.choice(s.activity_ids)}}),
+            writes=True, record=remember("activity"),
+        ),
+        Scenario(
+            "PUT /activities/{activity_id}",
+            with_created("activity", lambda rng, activity_id: ("PUT", {
+                "url": f"/activities/{activity_id}", "json": {"name": f"bench {run_id} {rng.random()}", "parent_id": None},
+            })),
+            writes=True, record=remember("activity"), requires="activity",
+        ),
+        Scenario(
+            "DELETE /activities/{activity_id}",
+            with_created("activity", lambda rng, activity_id: ("DELETE", {"url": f"/activities/{activity_id}"})),
+            writes=True, requires="activity",
+        ),
+        Scenario(
+            "POST /activities/bulk",
+            lambda rng: ("POST", {"url": "/activities/bulk", "json": [
+                {"name": f"bench {run_id} {rng.random()}", "ref": "root"},
+                *({"name": f"bench {run_id} {rng.random()}", "parent_ref": "root"} for _ in range(20)),
+            ]}),
+            writes=True, record=lambda response: s.created.setdefault("activity", []).extend(
+                a["id"] for a in reversed(response.json())
+            ),
+        ),
+        Scenario(
+            "POST /organizations/{organization_id}/phones",
+            lambda rng: ("POST", {"url": f"/organizations/{rng.choice(s.organization_ids)}/phones", "params": {"phone": "8-800-000-00-00"}}),
+            writes=True, record=remember("phone", lambda body: (body["organization_id"], body["id"])),
+        ),
+        Scenario(
+            "POST /organizations/{organization_id}/phones/bulk",
+            lambda rng: ("POST", {"url": f"/organizations/{rng.choice(s.organization_ids)}/phones/bulk", "json": ["8-800-000-00-01"] * 10}),
+            writes=True,
+        ),
+        Scenario(
+            "DELETE /organizations/{organization_id}/phones/{phone_id}",
+            with_created("phone", lambda rng, phone: ("DELETE", {"url": f"/organizations/{phone[0]}/phones/{phone[1]}"})),
+            writes=True, requires="phone",
+        ),
+        Scenario(
+            "POST /organizations/bulk",
+            lambda rng: ("POST", {"url": "/organizations/bulk", "json": [
+                {"name": f"bench {run_id} {rng.random()}", "building_id": rng.choice(s.building_ids),
+                 "phones": ["8-800-000-00-02"], "activity_ids": [rng.choice(s.activity_ids)]}
+                for _ in range(50)
+            ]}),
+            writes=True,
+        ),
+    ]
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Метод ближайшего ранга
+    index = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+async def run_scenario(client, scenario: Scenario, rng: random.Random, samples: Samples, requests: int, concurrency: int, warmup: int):
+    latencies: list[float] = []
+    errors = 0
+    statuses: dict[int, int] = {}
+
+    async def one(measure: bool):
+        nonlocal errors
+        if scenario.requires and not samples.created.get(scenario.requires):
+            return
+        method, kwargs = scenario.request(rng)
+        started = time.perf_counter()
+        response = await client.request(method, **kwargs)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors += 1
+        elif scenario.record:
+            scenario.record(response)
+        if measure:
+            latencies.append(elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    for _ in range(warmup):
+        await one(False)
+
+    queue = iter(range(requests))
+
+    async def worker():
+        for _ in queue:
+            await one(True)
+
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "statuses": statuses,
+        "rps": round(len(latencies) / wall, 1) if wall else 0.0,
+        **{f"p{p}_ms": round(percentile(latencies, p) * 1000, 2) for p in PERCENTILES},
+        "peak_alloc_kb": round(peak / 1024, 1),
+    }
+
+
+def compare(previous: dict, current: dict):
+    """Изменения p95 и rps относительно прошлого прогона"""
+    print(f"\n{'endpoint':<70} {'p95 ms':>18} {'rps':>18}")
+    for name, result in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if old is None:
+            continue
+
+        def delta(key):
+            before, after = old[key], result[key]
+            change = (after - before) / before * 100 if before else 0.0
+            return f"{before:>7} → {after:<7} {change:+6.1f}%"
+
+        print(f"{name:<70} {delta('p95_ms'):>18} {delta('rps'):>18}")
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main_async(args):
+    import httpx
+
+    from app import app
+
+    samples = await load_samples()
+    rng = random.Random(args.seed)
+    run_id = uuid.uuid4().hex[:8]
+    selected = [
+        scenario for scenario in scenarios(samples, run_id)
+        if (args.writes or not scenario.writes) and (not args.only or args.only in scenario.name)
+    ]
+
+    covered = {scenario.route for scenario in scenarios(samples, run_id)}
+    routes = {
+        f"{method} {route.path}"
+        for route in app.routes if getattr(route, "include_in_schema", False)
+        for method in getattr(route, "methods", ())
+    }
+    for missing in sorted(routes - covered):
+        print(f"warning: no benchmark scenario for {missing}", file=sys.stderr)
+
+    results = {}
+    tracemalloc.start()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for scenario in selected:
+            result = await run_scenario(client, scenario, rng, samples, args.requests, args.concurrency, args.warmup)
+            results[scenario.name] = result
+            print(
+                f"{scenario.name:<70} {result['rps']:>8} rps  p50 {result['p50_ms']:>8} ms  "
+                f"p95 {result['p95_ms']:>8} ms  p99 {result['p99_ms']:>8} ms  peak {result['peak_alloc_kb']:>9} KiB"
+                + (f"  errors {result['errors']}" if result["errors"] else ""),
+                file=sys.stderr,
+            )
+    tracemalloc.stop()
+
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "seed": args.seed,
+            "cache": args.cache,
+            "writes": args.writes,
+        },
+        "results": results,
+    }
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер маршрутов приложения через ASGI")
+    parser.add_argument("--requests", type=int, default=200, help="измеряемых запросов на маршрут")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--only", help="только сценарии, имя которых содержит эту строку")
+    parser.add_argument("--writes", action="store_true", help="замерять и маршруты, меняющие данные")
+    parser.add_argument("--cache", action="store_true", help="не выключать кеш ответов")
+    parser.add_argument("--output", help="куда сохранить результаты (JSON)")
+    parser.add_argument("--compare", help="прошлый JSON для сравнения")
+    args = parser.parse_args()
+
+    # До импорта приложения: настройки читаются при импорте
+    os.environ.setdefault("DB_ECHO", "false")
+    if not args.cache:
+        os.environ["CACHE_BACKEND"] = "none"
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,3 +8,69 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 REDIS_DB = int(os.getenv("REDIS_DB", 0))
 REDIS_TTL = int(os.getenv("REDIS_TTL", 21600))
 
+
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", 100))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 1000))
+
+# Способ загрузки организаций: joined | selectin | json
+ORG_LOADER = os.getenv("ORG_LOADER", "joined")
+# Переопределение для отдельных обработчиков, например "search=json,nearby=selectin"
+ORG_LOADERS = dict(
+    item.strip().split("=", 1) for item in os.getenv("ORG_LOADERS", "").split(",") if item.strip()
+)
+
+# Размер пачки серверного курсора при потоковой выдаче (NDJSON)
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500))
+
+# Пространственный индекс зданий: размер ячейки (км) и период перечитывания из БД (сек)
+SPATIAL_CELL_KM = float(os.getenv("SPATIAL_CELL_KM", 2.0))
+SPATIAL_INDEX_TTL = float(os.getenv("SPATIAL_INDEX_TTL", 60))
+
+# /organizations/nearest: сколько зданий-кандидатов всего можно передать в БД; дальше
+# поиск останавливается и отдаёт найденное (может быть меньше k)
+NEAREST_MAX_CANDIDATES = int(os.getenv("NEAREST_MAX_CANDIDATES", 20000))
+
+# Тайлы карты (db/tiles.py): тайл делится на 2^TILE_GRID_BITS ячеек по стороне; до
+# TILE_CLUSTER_MAX_ZOOM отдаются кластеры, глубже — сами здания; перечитывание — SPATIAL_INDEX_TTL
+TILE_GRID_BITS = int(os.getenv("TILE_GRID_BITS", 4))
+TILE_CLUSTER_MAX_ZOOM = int(os.getenv("TILE_CLUSTER_MAX_ZOOM", 14))
+TILE_MAX_ZOOM = int(os.getenv("TILE_MAX_ZOOM", 22))
+
+# Кеш ответов обработчиков чтения: memory | redis | none; время жизни записи — REDIS_TTL.
+# memory — кеш одного процесса: записи через другие воркеры и через import_data.py его
+# не сбрасывают (до REDIS_TTL отдаются старые данные). Поэтому при WEB_CONCURRENCY > 1
+# memory отключается (utils/cache.py), а кеш для нескольких воркеров и для импорта,
+# идущего при работающем сервисе, — только redis
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+# Число воркеров uvicorn (он читает ту же переменную)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 10000))
+
+# Максимум строк в одном запросе пакетного создания
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", 10000))
+
+# Пакетное чтение по id: максимум id в /batch и в одном объединённом запросе;
+# окно (мс), в течение которого одиночные запросы по id собираются в один.
+# Ожидающие запросы отдают своё соединение в пул, пакет в работе занимает одно (db/batching.py)
+BATCH_MAX_IDS = int(os.getenv("BATCH_MAX_IDS", 500))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", 2))
+
+# development | production; вне production ответы получают X-DB-Queries и Server-Timing
+ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+QUERY_STATS_HEADERS = ENVIRONMENT != "production"
+
+# Read-your-writes: после записи клиент столько секунд читает с primary (cookie или заголовок
+# X-Read-Your-Writes); должно покрывать отставание реплик. На столько же откладывается
+# повторный сброс тегов кеша, чтобы не закрепить в нём ответ отстающей реплики
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+
+# Сжатие ответов: порядок предпочтения (br и zstd — если установлены brotli и zstandard),
+# минимальный размер тела, уровни и память под уже сжатые тела
+COMPRESSION_ENCODINGS = [
+    encoding.strip() for encoding in os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip").split(",") if encoding.strip()
+]
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", 5))
+COMPRESSION_ZSTD_LEVEL = int(os.getenv("COMPRESSION_ZSTD_LEVEL", 3))
+COMPRESSION_CACHE_BYTES = int(os.getenv("COMPRESSION_CACHE_BYTES", 64 * 1024 * 1024))
@@ -0,0 +1,215 @@
+"""
+Дерево деятельностей в памяти процесса
+
+Списки смежности (родитель -> дети по порядку id) строятся за один проход по
+(id, name, parent_id, version) без обращений к отношениям parent/children.
+Вместе с деревом хранится отпечаток таблицы в формате
+get_activities_version_handler — (count, sum(version), max(id)): если отпечаток
+из базы другой (запись в другом воркере), дерево перечитывается. Собственные
+записи процесса применяются сразу (tree_add_activities и соседние функции)
+и сдвигают отпечаток так же, как они сдвигают его в базе, поэтому перечитывания
+после них не нужно.
+"""
+import asyncio
+import bisect
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Activity, activity_organization_counts
+
+# Сколько разных (root_id, max_depth) держать отрисованными
+RENDERED_MAX = 256
+
+
+class ActivityTree:
+
+    def __init__(self):
+        self.nodes: dict[int, tuple[str, int | None]] = {}
+        # parent_id -> id детей по возрастанию; None — корни
+        self.children: dict[int | None, list[int]] = {}
+        self.version_sum = 0
+        self.max_id: int | None = None
+        # Дерево могло разойтись с базой: отдаётся, но следующий запрос его перечитает
+        self.stale = False
+        # activity_id -> организаций в поддереве и отпечаток, с которым они прочитаны
+        self.organization_counts: dict[int, int] = {}
+        self.counts_version: str | None = None
+        # (root_id, max_depth, counts) -> готовые узлы; сбрасывается любым изменением
+        self.rendered: dict[tuple, list[dict]] = {}
+
+    @classmethod
+    def from_rows(cls, rows) -> "ActivityTree":
+        """Строки (id, name, parent_id, version) по возрастанию id"""
+        tree = cls()
+        for activity_id, name, parent_id, version in rows:
+            tree.nodes[activity_id] = (name, parent_id)
+            tree.version_sum += version
+            tree.max_id = activity_id
+        for activity_id, (_, parent_id) in tree.nodes.items():
+            tree.children.setdefault(parent_id if parent_id in tree.nodes else None, []).append(activity_id)
+        return tree
+
+    @property
+    def version(self) -> str | None:
+        if self.stale:
+            return None
+        return f"{len(self.nodes)}:{self.version_sum}:{self.max_id}"
+
+    def _link(self, activity_id: int, parent_id: int | None):
+        bisect.insort(self.children.setdefault(parent_id if parent_id in self.nodes else None, []), activity_id)
+
+    def _unlink(self, activity_id: int, parent_id: int | None):
+        siblings = self.children.get(parent_id if parent_id in self.nodes else None, [])
+        if activity_id in siblings:
+            siblings.remove(activity_id)
+
+    def add(self, activity_id: int, name: str, parent_id: int | None, version: int):
+        self.rendered.clear()
+        self.nodes[activity_id] = (name, parent_id)
+        self._link(activity_id, parent_id)
+        self.version_sum += version
+        self.max_id = activity_id if self.max_id is None else max(self.max_id, activity_id)
+
+    def update(self, activity_id: int, name: str, parent_id: int | None, version_delta: int):
+        _, old_parent_id = self.nodes[activity_id]
+        self.rendered.clear()
+        if old_parent_id != parent_id:
+            self._unlink(activity_id, old_parent_id)
+            self._link(activity_id, parent_id)
+        self.nodes[activity_id] = (name, parent_id)
+        self.version_sum += version_delta
+
+    def remove(self, activity_id: int, version: int):
+        """Дети удалённой становятся корнями; версия каждого растёт на 1, как в delete_activity_handler"""
+        _, parent_id = self.nodes[activity_id]
+        self.rendered.clear()
+        self._unlink(activity_id, parent_id)
+        del self.nodes[activity_id]
+        for child_id in self.children.pop(activity_id, []):
+            self.nodes[child_id] = (self.nodes[child_id][0], None)
+            self._link(child_id, None)
+            self.version_sum += 1
+        self.version_sum -= version
+
+    def set_counts(self, counts: dict[int, int], version: str):
+        self.organization_counts, self.counts_version = counts, version
+        self.rendered.clear()
+
+    def render(self, root_id: int | None = None, max_depth: int | None = None, counts: bool = False) -> list[dict]:
+        """Вложенные узлы {id, name, parent_id, children}: все корни или одно поддерево;
+        с counts — ещё organizations, число организаций в поддереве узла.
+
+        max_depth=0 — только сами корни, 1 — с детьми и т.д. Результат запоминается
+        до следующего изменения дерева; вызывающий его не меняет.
+        """
+        key = (root_id, max_depth, counts)
+        result = self.rendered.get(key)
+        if result is None:
+            if len(self.rendered) >= RENDERED_MAX:
+                self.rendered.clear()
+            result = self.rendered[key] = self._render(root_id, max_depth, counts)
+        return result
+
+    def _render(self, root_id: int | None, max_depth: int | None, counts: bool) -> list[dict]:
+        # Обход итеративный, а посещённые узлы отмечаются, чтобы испорченные данные с циклом не зациклили его
+        if root_id is None:
+            roots = self.children.get(None, [])
+        elif root_id in self.nodes:
+            roots = [root_id]
+        else:
+            return []
+        result = []
+        seen = set()
+        stack = [(activity_id, 0, result) for activity_id in reversed(roots)]
+        while stack:
+            activity_id, depth, siblings = stack.pop()
+            if activity_id in seen:
+                continue
+            seen.add(activity_id)
+            name, parent_id = self.nodes[activity_id]
+            node = {"id": activity_id, "name": name, "parent_id": parent_id}
+            if counts:
+                node["organizations"] = self.organization_counts.get(activity_id, 0)
+            node["children"] = []
+            siblings.append(node)
+            if max_depth is None or depth < max_depth:
+                stack.extend(
+                    (child_id, depth + 1, node["children"])
+                    for child_id in reversed(self.children.get(activity_id, ()))
+                )
+        return result
+
+
+activity_tree: ActivityTree | None = None
+# Записи, сделанные процессом, пока дерево перечитывается
+_changed_during_load = False
+_loading = False
+_lock = asyncio.Lock()
+
+
+async def ensure_activity_tree(session: AsyncSession, version: str, counts_version: str | None = None) -> ActivityTree:
+    """Дерево, соответствующее отпечатку version; при расхождении — перечитать одним запросом.
+
+    С counts_version (отпечаток счётчиков, db/counts.py) то же делается для числа организаций.
+    """
+    tree = await ensure_tree(session, version)
+    if counts_version is not None and tree.counts_version != counts_version:
+        result = await session.execute(
+            select(activity_organization_counts.c.activity_id, activity_organization_counts.c.organizations)
+        )
+        tree.set_counts(dict(result.all()), counts_version)
+    return tree
+
+
+async def ensure_tree(session: AsyncSession, version: str) -> ActivityTree:
+    global activity_tree, _changed_during_load, _loading
+    if activity_tree is not None and activity_tree.version == version:
+        return activity_tree
+    async with _lock:
+        if activity_tree is not None and activity_tree.version == version:
+            return activity_tree
+        _changed_during_load, _loading = False, True
+        try:
+            result = await session.execute(
+                select(Activity.id, Activity.name, Activity.parent_id, Activity.version).order_by(Activity.id)
+            )
+            tree = ActivityTree.from_rows(result.all())
+            # Неизвестно, видел ли запрос запись, сделанную во время чтения
+            tree.stale = _changed_during_load
+            activity_tree = tree
+        finally:
+            _loading = False
+    return activity_tree
+
+
+def _apply(change):
+    global _changed_during_load
+    if _loading:
+        _changed_during_load = True
+    if activity_tree is not None:
+        try:
+            change(activity_tree)
+        except KeyError:
+            # Деятельности нет в дереве — оно уже отстало от базы
+            activity_tree.stale = True
+
+
+def tree_add_activities(rows: list[tuple[int, str, int | None, int]]):
+    """Отразить созданные деятельности (id, name, parent_id, version) после commit;
+    родители должны идти раньше детей"""
+    rows = list(rows)
+
+    def change(tree: ActivityTree):
+        for activity_id, name, parent_id, version in rows:
+            tree.add(activity_id, name, parent_id, version)
+
+    _apply(change)
+
+
+def tree_update_activity(activity_id: int, name: str, parent_id: int | None, version_delta: int):
+    _apply(lambda tree: tree.update(activity_id, name, parent_id, version_delta))
+
+
+def tree_remove_activity(activity_id: int, version: int):
+    _apply(lambda tree: tree.remove(activity_id, version))
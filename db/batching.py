@@ -0,0 +1,94 @@
+"""
+Объединение одиночных чтений по id в пакетные запросы (в духе DataLoader)
+
+Конкурентные load(id) за BATCH_WINDOW_MS складываются в одну очередь и уходят
+одним запросом по id = ANY(:ids); каждый ожидающий получает значение своего id
+(или None, если его нет). Очередь отправляется раньше, как только набралось
+BATCH_MAX_IDS различных id.
+
+Очереди раздельные для каждого движка: запрос, закреплённый за primary
+(read-your-writes), не получит ответ реплики. Пакет читается в собственной сессии
+на том же движке, а не в сессии одного из запросов: тот мог бы завершиться или
+быть отменён, пока пакет ещё нужен остальным.
+
+Соединения: вызывающий сам возвращает соединение своей сессии в пул до load()
+(обработчики чтения по id в db/handler/get.py закрывают сессию). Ожидающие запросы
+соединений не держат, каждый пакет в работе держит одно — иначе DB_POOL_SIZE
+одновременных запросов заняли бы весь пул, а их пакет ждал бы соединения до
+таймаута. load() сессию не трогает: от неё нужен только bind.
+
+Таймер окна и задача пакета запускаются в чистом contextvars.Context, а не в
+контексте запроса, открывшего очередь: иначе запросы пакета попали бы в его
+QueryStats (utils/querystats.py), хотя он мог уже и завершиться.
+"""
+import asyncio
+import contextvars
+from typing import Awaitable, Callable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import BATCH_MAX_IDS, BATCH_WINDOW_MS
+
+
+class _Batch:
+    __slots__ = ("waiters", "handle")
+
+    def __init__(self):
+        # id -> futures ожидающих его запросов
+        self.waiters: dict[int, list[asyncio.Future]] = {}
+        self.handle: asyncio.TimerHandle | None = None
+
+
+class BatchLoader:
+    """fetch(ids, session) -> {id: значение}; отсутствующих id в словаре может не быть"""
+
+    def __init__(
+        self,
+        fetch: Callable[[list[int], AsyncSession], Awaitable[dict]],
+        window: float = BATCH_WINDOW_MS / 1000,
+        max_batch: int = BATCH_MAX_IDS,
+    ):
+        self.fetch = fetch
+        self.window = window
+        self.max_batch = max_batch
+        self.batches: dict[object, _Batch] = {}
+        # Ссылки на запущенные пакеты, чтобы задачи не собрал сборщик мусора
+        self.running: set[asyncio.Task] = set()
+
+    async def load(self, key: int, session: AsyncSession):
+        loop = asyncio.get_running_loop()
+        bind = session.bind
+        batch = self.batches.get(bind)
+        if batch is None:
+            batch = self.batches[bind] = _Batch()
+            batch.handle = loop.call_later(self.window, self._dispatch, bind, context=contextvars.Context())
+        future = loop.create_future()
+        batch.waiters.setdefault(key, []).append(future)
+        if len(batch.waiters) >= self.max_batch:
+            self._dispatch(bind)
+        return await future
+
+    def _dispatch(self, bind):
+        batch = self.batches.pop(bind, None)
+        if batch is None:
+            return
+        batch.handle.cancel()
+        task = asyncio.get_running_loop().create_task(self._run(bind, batch.waiters), context=contextvars.Context())
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+
+    async def _run(self, bind, waiters: dict[int, list[asyncio.Future]]):
+        try:
+            async with AsyncSession(bind=bind, autoflush=False, expire_on_commit=False) as session:
+                values = await self.fetch(list(waiters), session)
+        except Exception as e:
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+        for key, futures in waiters.items():
+            for future in futures:
+                # Отменённый запрос уже не ждёт
+                if not future.done():
+                    future.set_result(values.get(key))
@@ -0,0 +1,138 @@
+"""
+Поддержка таблицы замыкания activity_closure
+"""
+from sqlalchemy import Integer, delete, exists, func, insert, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Activity, activity_closure
+from exception.database import ActivityCycleError
+
+
+def subtree_ids(activity_id: int):
+    """Сама деятельность и все её потомки"""
+    paths = activity_closure.alias("subtree")
+    return select(paths.c.descendant_id).where(paths.c.ancestor_id == activity_id)
+
+
+def ancestor_ids(activity_id: int, strict: bool = False):
+    """Все предки деятельности; без strict — вместе с ней самой"""
+    paths = activity_closure.alias("ancestors")
+    query = select(paths.c.ancestor_id).where(paths.c.descendant_id == activity_id)
+    if strict:
+        query = query.where(paths.c.depth > 0)
+    return query
+
+
+async def add_activity_paths(activity_id: int, parent_id: int | None, session: AsyncSession):
+    """Пути для только что созданной деятельности-листа"""
+    await session.execute(
+        insert(activity_closure).values(ancestor_id=activity_id, descendant_id=activity_id, depth=0)
+    )
+    if parent_id is not None:
+        await session.execute(
+            insert(activity_closure).from_select(
+                ["ancestor_id", "descendant_id", "depth"],
+                select(
+                    activity_closure.c.ancestor_id,
+                    literal(activity_id),
+                    activity_closure.c.depth + 1,
+                ).where(activity_closure.c.descendant_id == parent_id),
+            )
+        )
+
+
+async def add_activity_paths_many(rows: list[tuple[int, int | None]], session: AsyncSession):
+    """add_activity_paths для пачки (activity_id, parent_id) двумя запросами.
+
+    Пути родителей уже должны быть в таблице: пакет с родителями из того же
+    пакета вставляется по уровням.
+    """
+    await session.execute(
+        insert(activity_closure),
+        [{"ancestor_id": activity_id, "descendant_id": activity_id, "depth": 0} for activity_id, _ in rows],
+    )
+    children = [(activity_id, parent_id) for activity_id, parent_id in rows if parent_id is not None]
+    if not children:
+        return
+    new = select(
+        func.unnest(literal([activity_id for activity_id, _ in children], ARRAY(Integer))).label("activity_id"),
+        func.unnest(literal([parent_id for _, parent_id in children], ARRAY(Integer))).label("parent_id"),
+    ).subquery("new")
+    await session.execute(
+        insert(activity_closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(activity_closure.c.ancestor_id, new.c.activity_id, activity_closure.c.depth + 1)
+            .join(new, activity_closure.c.descendant_id == new.c.parent_id),
+        )
+    )
+
+
+async def detach_activity_paths(activity_id: int, session: AsyncSession):
+    """Убрать пути от внешних предков к поддереву activity_id (поддерево становится отдельным деревом)"""
+    await session.execute(
+        delete(activity_closure).where(
+            activity_closure.c.descendant_id.in_(subtree_ids(activity_id)),
+            activity_closure.c.ancestor_id.not_in(subtree_ids(activity_id)),
+        )
+    )
+
+
+async def move_activity_paths(activity_id: int, parent_id: int | None, session: AsyncSession):
+    """Перенести поддерево activity_id под parent_id; цикл отклоняется до любых изменений"""
+    if parent_id is not None:
+        creates_cycle = await session.scalar(
+            select(exists().where(
+                activity_closure.c.ancestor_id == activity_id,
+                activity_closure.c.descendant_id == parent_id,
+            ))
+        )
+        if creates_cycle:
+            raise ActivityCycleError()
+
+    await detach_activity_paths(activity_id, session)
+    if parent_id is None:
+        return
+
+    above = activity_closure.alias("above")
+    below = activity_closure.alias("below")
+    await session.execute(
+        insert(activity_closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(above.c.ancestor_id, below.c.descendant_id, above.c.depth + below.c.depth + 1)
+            .where(above.c.descendant_id == parent_id, below.c.ancestor_id == activity_id),
+        )
+    )
+
+
+async def remove_activity_paths(activity_id: int, session: AsyncSession):
+    """Перед удалением деятельности: её потомки отрываются от её предков.
+
+    Строки с самой деятельностью удалит ON DELETE CASCADE.
+    """
+    await session.execute(
+        delete(activity_closure).where(
+            activity_closure.c.descendant_id.in_(subtree_ids(activity_id)),
+            activity_closure.c.ancestor_id.in_(ancestor_ids(activity_id, strict=True)),
+        )
+    )
+
+
+async def rebuild_activity_closure(session: AsyncSession):
+    """Полностью пересобрать таблицу замыкания по parent_id (для начальной загрузки данных)"""
+    await session.execute(delete(activity_closure))
+    tree = select(
+        Activity.id.label("ancestor_id"),
+        Activity.id.label("descendant_id"),
+        literal(0).label("depth"),
+    ).cte(name="activity_tree", recursive=True)
+    tree = tree.union_all(
+        select(tree.c.ancestor_id, Activity.id, tree.c.depth + 1)
+        .where(Activity.parent_id == tree.c.descendant_id)
+    )
+    await session.execute(
+        insert(activity_closure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(tree.c.ancestor_id, tree.c.descendant_id, tree.c.depth),
+        )
+    )
@@ -0,0 +1,116 @@
+"""
+Счётчики организаций по поддеревьям деятельностей и по зданиям
+
+Строки меняются в той же транзакции, что и записи, от которых они зависят:
+  новые организации — прибавка (count_new_organizations): до вставки их не было
+  ни в одном счётчике, поэтому различные организации можно просто досчитать;
+  перенос и удаление деятельности, импорт — пересчёт только затронутых строк
+  (recount_activities, recount_buildings): организация может остаться в поддереве
+  предка через другую связь, и вычесть её вслепую нельзя.
+Строки создаются по мере надобности: деятельность или здание без строки — ноль.
+Любое изменение activity_organization_counts увеличивает activity_counts_version
+(триггеры, миграция d2a7f4c81b6e) — отпечаток счётчиков для дерева и ETag.
+"""
+from sqlalchemy import Integer, any_, delete, distinct, func, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.closure import ancestor_ids
+from db.models import (
+    Activity, Building, Organization, activity_closure, activity_organization_counts,
+    building_organization_counts, org_activity,
+)
+
+
+def subtree_organizations(activity_id):
+    """Число различных организаций в поддереве activity_id (коррелированный подзапрос)"""
+    return (
+        select(func.count(distinct(org_activity.c.organization_id)))
+        .select_from(activity_closure.join(org_activity, org_activity.c.activity_id == activity_closure.c.descendant_id))
+        .where(activity_closure.c.ancestor_id == activity_id)
+        .scalar_subquery()
+    )
+
+
+def building_organizations(building_id):
+    return select(func.count()).where(Organization.building_id == building_id).scalar_subquery()
+
+
+def upsert_activity_counts(rows, add: bool):
+    stmt = insert(activity_organization_counts).from_select(["activity_id", "organizations"], rows)
+    counts = activity_organization_counts.c
+    organizations = counts.organizations + stmt.excluded.organizations if add else stmt.excluded.organizations
+    return stmt.on_conflict_do_update(
+        index_elements=[counts.activity_id],
+        set_={"organizations": organizations, "version": counts.version + 1},
+        # Пересчёт без изменений не трогает версию: дерево со счётчиками не перечитывается зря
+        where=None if add else counts.organizations != stmt.excluded.organizations,
+    )
+
+
+def upsert_building_counts(rows, add: bool):
+    stmt = insert(building_organization_counts).from_select(["building_id", "organizations"], rows)
+    counts = building_organization_counts.c
+    return stmt.on_conflict_do_update(
+        index_elements=[counts.building_id],
+        set_={"organizations": counts.organizations + stmt.excluded.organizations if add else stmt.excluded.organizations},
+    )
+
+
+async def count_new_organizations(organization_ids: list[int], session: AsyncSession) -> dict[int, int]:
+    """После вставки организаций и их связей: прибавить их к зданиям и ко всем предкам их деятельностей.
+
+    Возвращает building_id -> организаций в здании после прибавки (для db.tiles).
+    """
+    if not organization_ids:
+        return {}
+    ids = literal(list(organization_ids), ARRAY(Integer))
+    await session.execute(upsert_activity_counts(
+        select(activity_closure.c.ancestor_id, func.count(distinct(org_activity.c.organization_id)))
+        .join(org_activity, org_activity.c.activity_id == activity_closure.c.descendant_id)
+        .where(org_activity.c.organization_id == any_(ids))
+        .group_by(activity_closure.c.ancestor_id),
+        add=True,
+    ))
+    counts = building_organization_counts.c
+    result = await session.execute(upsert_building_counts(
+        select(Organization.building_id, func.count())
+        .where(Organization.id == any_(ids))
+        .group_by(Organization.building_id),
+        add=True,
+    ).returning(counts.building_id, counts.organizations))
+    return dict(result.all())
+
+
+async def recount_activities(activity_ids: list[int], session: AsyncSession):
+    """Пересчитать поддеревья перечисленных деятельностей (удалённые пропускаются)"""
+    if not activity_ids:
+        return
+    await session.execute(upsert_activity_counts(
+        select(Activity.id, subtree_organizations(Activity.id))
+        .where(Activity.id == any_(literal(list(set(activity_ids)), ARRAY(Integer)))),
+        add=False,
+    ))
+
+
+async def recount_buildings(building_ids: list[int], session: AsyncSession):
+    if not building_ids:
+        return
+    await session.execute(upsert_building_counts(
+        select(Building.id, building_organizations(Building.id))
+        .where(Building.id == any_(literal(list(set(building_ids)), ARRAY(Integer)))),
+        add=False,
+    ))
+
+
+async def strict_ancestor_ids(activity_id: int, session: AsyncSession) -> list[int]:
+    """Предки деятельности без неё самой — их счётчики меняются при её переносе или удалении"""
+    return list(await session.scalars(ancestor_ids(activity_id, strict=True)))
+
+
+async def rebuild_counts(session: AsyncSession):
+    """Полностью пересчитать оба счётчика (для начальной загрузки данных)"""
+    await session.execute(delete(activity_organization_counts))
+    await session.execute(delete(building_organization_counts))
+    await session.execute(upsert_activity_counts(select(Activity.id, subtree_organizations(Activity.id)), add=False))
+    await session.execute(upsert_building_counts(select(Building.id, building_organizations(Building.id)), add=False))
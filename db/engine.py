@@ -1,6 +1,19 @@
-from sqlalchemy.exc import SQLAlchemyError
+import logging
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+
+from fastapi import Request, Response
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from .config import get_database_config
+from config import READ_YOUR_WRITES_SECONDS
+from utils import cache
+from utils.metrics import db_read_sessions, instrument_engine
+from utils.querystats import current_stats
+
+logger = logging.getLogger()
 
 # Получаем конфигурацию базы данных
 db_config = get_database_config()
@@ -10,18 +23,124 @@ engine = create_async_engine(
     db_config.database_url,
     echo=db_config.echo,
     pool_size=db_config.pool_size,
-    max_overflow=db_config.max_overflow
+    max_overflow=db_config.max_overflow,
+    query_cache_size=db_config.query_cache_size,
+    connect_args={"prepared_statement_cache_size": db_config.prepared_statement_cache_size},
 )
+instrument_engine(engine.sync_engine)
 
 # Создаем фабрику сессий
 SessionLocal = async_sessionmaker(
-    autocommit=False, 
-    autoflush=False, 
-    bind=engine, 
+    autocommit=False,
+    autoflush=False,
+    bind=engine,
     expire_on_commit=False,
     class_=AsyncSession,
 )
 
+# Движки реплик: pre_ping отбраковывает соединения, оставшиеся в пуле от упавшей реплики,
+# и ошибка всплывает при выдаче соединения, а не посреди обработчика
+replica_engines = [
+    create_async_engine(
+        url,
+        echo=db_config.echo,
+        pool_size=db_config.replica_pool_size,
+        max_overflow=db_config.replica_max_overflow,
+        pool_pre_ping=True,
+        query_cache_size=db_config.query_cache_size,
+        connect_args={
+            "timeout": db_config.replica_connect_timeout,
+            "prepared_statement_cache_size": db_config.prepared_statement_cache_size,
+        },
+    )
+    for url in db_config.replica_urls
+]
+for replica_engine in replica_engines:
+    instrument_engine(replica_engine.sync_engine)
+
+if replica_engines:
+    cache.reinvalidate_after(READ_YOUR_WRITES_SECONDS)
+
+READ_YOUR_WRITES_COOKIE = "read_your_writes"
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+# Ошибки получения соединения, при которых чтение уходит на следующую реплику или primary
+REPLICA_UNAVAILABLE = (DBAPIError, PoolTimeoutError, OSError, TimeoutError)
+
+
+class ReplicaSet:
+    """Реплики по кругу; недоступная пропускается retry_after секунд"""
+
+    def __init__(self, engines: list, retry_after: float):
+        self.sessionmakers = [
+            async_sessionmaker(autoflush=False, bind=engine, expire_on_commit=False, class_=AsyncSession)
+            for engine in engines
+        ]
+        self.retry_after = retry_after
+        self.down_until = [0.0] * len(engines)
+        self.next = 0
+
+    def candidates(self):
+        count = len(self.sessionmakers)
+        if not count:
+            return
+        start = self.next
+        self.next = (start + 1) % count
+        now = time.monotonic()
+        for step in range(count):
+            index = (start + step) % count
+            if self.down_until[index] <= now:
+                yield index
+
+    def mark_down(self, index: int):
+        self.down_until[index] = time.monotonic() + self.retry_after
+
+
+replicas = ReplicaSet(replica_engines, db_config.replica_retry_after)
+
+
+def record_target(target: str, reason: str):
+    db_read_sessions.inc(target, reason)
+    stats = current_stats.get()
+    if stats is not None:
+        stats.target = target
+
+
+@asynccontextmanager
+async def read_session(pinned: bool = False):
+    """Сессия для чтения: реплика, а если реплик нет, все недоступны
+    или клиент недавно писал (read-your-writes) — primary"""
+    if pinned:
+        reason = "read_your_writes"
+    else:
+        reason = "no_replicas" if not replicas.sessionmakers else "replicas_unavailable"
+        for index in replicas.candidates():
+            session = replicas.sessionmakers[index]()
+            try:
+                await session.connection()
+            except REPLICA_UNAVAILABLE as e:
+                await session.close()
+                replicas.mark_down(index)
+                logger.warning(f"⚠️ Replica {index} unavailable, skipping for {replicas.retry_after}s: {e}")
+                continue
+            record_target(f"replica-{index}", "replica")
+            async with session:
+                yield session
+            return
+    record_target("primary", reason)
+    async with SessionLocal() as session:
+        yield session
+
+
+def reads_from_primary(request: Request) -> bool:
+    """Клиент писал меньше READ_YOUR_WRITES_SECONDS назад (метка из cookie или заголовка)"""
+    value = request.headers.get(READ_YOUR_WRITES_HEADER) or request.cookies.get(READ_YOUR_WRITES_COOKIE)
+    try:
+        until = float(value)
+    except (TypeError, ValueError):
+        return False
+    now = time.time()
+    # Метка из будущего дальше окна — подделка или сбитые часы, не закрепляем клиента за primary
+    return now < until <= now + READ_YOUR_WRITES_SECONDS + 1
 
 
 class DBContext:
@@ -36,8 +155,24 @@ class DBContext:
         self.db.close()
 
 
-async def get_db():
+async def get_db(request: Request, response: Response):
+    """Сессии primary для маршрутов записи.
+
+    При наличии реплик ответ на запись несёт метку read-your-writes (cookie и
+    заголовок X-Read-Your-Writes): пока она действует, чтения этого клиента идут на primary.
+    """
+    if replica_engines and request.method not in ("GET", "HEAD", "OPTIONS"):
+        until = str(int(time.time() + READ_YOUR_WRITES_SECONDS))
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE, until, max_age=int(READ_YOUR_WRITES_SECONDS) + 1, httponly=True, samesite="lax",
+        )
+        response.headers[READ_YOUR_WRITES_HEADER] = until
     # try:
     yield SessionLocal
 # except SQLAlchemyError as e:
 #     print(e)
+
+
+async def get_read_db(request: Request):
+    """Фабрика сессий для маршрутов чтения: async with db() as session — как и у get_db"""
+    yield partial(read_session, reads_from_primary(request))
@@ -1,11 +1,28 @@
+
+from sqlalchemy import Integer, any_, insert, literal, select
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.models import OrganizationPhone, Building, Activity
+from db.models import OrganizationPhone, Building, Activity, Organization, org_activity
+from db.activity_tree import tree_add_activities
+from db.closure import add_activity_paths, add_activity_paths_many
+from db.counts import count_new_organizations
+from db.spatial import index_building, index_buildings
+from db.tiles import tile_buildings, tile_organizations
+from db.versions import bump_organization_version
+from exception.database import NotFoundedError
+from exception.request import BulkValidationError
+from shemas.activity import ActivityBulkCreate
+from shemas.building import BuildingCreate
+from shemas.organization import OrganizationCreate
+from utils.cache import geo_tag, invalidate
 
 async def create_phone_handler(organization_id: int, phone: str, session: AsyncSession):
 
     phone = OrganizationPhone(organization_id=organization_id, phone=phone)
     session.add(phone)
+    await bump_organization_version(organization_id, session)
     await session.commit()
+    await invalidate(f"org:{organization_id}")
     return phone    
 
 
@@ -13,11 +30,277 @@ async def create_building_handler(address: str, latitude: float, longitude: floa
     building = Building(address=address, latitude=latitude, longitude=longitude)
     session.add(building)
     await session.commit()
+    index_building(building)
+    tile_buildings([(building.id, latitude, longitude)])
+    await invalidate("buildings", f"building:{building.id}", geo_tag(latitude, longitude), "geo:*")
     return building
 
 
 async def create_activity_handler(name: str, parent_id: int | None, session: AsyncSession):
     activity = Activity(name=name, parent_id=parent_id)
     session.add(activity)
+    await session.flush()
+    await add_activity_paths(activity.id, parent_id, session)
+    await session.commit()
+    tree_add_activities([(activity.id, name, parent_id, activity.version)])
+    await invalidate("activities")
+    return activity
+
+
+class RowErrors:
+    """Ошибки пакета по номерам строк: пакет проверяется целиком до первой вставки"""
+
+    def __init__(self):
+        self.errors: dict[int, list[str]] = {}
+
+    def add(self, index: int, message: str):
+        self.errors.setdefault(index, []).append(message)
+
+    def raise_if_any(self):
+        if self.errors:
+            raise BulkValidationError([
+                {"index": index, "errors": messages} for index, messages in sorted(self.errors.items())
+            ])
+
+
+def int_array(values):
+    return literal(list(values), ARRAY(Integer))
+
+
+def check_building(errors: RowErrors, index: int, building: BuildingCreate, prefix: str = ""):
+    if not building.address or len(building.address) > 255:
+        errors.add(index, f"{prefix}address must be 1..255 characters")
+    if not -90 <= building.latitude <= 90:
+        errors.add(index, f"{prefix}latitude must be within [-90, 90]")
+    if not -180 <= building.longitude <= 180:
+        errors.add(index, f"{prefix}longitude must be within [-180, 180]")
+
+
+async def insert_buildings(buildings: list[BuildingCreate], session: AsyncSession) -> list[int]:
+    """Многострочный INSERT ... RETURNING id; id возвращаются в порядке buildings"""
+    if not buildings:
+        return []
+    result = await session.scalars(
+        insert(Building).returning(Building.id, sort_by_parameter_order=True),
+        [building.model_dump() for building in buildings],
+    )
+    return list(result)
+
+
+async def buildings_created(buildings: list[BuildingCreate], ids: list[int]):
+    """Индекс и кеш после commit"""
+    rows = [(building_id, b.latitude, b.longitude) for building_id, b in zip(ids, buildings)]
+    index_buildings(rows)
+    tile_buildings(rows)
+    await invalidate(
+        "buildings", "geo:*",
+        *(f"building:{building_id}" for building_id in ids),
+        *(geo_tag(b.latitude, b.longitude) for b in buildings),
+    )
+
+
+async def create_buildings_bulk_handler(buildings: list[BuildingCreate], session: AsyncSession):
+    errors = RowErrors()
+    for index, building in enumerate(buildings):
+        check_building(errors, index, building)
+    errors.raise_if_any()
+
+    ids = await insert_buildings(buildings, session)
+    await session.commit()
+    await buildings_created(buildings, ids)
+    return [{"id": building_id, **building.model_dump()} for building_id, building in zip(ids, buildings)]
+
+
+async def create_activities_bulk_handler(activities: list[ActivityBulkCreate], session: AsyncSession):
+    """Деятельности пакетом; parent_ref ссылается на ref другой строки пакета.
+
+    Строки вставляются по уровням дерева: уровень — один INSERT ... RETURNING,
+    после которого известны id родителей следующего уровня.
+    """
+    errors = RowErrors()
+    by_ref: dict[str, int] = {}
+    names: dict[str, int] = {}
+    for index, activity in enumerate(activities):
+        if not activity.name or len(activity.name) > 200:
+            errors.add(index, "name must be 1..200 characters")
+        if activity.name in names:
+            errors.add(index, f"duplicate name in batch (row {names[activity.name]})")
+        names.setdefault(activity.name, index)
+        if activity.ref is not None:
+            if activity.ref in by_ref:
+                errors.add(index, f"duplicate ref in batch (row {by_ref[activity.ref]})")
+            by_ref.setdefault(activity.ref, index)
+        if activity.parent_id is not None and activity.parent_ref is not None:
+            errors.add(index, "parent_id and parent_ref are mutually exclusive")
+
+    existing_names = set(await session.scalars(
+        select(Activity.name).where(Activity.name == any_(literal(list(names), ARRAY(Activity.name.type))))
+    ))
+    parent_ids = {a.parent_id for a in activities if a.parent_id is not None}
+    existing_parents = set(await session.scalars(
+        select(Activity.id).where(Activity.id == any_(int_array(parent_ids)))
+    )) if parent_ids else set()
+
+    for index, activity in enumerate(activities):
+        if activity.name in existing_names:
+            errors.add(index, "activity with this name already exists")
+        if activity.parent_id is not None and activity.parent_id not in existing_parents:
+            errors.add(index, f"parent_id {activity.parent_id} not found")
+        if activity.parent_ref is not None and activity.parent_ref not in by_ref:
+            errors.add(index, f"parent_ref {activity.parent_ref!r} not found in batch")
+
+    # Уровень строки внутри пакета: строки, так и не получившие уровень, замкнуты в цикл
+    depth = {index: 0 for index, activity in enumerate(activities) if activity.parent_ref is None}
+    pending = [index for index, activity in enumerate(activities) if activity.parent_ref in by_ref]
+    while pending:
+        placed = [index for index in pending if by_ref[activities[index].parent_ref] in depth]
+        if not placed:
+            break
+        for index in placed:
+            depth[index] = depth[by_ref[activities[index].parent_ref]] + 1
+        pending = [index for index in pending if index not in depth]
+    for index in pending:
+        errors.add(index, "parent_ref forms a cycle")
+    errors.raise_if_any()
+
+    ids: dict[int, int] = {}
+    for level in range(max(depth.values(), default=-1) + 1):
+        rows = [index for index, row_depth in depth.items() if row_depth == level]
+        parents = [
+            ids[by_ref[activities[index].parent_ref]] if activities[index].parent_ref is not None
+            else activities[index].parent_id
+            for index in rows
+        ]
+        result = await session.scalars(
+            insert(Activity).returning(Activity.id, sort_by_parameter_order=True),
+            [{"name": activities[index].name, "parent_id": parent_id} for index, parent_id in zip(rows, parents)],
+        )
+        level_ids = list(result)
+        ids.update(zip(rows, level_ids))
+        await add_activity_paths_many(list(zip(level_ids, parents)), session)
+    await session.commit()
+
+    result = []
+    for index, activity in enumerate(activities):
+        parent_id = ids[by_ref[activity.parent_ref]] if activity.parent_ref is not None else activity.parent_id
+        result.append({"id": ids[index], "name": activity.name, "parent_id": parent_id, "ref": activity.ref})
+    # Новые строки получили версию 1 (server_default); id родителей меньше id детей
+    tree_add_activities(sorted((row["id"], row["name"], row["parent_id"], 1) for row in result))
+    await invalidate("activities")
+    return result
+
+
+def check_phones(errors: RowErrors, index: int, phones: list[str]):
+    for phone in phones:
+        if not phone or len(phone) > 50:
+            errors.add(index, f"phone {phone!r} must be 1..50 characters")
+
+
+async def create_phones_bulk_handler(organization_id: int, phones: list[str], session: AsyncSession):
+    if await session.scalar(select(Organization.id).where(Organization.id == organization_id)) is None:
+        raise NotFoundedError()
+    errors = RowErrors()
+    for index, phone in enumerate(phones):
+        check_phones(errors, index, [phone])
+    errors.raise_if_any()
+
+    result = await session.scalars(
+        insert(OrganizationPhone).returning(OrganizationPhone.id, sort_by_parameter_order=True),
+        [{"organization_id": organization_id, "phone": phone} for phone in phones],
+    )
+    ids = list(result)
+    await bump_organization_version(organization_id, session)
+    await session.commit()
+    await invalidate(f"org:{organization_id}")
+    return [{"id": phone_id, "phone": phone} for phone_id, phone in zip(ids, phones)]
+
+
+async def create_organizations_bulk_handler(organizations: list[OrganizationCreate], session: AsyncSession):
+    """Организации пакетом: новые здания, организации, телефоны и связи с деятельностями — по одному запросу на таблицу"""
+    errors = RowErrors()
+    for index, org in enumerate(organizations):
+        if not org.name or len(org.name) > 255:
+            errors.add(index, "name must be 1..255 characters")
+        if (org.building_id is None) == (org.building is None):
+            errors.add(index, "exactly one of building_id and building is required")
+        if org.building is not None:
+            check_building(errors, index, org.building, "building.")
+        check_phones(errors, index, org.phones)
+        if len(set(org.activity_ids)) != len(org.activity_ids):
+            errors.add(index, "duplicate activity_ids")
+
+    building_ids = {org.building_id for org in organizations if org.building_id is not None}
+    existing_buildings = {
+        row.id: (row.latitude, row.longitude)
+        for row in await session.execute(
+            select(Building.id, Building.latitude, Building.longitude).where(Building.id == any_(int_array(building_ids)))
+        )
+    } if building_ids else {}
+    activity_ids = {activity_id for org in organizations for activity_id in org.activity_ids}
+    existing_activities = set(await session.scalars(
+        select(Activity.id).where(Activity.id == any_(int_array(activity_ids)))
+    )) if activity_ids else set()
+    names = [org.name for org in organizations]
+    taken = set((await session.execute(
+        select(Organization.name, Organization.building_id).where(
+            Organization.building_id == any_(int_array(building_ids)),
+            Organization.name == any_(literal(names, ARRAY(Organization.name.type))),
+        )
+    )).all()) if building_ids else set()
+
+    seen: dict[tuple[str, int], int] = {}
+    for index, org in enumerate(organizations):
+        if org.building_id is not None:
+            if org.building_id not in existing_buildings:
+                errors.add(index, f"building_id {org.building_id} not found")
+            key = (org.name, org.building_id)
+            if key in taken:
+                errors.add(index, "organization with this name already exists in the building")
+            if key in seen:
+                errors.add(index, f"duplicate name and building_id in batch (row {seen[key]})")
+            seen.setdefault(key, index)
+        for activity_id in org.activity_ids:
+            if activity_id not in existing_activities:
+                errors.add(index, f"activity_id {activity_id} not found")
+    errors.raise_if_any()
+
+    new_buildings = [org.building for org in organizations if org.building is not None]
+    new_building_ids = await insert_buildings(new_buildings, session)
+    next_new_building = iter(new_building_ids)
+    org_building_ids = [
+        org.building_id if org.building_id is not None else next(next_new_building)
+        for org in organizations
+    ]
+    result = await session.scalars(
+        insert(Organization).returning(Organization.id, sort_by_parameter_order=True),
+        [{"name": org.name, "building_id": building_id} for org, building_id in zip(organizations, org_building_ids)],
+    )
+    ids = list(result)
+    phones = [
+        {"organization_id": org_id, "phone": phone}
+        for org_id, org in zip(ids, organizations) for phone in org.phones
+    ]
+    if phones:
+        await session.execute(insert(OrganizationPhone), phones)
+    links = [
+        {"organization_id": org_id, "activity_id": activity_id}
+        for org_id, org in zip(ids, organizations) for activity_id in org.activity_ids
+    ]
+    if links:
+        await session.execute(insert(org_activity), links)
+    building_counts = await count_new_organizations(ids, session)
     await session.commit()
-    return activity
\ No newline at end of file
+
+    if new_buildings:
+        await buildings_created(new_buildings, new_building_ids)
+    tile_organizations(building_counts)
+    # Новые организации появляются в списках, выборках по зданию и по области
+    await invalidate(
+        "organizations", "geo:*",
+        *(f"building:{building_id}" for building_id in set(org_building_ids)),
+        *(geo_tag(*existing_buildings[org.building_id]) for org in organizations if org.building_id is not None),
+    )
+    return [
+        {"id": org_id, "name": org.name, "building_id": building_id}
+        for org_id, org, building_id in zip(ids, organizations, org_building_ids)
+    ]
@@ -1,13 +1,22 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import OrganizationPhone, Building, Activity
-from sqlalchemy import select
+from sqlalchemy import select, update
+from db.activity_tree import tree_remove_activity
+from db.closure import remove_activity_paths
+from db.counts import recount_activities, strict_ancestor_ids
+from db.spatial import unindex_building
+from db.tiles import untile_building
+from db.versions import bump_organization_version
+from utils.cache import geo_tag, invalidate
 
 async def delete_phone_handler(organization_id: int, phone_id: int, session: AsyncSession):
     phone = await session.execute(select(OrganizationPhone).where(OrganizationPhone.id == phone_id, OrganizationPhone.organization_id == organization_id))
-    phone.scalar_one_or_none()
+    phone = phone.scalar_one_or_none()
     if phone:
         await session.delete(phone)
+        await bump_organization_version(organization_id, session)
         await session.commit()
+        await invalidate(f"org:{organization_id}")
         return phone
     else:
         return None
@@ -19,6 +28,9 @@ async def delete_building_handler(building_id: int, session: AsyncSession):
     if building:
         await session.delete(building)
         await session.commit()
+        unindex_building(building_id)
+        untile_building(building_id)
+        await invalidate("buildings", f"building:{building_id}", geo_tag(building.latitude, building.longitude), "geo:*")
         return building
     else:
         return None
@@ -28,8 +40,22 @@ async def delete_activity_handler(activity_id: int, session: AsyncSession):
     activity = await session.execute(select(Activity).where(Activity.id == activity_id))
     activity = activity.scalar_one_or_none()
     if activity:
+        # Вместе с деятельностью исчезают её связи: у предков организаций может стать меньше
+        ancestors = await strict_ancestor_ids(activity_id, session)
+        await remove_activity_paths(activity_id, session)
+        # Детей отвязываем сами, а не через ON DELETE SET NULL: у них меняется parent_id,
+        # значит и версия — иначе GET /activities/{id} отдал бы 304 со старым родителем
+        await session.execute(
+            update(Activity).where(Activity.parent_id == activity_id)
+            .values(parent_id=None, version=Activity.version + 1)
+            .execution_options(synchronize_session=False)
+        )
         await session.delete(activity)
+        await session.flush()
+        await recount_activities(ancestors, session)
         await session.commit()
+        tree_remove_activity(activity_id, activity.version)
+        await invalidate("activities")
         return activity
     else:
         return None
\ No newline at end of file
@@ -1,141 +1,485 @@
+"""
+Обработчики чтения
+
+Горячие запросы собираются один раз на форму (стратегия загрузки, есть ли курсор)
+в функциях *_statement под functools.cache, а значения передаются через bindparam
+при execute. Готовая конструкция помнит свой ключ кеша SQLAlchemy, поэтому вызов
+не тратит время ни на сборку select(...).options(...), ни на обход дерева для ключа
+(замер: python -m bench.compile). Запросы для потоковой выдачи выполняются один раз
+на поток и собираются как обычно.
+"""
+import functools
 import math
+
+import numpy as np
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_
-from sqlalchemy.orm import joinedload, aliased
-from db.models import Activity, Building, org_activity, Organization, OrganizationPhone
+from sqlalchemy import Float, Integer, String, and_, any_, bindparam, exists, func, literal, or_, select
+from sqlalchemy.dialects.postgresql import ARRAY, aggregate_order_by
+from db.models import (Activity, Building, activity_closure, activity_counts_version, activity_organization_counts,
+building_organization_counts, org_activity, Organization, OrganizationPhone)
+from db.activity_tree import ensure_activity_tree
+from db.batching import BatchLoader
+from db.pagination import after_cursor, decode_cursor, encode_cursor, keyset_params, keyset_statement, split_page, page
+from db.handler.loader import fetch_organizations, loader_for, organizations_statement, stream_organizations
+from db.projection import entity_projection, entity_rows
+from db.spatial import EARTH_RADIUS_KM, ensure_building_index, haversine_many, normalize_lon
+from db.tiles import ensure_tile_index
+from exception.request import InvalidCursorError, InvalidQueryError
+from utils.cache import cached, geo_tags, organization_tags, radius_geo_tags
+from config import NEAREST_MAX_CANDIDATES, PAGE_SIZE, STREAM_BATCH_SIZE
+
+
+def serialize_building(building: Building):
+    return {
+        "id": building.id,
+        "address": building.address,
+        "latitude": building.latitude,
+        "longitude": building.longitude,
+    }
 
 
-def serialize_organization(org: Organization):
+def serialize_activity(activity: Activity):
     return {
-        "id": org.id,
-        "name": org.name,
-        "building": {
-            "id": org.building.id,
-            "address": org.building.address,
-            "latitude": org.building.latitude,
-            "longitude": org.building.longitude,
-        } if org.building else None,
-        "phones": [p.phone for p in org.phones],
-        "activities": [a.name for a in org.activities],
+        "id": activity.id,
+        "name": activity.name,
+        "parent_id": activity.parent_id,
     }
 
 
-async def get_organizations_handler(session: AsyncSession):
-    result = await session.execute(
-        select(Organization)
-        .options(
-            joinedload(Organization.building),
-            joinedload(Organization.phones),
-            joinedload(Organization.activities),
-        )
+def organizations_in_activity_tree(anchor):
+    # Поддерево корневой деятельности (anchor + parent_id IS NULL) через таблицу замыкания
+    return Organization.id.in_(
+        select(org_activity.c.organization_id)
+        .join(activity_closure, org_activity.c.activity_id == activity_closure.c.descendant_id)
+        .join(Activity, Activity.id == activity_closure.c.ancestor_id)
+        .where(anchor, Activity.parent_id == None)
     )
-    return [serialize_organization(org) for org in result.unique().scalars().all()]
 
 
-async def get_organization_by_id_handler(organization_id: int, session: AsyncSession):
-    result = await session.execute(
-        select(Organization)
-        .where(Organization.id == organization_id)
-        .options(
-            joinedload(Organization.building),
-            joinedload(Organization.phones),
-            joinedload(Organization.activities),
-        )
+def organizations_in_activity_subtree(activity_id: int):
+    # Любая деятельность (не только корневая) и все её потомки
+    return Organization.id.in_(
+        select(org_activity.c.organization_id)
+        .join(activity_closure, org_activity.c.activity_id == activity_closure.c.descendant_id)
+        .where(activity_closure.c.ancestor_id == activity_id)
     )
-    org = result.unique().scalars().one_or_none()
-    return serialize_organization(org) if org else None
 
 
-async def search_organizations_handler(name: str, session: AsyncSession):
-    result = await session.execute(
-        select(Organization)
-        .where(Organization.name.ilike(f"%{name}%"))
-        .options(
-            joinedload(Organization.building),
-            joinedload(Organization.phones),
-            joinedload(Organization.activities),
-        )
+def organizations_query():
+    return select(Organization)
+
+
+def like_escape(value: str) -> str:
+    return value.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def contains_pattern(name: str) -> str:
+    # Шаблон собирается в Python: с константным шаблоном планировщик использует GIN-индекс pg_trgm
+    return f"%{like_escape(name)}%"
+
+
+def name_contains(name):
+    # name — строка или bindparam("pattern") с уже готовым contains_pattern
+    pattern = contains_pattern(name) if isinstance(name, str) else name
+    return Organization.name.ilike(pattern, escape="/")
+
+
+def search_rank(name: str):
+    # Насколько хорошо запрос совпадает с каким-либо фрагментом названия (0..1)
+    return func.word_similarity(name, Organization.name)
+
+
+def search_query(name: str):
+    return select(Organization).where(name_contains(name))
+
+
+def by_building_query(building_id: int):
+    return select(Organization).where(Organization.building_id == building_id)
+
+
+def by_activity_query(activity_id: int):
+    # Для некорневой деятельности дерево пустое
+    return select(Organization).where(organizations_in_activity_tree(Activity.id == activity_id))
+
+
+def by_activity_tree_query(activity_name: str):
+    return select(Organization).where(organizations_in_activity_tree(Activity.name == activity_name))
+
+
+def organizations_in_buildings(building_ids: list[int] | None = None):
+    # Один параметр-массив вместо IN со списком: число зданий может быть любым.
+    # Без значения — для собранных заранее запросов, building_ids передаётся в execute
+    return Organization.building_id == any_(bindparam("building_ids", building_ids, type_=ARRAY(Integer)))
+
+
+# Запросы страниц организаций; значения фильтров — bindparam с именами параметров обработчиков
+PAGE_QUERIES = {
+    "list": organizations_query,
+    "by_building": lambda: by_building_query(bindparam("building_id")),
+    "by_activity": lambda: by_activity_query(bindparam("activity_id")),
+    "by_activity_tree": lambda: by_activity_tree_query(bindparam("activity_name")),
+}
+
+
+def area_buildings(*conditions):
+    """Организации в зданиях-кандидатах из индекса, которые проходят точную проверку по координатам из БД"""
+    return Organization.building_id.in_(
+        select(Building.id).where(Building.id == any_(bindparam("building_ids", type_=ARRAY(Integer))), *conditions)
     )
-    return [serialize_organization(org) for org in result.unique().scalars().all()]
 
 
-async def get_organizations_by_building_id_handler(building_id: int, session: AsyncSession):
-    result = await session.execute(
-        select(Organization)
-        .where(Organization.building_id == building_id)
-        .options(
-            joinedload(Organization.building),
-            joinedload(Organization.phones),
-            joinedload(Organization.activities),
-        )
+def building_distance_km(lat, lon):
+    # Гаверсинус по координатам здания, как haversine_many
+    a = (
+        func.power(func.sin(func.radians(Building.latitude - lat) * 0.5), 2)
+        + func.cos(func.radians(lat)) * func.cos(func.radians(Building.latitude))
+        * func.power(func.sin(func.radians(Building.longitude - lon) * 0.5), 2)
     )
-    return [serialize_organization(org) for org in result.scalars().all()]
+    return 2 * EARTH_RADIUS_KM * func.asin(func.least(func.sqrt(a), 1.0))
 
 
+def phone_contains(pattern):
+    # Сравниваются только цифры: «8-843-100» и «8 (843) 100» — один номер
+    return exists().where(
+        OrganizationPhone.organization_id == Organization.id,
+        func.regexp_replace(OrganizationPhone.phone, "[^0-9]", "", "g").like(pattern),
+    )
 
-async def get_organizations_by_activity_id_handler(activity_id: int, session: AsyncSession):
-    result = await session.execute(
-        select(Activity).where(Activity.id == activity_id, Activity.parent_id == None)
+
+def latitude_between():
+    return Building.latitude.between(bindparam("min_lat", type_=Float), bindparam("max_lat", type_=Float))
+
+
+# Фильтры /organizations/query; значения — bindparam с ключами params из query_organizations_handler
+QUERY_FILTERS = {
+    "building": lambda: Organization.building_id == bindparam("building_id"),
+    "radius": lambda: area_buildings(
+        building_distance_km(bindparam("lat", type_=Float), bindparam("lon", type_=Float)) <= bindparam("radius", type_=Float)
+    ),
+    "bbox": lambda: area_buildings(
+        latitude_between(), Building.longitude.between(bindparam("min_lon", type_=Float), bindparam("max_lon", type_=Float))
+    ),
+    # Через антимеридиан: min_lon > max_lon
+    "bbox_wrap": lambda: area_buildings(
+        latitude_between(),
+        or_(Building.longitude >= bindparam("min_lon", type_=Float), Building.longitude <= bindparam("max_lon", type_=Float)),
+    ),
+    # Диапазон долгот не меньше 360°
+    "bbox_lat": lambda: area_buildings(latitude_between()),
+    "phone": lambda: phone_contains(bindparam("phone_pattern")),
+    "name": lambda: name_contains(bindparam("pattern")),
+    "activity": lambda: organizations_in_activity_subtree(bindparam("activity_id")),
+}
+
+
+def query_conditions(filters: tuple[str, ...]):
+    return [QUERY_FILTERS[name]() for name in filters]
+
+
+@functools.cache
+def query_statement(filters: tuple[str, ...], loader: str, after: bool, fields: tuple[str, ...] | None = None):
+    query = select(Organization).where(*query_conditions(filters))
+    return organizations_statement(keyset_statement(query, Organization.id, after), loader, fields)
+
+
+@functools.cache
+def query_count_statement(filters: tuple[str, ...]):
+    return select(func.count()).select_from(Organization).where(*query_conditions(filters))
+
+
+@functools.cache
+def organizations_page_statement(name: str, loader: str, after: bool, fields: tuple[str, ...] | None = None):
+    return organizations_statement(keyset_statement(PAGE_QUERIES[name](), Organization.id, after), loader, fields)
+
+
+@functools.cache
+def organizations_by_ids_statement(loader: str, fields: tuple[str, ...] | None = None):
+    return organizations_statement(
+        select(Organization).where(Organization.id == any_(bindparam("ids", type_=ARRAY(Integer)))), loader, fields
     )
-    root_activity = result.unique().scalars().one_or_none()
-    if not root_activity:
-        return []
-
-    # Рекурсивное CTE для всех потомков
-    activity_cte = select(Activity.id).where(Activity.id == root_activity.id).cte(name="activity_tree", recursive=True)
-    activity_cte = activity_cte.union_all(
-        select(Activity.id).where(Activity.parent_id == activity_cte.c.id)
+
+
+@functools.cache
+def organization_points_statement(in_activity_subtree: bool):
+    """(org_id, lat, lon) организаций в зданиях building_ids, при необходимости — в поддереве activity_id"""
+    q = (
+        select(Organization.id, Building.latitude, Building.longitude)
+        .join(Building, Organization.building_id == Building.id)
+        .where(organizations_in_buildings())
     )
+    if in_activity_subtree:
+        q = q.where(organizations_in_activity_subtree(bindparam("activity_id")))
+    return q
 
-    orgs_query = (
-        select(Organization)
-        .join(org_activity, Organization.id == org_activity.c.organization_id)
-        .join(activity_cte, org_activity.c.activity_id == activity_cte.c.id)
-        .options(
-            joinedload(Organization.building),
-            joinedload(Organization.phones),
-            joinedload(Organization.activities),
-        )
+
+@functools.cache
+def activity_buildings_statement():
+    """Здания, где есть организации из поддерева activity_id"""
+    return (
+        select(Organization.building_id)
+        .where(organizations_in_activity_subtree(bindparam("activity_id")))
         .distinct()
     )
 
-    result = await session.execute(orgs_query)
-    organizations = result.scalars().all()
-    return [serialize_organization(org) for org in organizations]
 
+async def bbox_area(session: AsyncSession, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> tuple[str, np.ndarray, dict]:
+    """Прямоугольная область: (имя в QUERY_FILTERS, здания-кандидаты из индекса, параметры).
 
-async def get_organizations_by_activity_tree_handler(activity_name: str, session: AsyncSession):
-    result = await session.execute(
-        select(Activity).where(Activity.name == activity_name, Activity.parent_id == None)
+    Индекс только сужает набор зданий; точная проверка — в SQL по координатам
+    из БД (индекс другого воркера мог отстать на SPATIAL_INDEX_TTL) и до LIMIT,
+    поэтому страницы не короче limit.
+    """
+    index = await ensure_building_index(session)
+    building_ids = index.within_bbox(min_lat, max_lat, min_lon, max_lon)
+    params = {"min_lat": min_lat, "max_lat": max_lat, "building_ids": building_ids.tolist()}
+    if max_lon - min_lon >= 360.0:
+        return "bbox_lat", building_ids, params
+    min_lon, max_lon = normalize_lon(min_lon), normalize_lon(max_lon)
+    return "bbox" if min_lon <= max_lon else "bbox_wrap", building_ids, {**params, "min_lon": min_lon, "max_lon": max_lon}
+
+
+async def nearby_query(session: AsyncSession, min_lat: float = None, max_lat: float = None, min_lon: float = None, max_lon: float = None):
+    """Запрос для потоковой выдачи /nearby: организации в прямоугольнике или все, если он не указан
+    (радиус обрабатывает nearby_by_distance)"""
+    if None in (min_lat, max_lat, min_lon, max_lon):
+        return select(Organization)
+    area_filter, _, params = await bbox_area(session, min_lat, max_lat, min_lon, max_lon)
+    return select(Organization).where(*query_conditions((area_filter,))).params(**params)
+
+
+async def nearby_by_distance(session: AsyncSession, lat: float, lon: float, radius: float, max_results: int | None = None):
+    """id организаций в радиусе и расстояния до них, по возрастанию (расстояние, id).
+
+    Индекс отдаёт здания-кандидаты, затем лёгкая проекция (org_id, lat, lon) из БД
+    проверяется одним векторным проходом — полные организации ещё не загружаются.
+    """
+    index = await ensure_building_index(session)
+    building_ids, _ = index.within_radius(lat, lon, radius)
+    if not len(building_ids):
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+
+    result = await session.execute(organization_points_statement(False), {"building_ids": building_ids.tolist()})
+    rows = np.array(result.all(), dtype=np.float64).reshape(-1, 3)
+    ids = rows[:, 0].astype(np.int64)
+    # Координаты из БД, а не из индекса: индекс другого воркера мог отстать на SPATIAL_INDEX_TTL
+    distances = haversine_many(lat, lon, rows[:, 1], rows[:, 2])
+    mask = distances <= radius
+    ids, distances = ids[mask], distances[mask]
+    order = np.lexsort((ids, distances))
+    ids, distances = ids[order], distances[order]
+    if max_results is not None:
+        ids, distances = ids[:max_results], distances[:max_results]
+    return ids, distances
+
+
+def distance_page(ids: np.ndarray, distances: np.ndarray, limit: int, cursor: str | None):
+    """Keyset по (расстояние, id) поверх уже отсортированных массивов"""
+    start = 0
+    if cursor is not None:
+        last_distance, last_id = decode_cursor(cursor, 2)
+        if not isinstance(last_distance, (int, float)) or not isinstance(last_id, int):
+            raise InvalidCursorError()
+        after = (distances > last_distance) | ((distances == last_distance) & (ids > last_id))
+        start = int(np.argmax(after)) if after.any() else len(ids)
+    end = min(start + limit, len(ids))
+    next_cursor = encode_cursor(float(distances[end - 1]), int(ids[end - 1])) if end < len(ids) else None
+    return ids[start:end], distances[start:end], next_cursor
+
+
+async def load_organizations_by_ids(ids: list[int], session: AsyncSession, loader: str = "joined", fields: tuple[str, ...] | None = None) -> list[dict]:
+    """Организации в порядке ids (отсутствующие пропускаются): полные или только fields"""
+    statement = organizations_by_ids_statement(loader, fields)
+    organizations = await fetch_organizations(statement, session, loader, {"ids": ids}, fields)
+    by_id = {org["id"]: org for org in organizations}
+    return [by_id[organization_id] for organization_id in ids if organization_id in by_id]
+
+
+async def organizations_by_id(ids: list[int], session: AsyncSession) -> dict[int, dict]:
+    return {org["id"]: org for org in await load_organizations_by_ids(ids, session, loader_for("by_id"))}
+
+
+# Одиночные GET /organizations/{id} из параллельных запросов — одним запросом
+organization_batches = BatchLoader(organizations_by_id)
+
+
+async def load_organizations_with_distance(ids: np.ndarray, distances: np.ndarray, session: AsyncSession, fields: tuple[str, ...] | None = None):
+    organizations = await load_organizations_by_ids(ids.tolist(), session, loader_for("nearby"), fields)
+    distance_by_id = dict(zip(ids.tolist(), distances.tolist()))
+    return [{**org, "distance_km": round(distance_by_id[org["id"]], 3)} for org in organizations]
+
+
+def organizations_page_tags(result, **params):
+    return organization_tags(result["items"]) | {"organizations"}
+
+
+def nearby_tags(result, lat, lon, radius=None, min_lat=None, max_lat=None, min_lon=None, max_lon=None, **params):
+    # Состав выдачи зависит от зданий в области: их перенос или удаление меняет гео-теги клеток
+    tags = organizations_page_tags(result)
+    if None not in (min_lat, max_lat, min_lon, max_lon):
+        return tags | geo_tags(min_lat, max_lat, min_lon, max_lon)
+    if radius is not None:
+        return tags | radius_geo_tags(lat, lon, radius)
+    return tags
+
+
+def nearest_tags(result, lat, lon, k, activity_id=None, **params):
+    tags = organizations_page_tags(result)
+    if activity_id is not None:
+        tags.add("activities")
+    # Пока набраны все k, ответ может измениться только из-за зданий ближе самого дальнего
+    if len(result["items"]) < k:
+        return tags | {"geo:*"}
+    return tags | radius_geo_tags(lat, lon, result["items"][-1]["distance_km"] + 0.001)
+
+
+async def fetch_organizations_page(
+    name: str,
+    params: dict,
+    limit: int,
+    cursor: str | None,
+    session: AsyncSession,
+    loader: str = "joined",
+    fields: tuple[str, ...] | None = None,
+):
+    """Страница запроса PAGE_QUERIES[name] с параметрами params"""
+    params = keyset_params(limit, cursor, **params)
+    statement = organizations_page_statement(name, loader, "after" in params, fields)
+    organizations = await fetch_organizations(statement, session, loader, params, fields)
+    organizations, next_cursor = split_page(organizations, limit, lambda org: org["id"])
+    return page(organizations, next_cursor)
+
+
+async def fetch_filtered_page(
+    filters: tuple[str, ...],
+    params: dict,
+    limit: int,
+    cursor: str | None,
+    session: AsyncSession,
+    loader: str = "joined",
+    fields: tuple[str, ...] | None = None,
+):
+    """Страница организаций под фильтрами QUERY_FILTERS (в порядке filters) с параметрами params"""
+    page_params = keyset_params(limit, cursor, **params)
+    statement = query_statement(filters, loader, "after" in page_params, fields)
+    organizations = await fetch_organizations(statement, session, loader, page_params, fields)
+    organizations, next_cursor = split_page(organizations, limit, lambda org: org["id"])
+    return page(organizations, next_cursor)
+
+
+async def stream_organizations_handler(query, handler: str, session: AsyncSession, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    query = after_cursor(query, Organization.id, cursor).order_by(Organization.id)
+    async for organizations in stream_organizations(query, session, loader_for(handler), STREAM_BATCH_SIZE, fields):
+        yield organizations
+
+
+@cached("organizations", organizations_page_tags)
+async def get_organizations_handler(session: AsyncSession, limit: int = PAGE_SIZE, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    return await fetch_organizations_page("list", {}, limit, cursor, session, loader_for("list"), fields)
+
+
+@functools.cache
+def organization_version_statement():
+    activity_versions = (
+        select(func.string_agg(
+            func.concat(Activity.id, ":", Activity.version), aggregate_order_by(literal(","), Activity.id)
+        ))
+        .join(org_activity, org_activity.c.activity_id == Activity.id)
+        .where(org_activity.c.organization_id == Organization.id)
+        .correlate(Organization)
+        .scalar_subquery()
     )
-    root_activity = result.unique().scalars().one_or_none()
-    if not root_activity:
-        return []
-
-    # Рекурсивное CTE
-    activity_cte = select(Activity.id).where(Activity.id == root_activity.id).cte(name="activity_tree", recursive=True)
-    activity_cte = activity_cte.union_all(
-        select(Activity.id).where(Activity.parent_id == activity_cte.c.id)
+    return (
+        select(Organization.version, Building.version, activity_versions)
+        .join(Building, Organization.building_id == Building.id)
+        .where(Organization.id == bindparam("organization_id"))
     )
 
-    orgs_query = (
-        select(Organization)
-        .join(org_activity, Organization.id == org_activity.c.organization_id)
-        .join(activity_cte, org_activity.c.activity_id == activity_cte.c.id)
-        .options(
-            joinedload(Organization.building),
-            joinedload(Organization.phones),
-            joinedload(Organization.activities),
-        )
-        .distinct()
+
+async def get_organization_version_handler(organization_id: int, session: AsyncSession):
+    """Версия ответа по организации без загрузки её самой: версии организации,
+    здания и деятельностей (имена деятельностей входят в ответ). None — организации нет.
+    """
+    result = await session.execute(organization_version_statement(), {"organization_id": organization_id})
+    row = result.one_or_none()
+    return ":".join(str(value) for value in row) if row else None
+
+
+@cached("organization", lambda result, organization_id, **params: organization_tags([result] if result else []) | {f"org:{organization_id}"})
+async def get_organization_by_id_handler(organization_id: int, session: AsyncSession, version: str | None = None):
+    # version (из get_organization_version_handler) входит в ключ кеша: тело всегда соответствует выданному ETag.
+    # Соединение возвращаем в пул до ожидания пакета (db/batching.py)
+    await session.close()
+    return await organization_batches.load(organization_id, session)
+
+
+async def get_organizations_batch_handler(ids: list[int], session: AsyncSession, fields: tuple[str, ...] | None = None):
+    """Организации по списку id одним запросом, в порядке ids; отсутствующие пропускаются.
+
+    Без кеша ответов: наборы id у клиентов почти не повторяются.
+    """
+    return await load_organizations_by_ids(ids, session, loader_for("batch"), fields)
+
+
+@functools.cache
+def search_statement(after: bool):
+    rank = search_rank(bindparam("name", type_=String))
+    q = select(Organization.id, rank).where(name_contains(bindparam("pattern")))
+    if after:
+        last_rank, last_id = bindparam("last_rank", type_=Float), bindparam("last_id", type_=Integer)
+        q = q.where(or_(rank < last_rank, and_(rank == last_rank, Organization.id > last_id)))
+    return q.order_by(rank.desc(), Organization.id).limit(bindparam("limit"))
+
+
+@cached("search", organizations_page_tags)
+async def search_organizations_handler(name: str, session: AsyncSession, limit: int = PAGE_SIZE, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    """Совпадения по подстроке, по убыванию релевантности; курсор — (rank, id)"""
+    params = {"name": name, "pattern": contains_pattern(name), "limit": limit + 1}
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor, 2)
+        if not isinstance(last_rank, (int, float)) or not isinstance(last_id, int):
+            raise InvalidCursorError()
+        params.update(last_rank=last_rank, last_id=last_id)
+    result = await session.execute(search_statement(cursor is not None), params)
+    ranked, next_cursor = split_page(result.all(), limit, lambda row: (float(row[1]), row[0]))
+    organizations = await load_organizations_by_ids([row[0] for row in ranked], session, loader_for("search"), fields)
+    return page(organizations, next_cursor)
+
+
+@functools.cache
+def autocomplete_statement():
+    return (
+        select(Organization.id, Organization.name)
+        .where(Organization.name.ilike(bindparam("pattern"), escape="/"))
+        .order_by(func.similarity(bindparam("q", type_=String), Organization.name).desc(), Organization.id)
+        .limit(bindparam("limit"))
     )
 
-    result = await session.execute(orgs_query)
-    organizations = result.unique().scalars().all()
-    return [serialize_organization(org) for org in organizations]
 
+@cached("autocomplete", lambda result, **params: {"organizations"} | {f"org:{org['id']}" for org in result})
+async def autocomplete_organizations_handler(q: str, session: AsyncSession, limit: int = 10):
+    """Только (id, name) для подсказок: названия, начинающиеся с q, короткие и похожие выше"""
+    result = await session.execute(
+        autocomplete_statement(), {"pattern": f"{like_escape(q)}%", "q": q, "limit": limit}
+    )
+    return [{"id": row.id, "name": row.name} for row in result.all()]
+
+
+@cached("by_building", lambda result, building_id, **params: organizations_page_tags(result) | {f"building:{building_id}"})
+async def get_organizations_by_building_id_handler(building_id: int, session: AsyncSession, limit: int = PAGE_SIZE, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    return await fetch_organizations_page("by_building", {"building_id": building_id}, limit, cursor, session, loader_for("by_building"), fields)
+
+
+@cached("by_activity", lambda result, **params: organizations_page_tags(result) | {"activities"})
+async def get_organizations_by_activity_id_handler(activity_id: int, session: AsyncSession, limit: int = PAGE_SIZE, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    return await fetch_organizations_page("by_activity", {"activity_id": activity_id}, limit, cursor, session, loader_for("by_activity"), fields)
 
 
+@cached("by_activity_tree", lambda result, **params: organizations_page_tags(result) | {"activities"})
+async def get_organizations_by_activity_tree_handler(activity_name: str, session: AsyncSession, limit: int = PAGE_SIZE, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    return await fetch_organizations_page("by_activity_tree", {"activity_name": activity_name}, limit, cursor, session, loader_for("by_activity_tree"), fields)
+
+
+@cached("nearby", nearby_tags)
 async def get_organizations_nearby_handler(
     lat: float,
     lon: float,
@@ -145,97 +489,379 @@ async def get_organizations_nearby_handler(
     max_lat: float = None,
     min_lon: float = None,
     max_lon: float = None,
+    limit: int = PAGE_SIZE,
+    cursor: str | None = None,
+    max_results: int | None = None,
+    fields: tuple[str, ...] | None = None,
 ):
-    q = select(Organization).join(Building, Organization.building_id == Building.id).options(
-        joinedload(Organization.building),
-        joinedload(Organization.phones),
-        joinedload(Organization.activities),
-    )
+    if radius is not None and None in (min_lat, max_lat, min_lon, max_lon):
+        ids, distances = await nearby_by_distance(session, lat, lon, radius, max_results)
+        ids, distances, next_cursor = distance_page(ids, distances, limit, cursor)
+        return page(await load_organizations_with_distance(ids, distances, session, fields), next_cursor)
 
-    # Прямоугольная область
-    if None not in (min_lat, max_lat, min_lon, max_lon):
-        q = q.where(
-            and_(
-                Building.latitude >= min_lat,
-                Building.latitude <= max_lat,
-                Building.longitude >= min_lon,
-                Building.longitude <= max_lon,
-            )
-        )
-        result = await session.execute(q)
-        organizations = result.unique().scalars().all()
-        return [serialize_organization(org) for org in organizations]
-
-    # Радиус
-    elif radius is not None:
-        earth_radius_km = 6371.0
-        delta_deg_lat = radius / 111.0
-        delta_deg_lon = radius / (111.320 * math.cos(math.radians(lat)))
-        bbox_min_lat = lat - delta_deg_lat
-        bbox_max_lat = lat + delta_deg_lat
-        bbox_min_lon = lon - delta_deg_lon
-        bbox_max_lon = lon + delta_deg_lon
-
-        q = q.where(
-            and_(
-                Building.latitude >= bbox_min_lat,
-                Building.latitude <= bbox_max_lat,
-                Building.longitude >= bbox_min_lon,
-                Building.longitude <= bbox_max_lon,
-            )
-        )
-        result = await session.execute(q)
-        candidates = result.unique().scalars().all()
-
-        def haversine(lat1, lon1, lat2, lon2):
-            R = 6371.0
-            phi1 = math.radians(lat1)
-            phi2 = math.radians(lat2)
-            d_phi = math.radians(lat2 - lat1)
-            d_lambda = math.radians(lon2 - lon1)
-            a = (
-                math.sin(d_phi / 2) ** 2
-                + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    if None in (min_lat, max_lat, min_lon, max_lon):
+        # Все организации, если прямоугольник не указан
+        return await fetch_organizations_page("list", {}, limit, cursor, session, loader_for("nearby"), fields)
+    area_filter, building_ids, params = await bbox_area(session, min_lat, max_lat, min_lon, max_lon)
+    if not len(building_ids):
+        return page([], None)
+    return await fetch_filtered_page((area_filter,), params, limit, cursor, session, loader_for("nearby"), fields)
+
+
+async def stream_organizations_nearby_handler(
+    lat: float,
+    lon: float,
+    session: AsyncSession,
+    radius: float = None,
+    min_lat: float = None,
+    max_lat: float = None,
+    min_lon: float = None,
+    max_lon: float = None,
+    cursor: str | None = None,
+    max_results: int | None = None,
+    fields: tuple[str, ...] | None = None,
+):
+    if radius is not None and None in (min_lat, max_lat, min_lon, max_lon):
+        ids, distances = await nearby_by_distance(session, lat, lon, radius, max_results)
+        ids, distances, _ = distance_page(ids, distances, len(ids), cursor)
+        for start in range(0, len(ids), STREAM_BATCH_SIZE):
+            yield await load_organizations_with_distance(
+                ids[start:start + STREAM_BATCH_SIZE], distances[start:start + STREAM_BATCH_SIZE], session, fields
             )
-            c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-            return R * c
+        return
 
-        organizations = [
-            org for org in candidates
-            if haversine(lat, lon, org.building.latitude, org.building.longitude) <= radius
-        ]
-        return [serialize_organization(org) for org in organizations]
+    q = await nearby_query(session, min_lat, max_lat, min_lon, max_lon)
+    async for organizations in stream_organizations_handler(q, "nearby", session, cursor, fields):
+        yield organizations
 
-    # Все организации, если не указано ни радиус, ни прямоугольник
+
+@cached("nearest", nearest_tags)
+async def get_nearest_organizations_handler(
+    lat: float,
+    lon: float,
+    k: int,
+    session: AsyncSession,
+    activity_id: int | None = None,
+    fields: tuple[str, ...] | None = None,
+):
+    """k ближайших организаций (меньше — если их всего меньше или исчерпан NEAREST_MAX_CANDIDATES).
+
+    Здания идут из индекса кольцами по неубыванию расстояния, по одному запросу на
+    кольцо; после каждого кольца уже найденные организации не дальше любых ещё не
+    просмотренных, поэтому останавливаемся, как только набрали k. С activity_id
+    кольца сначала сужаются до зданий с организациями из поддерева (один запрос),
+    и редкая деятельность не тянет в запросы все здания подряд.
+
+    Всего в запросы уходит не больше NEAREST_MAX_CANDIDATES зданий: последнее кольцо
+    обрезается по расстоянию, и ответ — точные ближайшие в пределах просмотренного.
+    """
+    index = await ensure_building_index(session)
+    only = None
+    if activity_id is not None:
+        result = await session.scalars(activity_buildings_statement(), {"activity_id": activity_id})
+        only = np.fromiter(result, dtype=np.int64)
+        if not len(only):
+            return page([], None)
+    found = []
+    budget = NEAREST_MAX_CANDIDATES
+    for building_ids, _ in index.nearest(lat, lon, only):
+        building_ids = building_ids[:budget]
+        budget -= len(building_ids)
+        params = {"building_ids": building_ids.tolist()}
+        if activity_id is not None:
+            params["activity_id"] = activity_id
+        found.extend((await session.execute(organization_points_statement(activity_id is not None), params)).all())
+        if len(found) >= k or budget <= 0:
+            break
+    if not found:
+        return page([], None)
+
+    rows = np.array(found, dtype=np.float64).reshape(-1, 3)
+    ids = rows[:, 0].astype(np.int64)
+    distances = haversine_many(lat, lon, rows[:, 1], rows[:, 2])
+    order = np.lexsort((ids, distances))[:k]
+    return page(await load_organizations_with_distance(ids[order], distances[order], session, fields), None)
+
+
+async def query_area(
+    session: AsyncSession,
+    lat: float | None,
+    lon: float | None,
+    radius: float | None,
+    min_lat: float | None,
+    max_lat: float | None,
+    min_lon: float | None,
+    max_lon: float | None,
+) -> tuple[str, np.ndarray, dict] | None:
+    """Фильтр области: (имя в QUERY_FILTERS, здания-кандидаты из индекса, параметры) или None без области"""
+    bbox = (min_lat, max_lat, min_lon, max_lon)
+    if radius is not None:
+        if lat is None or lon is None:
+            raise InvalidQueryError("radius requires lat and lon")
+        if any(value is not None for value in bbox):
+            raise InvalidQueryError("radius and bbox cannot be combined")
+        index = await ensure_building_index(session)
+        building_ids, _ = index.within_radius(lat, lon, radius)
+        return "radius", building_ids, {"lat": lat, "lon": lon, "radius": radius, "building_ids": building_ids.tolist()}
+    if any(value is not None for value in bbox):
+        if None in bbox:
+            raise InvalidQueryError("bbox requires min_lat, max_lat, min_lon and max_lon")
+        return await bbox_area(session, min_lat, max_lat, min_lon, max_lon)
+    if lat is not None or lon is not None:
+        raise InvalidQueryError("lat and lon require radius")
+    return None
+
+
+async def query_organizations_handler(
+    session: AsyncSession,
+    name: str | None = None,
+    activity_id: int | None = None,
+    building_id: int | None = None,
+    phone: str | None = None,
+    lat: float | None = None,
+    lon: float | None = None,
+    radius: float | None = None,
+    min_lat: float | None = None,
+    max_lat: float | None = None,
+    min_lon: float | None = None,
+    max_lon: float | None = None,
+    limit: int = PAGE_SIZE,
+    cursor: str | None = None,
+    total: bool = False,
+    fields: tuple[str, ...] | None = None,
+):
+    """Страница организаций под всеми заданными фильтрами сразу — одним запросом.
+
+    Условия идут в WHERE от самого избирательного: здание, затем область (по числу
+    зданий-кандидатов из индекса), затем телефон, название и поддерево деятельности,
+    для которых оценки нет. Порядок и набор фильтров — ключ кеша собранных запросов.
+    Пустая область или здание вне её дают пустую страницу без запроса к БД.
+
+    Без кеша ответов: сочетаний фильтров слишком много, чтобы повторы окупали кеш,
+    а телефоны при изменении инвалидируют только org:{id}.
+    """
+    # (оценка числа зданий, фильтр); sorted устойчив — фильтры без оценки сохраняют порядок добавления
+    ranked: list[tuple[float, str]] = []
+    params = {}
+    if building_id is not None:
+        ranked.append((1, "building"))
+        params["building_id"] = building_id
+    area = await query_area(session, lat, lon, radius, min_lat, max_lat, min_lon, max_lon)
+    if area is not None:
+        area_filter, building_ids, area_params = area
+        if not len(building_ids) or (building_id is not None and building_id not in set(building_ids.tolist())):
+            result = page([], None)
+            if total:
+                result["total"] = 0
+            return result
+        ranked.append((len(building_ids), area_filter))
+        params.update(area_params)
+    if phone is not None:
+        digits = "".join(char for char in phone if char.isdigit())
+        if not digits:
+            raise InvalidQueryError("phone must contain digits")
+        ranked.append((math.inf, "phone"))
+        params["phone_pattern"] = f"%{digits}%"
+    if name is not None:
+        ranked.append((math.inf, "name"))
+        params["pattern"] = contains_pattern(name)
+    if activity_id is not None:
+        ranked.append((math.inf, "activity"))
+        params["activity_id"] = activity_id
+    filters = tuple(filter_name for _, filter_name in sorted(ranked, key=lambda item: item[0]))
+
+    result = await fetch_filtered_page(filters, params, limit, cursor, session, loader_for("query"), fields)
+    if total:
+        # Первая и последняя страница сразу: считать нечего
+        if cursor is None and result["next_cursor"] is None:
+            result["total"] = len(result["items"])
+        else:
+            result["total"] = await session.scalar(query_count_statement(filters), params)
+    return result
+
+
+async def get_tile_handler(z: int, x: int, y: int, session: AsyncSession):
+    """Тайл карты из агрегатов db.tiles: запрос к БД — только при (пере)загрузке"""
+    index = await ensure_tile_index(session)
+    return index.tile(z, x, y)
+
+
+@functools.cache
+def phones_statement():
+    return select(OrganizationPhone).where(OrganizationPhone.organization_id == bindparam("organization_id"))
+
+
+@cached("phones", lambda result, organization_id, **params: {f"org:{organization_id}"})
+async def get_phones_by_organization_handler(organization_id: int, session: AsyncSession, version: str | None = None):
+    result = await session.execute(phones_statement(), {"organization_id": organization_id})
+    return [p.phone for p in result.unique().scalars().all()]
+
+
+@functools.cache
+def page_statement(model, after: bool, fields: tuple[str, ...] | None = None):
+    """Keyset-страница зданий или деятельностей: сущности целиком или только колонки fields"""
+    query = select(model) if fields is None else entity_projection(model, fields)
+    return keyset_statement(query, model.id, after)
+
+
+async def fetch_entity_page(model, serialize, limit: int, cursor: str | None, session: AsyncSession, fields: tuple[str, ...] | None = None):
+    params = keyset_params(limit, cursor)
+    result = await session.execute(page_statement(model, "after" in params, fields), params)
+    if fields is None:
+        items = [serialize(entity) for entity in result.scalars().all()]
+    else:
+        items = entity_rows(result.all(), fields)
+    items, next_cursor = split_page(items, limit, lambda item: item["id"])
+    return page(items, next_cursor)
+
+
+async def stream_entities(model, serialize, session: AsyncSession, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    query = select(model) if fields is None else entity_projection(model, fields)
+    query = after_cursor(query, model.id, cursor).order_by(model.id)
+    result = await session.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+    if fields is None:
+        async for entities in result.scalars().partitions():
+            yield [serialize(entity) for entity in entities]
     else:
-        result = await session.execute(q)
-        organizations = result.unique().scalars().all()
-        return [serialize_organization(org) for org in organizations]
+        async for rows in result.partitions():
+            yield entity_rows(rows, fields)
 
 
+@functools.cache
+def by_id_statement(model, version_only: bool = False):
+    return select(model.version if version_only else model).where(model.id == bindparam("id"))
 
-async def get_phones_by_organization_handler(organization_id: int, session: AsyncSession):
-    result = await session.execute(
-        select(OrganizationPhone).where(OrganizationPhone.organization_id == organization_id)
+
+@functools.cache
+def by_ids_statement(model, fields: tuple[str, ...] | None = None):
+    query = select(model) if fields is None else entity_projection(model, fields)
+    return query.where(model.id == any_(bindparam("ids", type_=ARRAY(Integer))))
+
+
+async def load_entities_by_ids(model, serialize, ids: list[int], session: AsyncSession, fields: tuple[str, ...] | None = None) -> list[dict]:
+    """Здания или деятельности в порядке ids (отсутствующие пропускаются): целиком или только fields"""
+    result = await session.execute(by_ids_statement(model, fields), {"ids": ids})
+    if fields is None:
+        items = [serialize(entity) for entity in result.scalars().all()]
+    else:
+        items = entity_rows(result.all(), fields)
+    by_id = {item["id"]: item for item in items}
+    return [by_id[entity_id] for entity_id in ids if entity_id in by_id]
+
+
+def entities_by_id(model, serialize):
+    async def fetch(ids: list[int], session: AsyncSession) -> dict[int, dict]:
+        return {item["id"]: item for item in await load_entities_by_ids(model, serialize, ids, session)}
+    return fetch
+
+
+building_batches = BatchLoader(entities_by_id(Building, serialize_building))
+activity_batches = BatchLoader(entities_by_id(Activity, serialize_activity))
+
+
+@cached("buildings", lambda result, **params: {"buildings"} | {f"building:{building['id']}" for building in result["items"]})
+async def get_buildings_handler(session: AsyncSession, limit: int = PAGE_SIZE, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    return await fetch_entity_page(Building, serialize_building, limit, cursor, session, fields)
+
+
+async def stream_buildings_handler(session: AsyncSession, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    async for buildings in stream_entities(Building, serialize_building, session, cursor, fields):
+        yield buildings
+
+
+async def get_building_version_handler(building_id: int, session: AsyncSession):
+    return await session.scalar(by_id_statement(Building, version_only=True), {"id": building_id})
+
+
+@cached("building", lambda result, building_id, **params: {f"building:{building_id}"})
+async def get_building_by_id_handler(building_id: int, session: AsyncSession, version: int | None = None):
+    await session.close()
+    return await building_batches.load(building_id, session)
+
+
+async def get_buildings_batch_handler(ids: list[int], session: AsyncSession, fields: tuple[str, ...] | None = None):
+    return await load_entities_by_ids(Building, serialize_building, ids, session, fields)
+
+
+@functools.cache
+def activities_version_statement():
+    return select(func.count(), func.coalesce(func.sum(Activity.version), 0), func.max(Activity.id))
+
+
+async def get_activities_version_handler(session: AsyncSession):
+    """Отпечаток всей таблицы деятельностей.
+
+    id только растут, версии только растут, поэтому (count, sum(version), max(id))
+    меняется при любом создании, изменении или удалении.
+    """
+    result = await session.execute(activities_version_statement())
+    return ":".join(str(value) for value in result.one())
+
+
+@cached("activities", lambda result, **params: {"activities"})
+async def get_activities_handler(session: AsyncSession, limit: int = PAGE_SIZE, cursor: str | None = None, version: str | None = None, fields: tuple[str, ...] | None = None):
+    return await fetch_entity_page(Activity, serialize_activity, limit, cursor, session, fields)
+
+
+async def stream_activities_handler(session: AsyncSession, cursor: str | None = None, fields: tuple[str, ...] | None = None):
+    async for activities in stream_entities(Activity, serialize_activity, session, cursor, fields):
+        yield activities
+
+
+@functools.cache
+def activity_counts_version_statement():
+    return select(activity_counts_version.c.version)
+
+
+async def get_activity_counts_version_handler(session: AsyncSession):
+    """Отпечаток счётчиков организаций по деятельностям: версия из activity_counts_version,
+    которую триггеры увеличивают при каждом изменении счётчиков (и никогда не уменьшают)"""
+    return str(await session.scalar(activity_counts_version_statement()))
+
+
+async def get_activity_tree_handler(
+    session: AsyncSession,
+    version: str,
+    root_id: int | None = None,
+    max_depth: int | None = None,
+    counts_version: str | None = None,
+):
+    """Вложенное дерево из db.activity_tree; version — отпечаток get_activities_version_handler,
+    counts_version — get_activity_counts_version_handler, если нужны числа организаций"""
+    tree = await ensure_activity_tree(session, version, counts_version)
+    return tree.render(root_id, max_depth, counts_version is not None)
+
+
+@functools.cache
+def organization_count_statement(model, counts):
+    """Готовый счётчик сущности; None — сущности нет, ноль — строки счётчика ещё нет"""
+    key = counts.c.activity_id if model is Activity else counts.c.building_id
+    return (
+        select(func.coalesce(counts.c.organizations, 0))
+        .select_from(model)
+        .outerjoin(counts, key == model.id)
+        .where(model.id == bindparam("id"))
     )
-    return [p.phone for p in result.unique().scalars().all()]
 
 
-async def get_buildings_handler(session: AsyncSession):
-    result = await session.execute(select(Building))
-    return result.unique().scalars().all()
+async def count_organizations_by_activity_handler(activity_id: int, session: AsyncSession) -> int | None:
+    """Различные организации в поддереве деятельности — любой, не только корневой"""
+    return await session.scalar(organization_count_statement(Activity, activity_organization_counts), {"id": activity_id})
+
+
+async def count_organizations_by_building_handler(building_id: int, session: AsyncSession) -> int | None:
+    return await session.scalar(organization_count_statement(Building, building_organization_counts), {"id": building_id})
 
 
-async def get_building_by_id_handler(building_id: int, session: AsyncSession):
-    result = await session.execute(select(Building).where(Building.id == building_id))
-    return result.unique().scalars().one_or_none()
+async def get_activity_version_handler(activity_id: int, session: AsyncSession):
+    return await session.scalar(by_id_statement(Activity, version_only=True), {"id": activity_id})
 
 
-async def get_activities_handler(session: AsyncSession):
-    result = await session.execute(select(Activity))
-    return result.unique().scalars().all()
+@cached("activity", lambda result, activity_id, **params: {"activities"})
+async def get_activity_by_id_handler(activity_id: int, session: AsyncSession, version: int | None = None):
+    await session.close()
+    return await activity_batches.load(activity_id, session)
 
 
-async def get_activity_by_id_handler(activity_id: int, session: AsyncSession):
-    result = await session.execute(select(Activity).where(Activity.id == activity_id))
-    return result.unique().scalars().one_or_none()
+async def get_activities_batch_handler(ids: list[int], session: AsyncSession, fields: tuple[str, ...] | None = None):
+    return await load_entities_by_ids(Activity, serialize_activity, ids, session, fields)
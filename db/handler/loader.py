@@ -0,0 +1,143 @@
+"""
+Стратегии загрузки организаций в форме serialize_organization
+
+joined   — joinedload всех связей (исходный вариант, декартово произведение phones × activities);
+selectin — joinedload здания и отдельные пакетные запросы для телефонов и деятельностей;
+json     — объект целиком собирается в Postgres через json_build_object/json_agg,
+           одна строка на организацию, без гидратации ORM.
+
+С fields= (db/projection.py) стратегия не участвует: выбираются только нужные колонки.
+"""
+from sqlalchemy import JSON, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+
+from config import ORG_LOADER, ORG_LOADERS
+from db.models import Building, Organization
+from db.projection import activities_json, organization_projection, organization_rows, phones_json
+
+LOADERS = ("joined", "selectin", "json")
+
+for _loader in (ORG_LOADER, *ORG_LOADERS.values()):
+    if _loader not in LOADERS:
+        raise ValueError(f"Unknown organization loader: {_loader}")
+
+
+def loader_for(handler: str) -> str:
+    """Стратегия загрузки для обработчика с учётом ORG_LOADERS"""
+    return ORG_LOADERS.get(handler, ORG_LOADER)
+
+
+def serialize_organization(org: Organization):
+    return {
+        "id": org.id,
+        "name": org.name,
+        "building": {
+            "id": org.building.id,
+            "address": org.building.address,
+            "latitude": org.building.latitude,
+            "longitude": org.building.longitude,
+        } if org.building else None,
+        "phones": [p.phone for p in org.phones],
+        "activities": [a.name for a in org.activities],
+    }
+
+
+def organization_options(loader: str = "joined"):
+    if loader == "selectin":
+        return (
+            joinedload(Organization.building),
+            selectinload(Organization.phones),
+            selectinload(Organization.activities),
+        )
+    return (
+        joinedload(Organization.building),
+        joinedload(Organization.phones),
+        joinedload(Organization.activities),
+    )
+
+
+def organization_json():
+    """json_build_object с той же структурой, что и serialize_organization"""
+    building = (
+        select(func.json_build_object(
+            "id", Building.id,
+            "address", Building.address,
+            "latitude", Building.latitude,
+            "longitude", Building.longitude,
+        ))
+        .where(Building.id == Organization.building_id)
+        .correlate(Organization)
+        .scalar_subquery()
+    )
+    return func.json_build_object(
+        "id", Organization.id,
+        "name", Organization.name,
+        "building", building,
+        "phones", phones_json(),
+        "activities", activities_json(),
+        type_=JSON,
+    )
+
+
+def organizations_statement(query, loader: str = "joined", fields: tuple[str, ...] | None = None):
+    """select(Organization)... в форме выбранной стратегии загрузки или проекции fields.
+
+    Сборка (особенно json) заметно дороже выполнения по кешу SQLAlchemy, поэтому
+    горячие обработчики вызывают её один раз на форму запроса (см. db/handler/get.py).
+    """
+    if fields is not None:
+        return organization_projection(query, fields)
+    if loader == "json":
+        return query.with_only_columns(organization_json(), maintain_column_froms=True)
+    return query.options(*organization_options(loader))
+
+
+async def fetch_organizations(
+    statement,
+    session: AsyncSession,
+    loader: str = "joined",
+    params: dict | None = None,
+    fields: tuple[str, ...] | None = None,
+) -> list[dict]:
+    """Выполнить готовый organizations_statement и вернуть сериализованные организации в порядке запроса"""
+    result = await session.execute(statement, params)
+    if fields is not None:
+        return organization_rows(result.all(), fields)
+    if loader == "json":
+        return list(result.scalars().all())
+    return [serialize_organization(org) for org in result.unique().scalars().all()]
+
+
+async def load_organizations(query, session: AsyncSession, loader: str = "joined") -> list[dict]:
+    """Выполнить select(Organization)... и вернуть сериализованные организации в порядке запроса"""
+    return await fetch_organizations(organizations_statement(query, loader), session, loader)
+
+
+async def stream_organizations(
+    query,
+    session: AsyncSession,
+    loader: str = "joined",
+    batch_size: int = 500,
+    fields: tuple[str, ...] | None = None,
+):
+    """Читать организации серверным курсором и отдавать их пачками по batch_size.
+
+    joinedload коллекций несовместим с yield_per, поэтому ORM-вариант в потоке
+    всегда использует selectin.
+    """
+    if fields is not None:
+        result = await session.stream(organization_projection(query, fields).execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield organization_rows(partition, fields)
+        return
+
+    if loader == "json":
+        result = await session.stream(organizations_statement(query, "json").execution_options(yield_per=batch_size))
+        async for partition in result.scalars().partitions():
+            yield partition
+        return
+
+    result = await session.stream(organizations_statement(query, "selectin").execution_options(yield_per=batch_size))
+    async for partition in result.scalars().partitions():
+        yield [serialize_organization(org) for org in partition]
@@ -1,15 +1,26 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from db.models import Building, Activity
 from sqlalchemy import select
+from db.activity_tree import tree_update_activity
+from db.closure import move_activity_paths
+from db.counts import recount_activities, strict_ancestor_ids
+from db.spatial import index_building
+from db.tiles import tile_buildings
+from utils.cache import geo_tag, invalidate
 
 async def update_building_handler(building_id: int, address: str, latitude: float, longitude: float, session: AsyncSession):
     building = await session.execute(select(Building).where(Building.id == building_id))
     building = building.scalar_one_or_none()
     if building:
+        # Здание могло уйти из одной области и появиться в другой: сбрасываем обе
+        old_geo_tag = geo_tag(building.latitude, building.longitude)
         building.address = address
         building.latitude = latitude
         building.longitude = longitude
         await session.commit()
+        index_building(building)
+        tile_buildings([(building_id, latitude, longitude)])
+        await invalidate(f"building:{building_id}", old_geo_tag, geo_tag(latitude, longitude), "geo:*")
         return building
 
 
@@ -17,9 +28,17 @@ async def update_activity_handler(activity_id: int, name: str, parent_id: int |
     activity = await session.execute(select(Activity).where(Activity.id == activity_id))
     activity = activity.scalar_one_or_none()
     if activity:
+        old_version = activity.version
+        if activity.parent_id != parent_id:
+            # Поддерево уходит от старых предков к новым: пересчитываются и те, и другие
+            old_ancestors = await strict_ancestor_ids(activity_id, session)
+            await move_activity_paths(activity_id, parent_id, session)
+            await recount_activities(old_ancestors + await strict_ancestor_ids(activity_id, session), session)
         activity.name = name
         activity.parent_id = parent_id
         await session.commit()
+        tree_update_activity(activity_id, activity.name, activity.parent_id, activity.version - old_version)
+        await invalidate("activities")
         return activity
     else:
         return None
\ No newline at end of file
@@ -1,7 +1,7 @@
 from sqlalchemy import (
-    Column, Integer, String, Float, ForeignKey, Table, UniqueConstraint
+    BigInteger, CheckConstraint, Column, Integer, String, Float, ForeignKey, Index, Table, UniqueConstraint
 )
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy.orm import backref, relationship, declarative_base
 
 Base = declarative_base()
 
@@ -10,6 +10,41 @@ org_activity = Table(
     "org_activity", Base.metadata,
     Column("organization_id", Integer, ForeignKey("organizations.id", ondelete="CASCADE"), primary_key=True),
     Column("activity_id", Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Index("ix_org_activity_activity_id", "activity_id"),
+)
+
+# Таблица замыкания дерева деятельностей: все пары предок → потомок (включая саму себя, depth = 0)
+activity_closure = Table(
+    "activity_closure", Base.metadata,
+    Column("ancestor_id", Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("descendant_id", Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("depth", Integer, nullable=False),
+    Index("ix_activity_closure_descendant_id", "descendant_id"),
+)
+
+# Число различных организаций в поддереве деятельности (db/counts.py); version растёт
+# при каждом изменении строки
+activity_organization_counts = Table(
+    "activity_organization_counts", Base.metadata,
+    Column("activity_id", Integer, ForeignKey("activities.id", ondelete="CASCADE"), primary_key=True),
+    Column("organizations", Integer, nullable=False, server_default="0"),
+    Column("version", Integer, nullable=False, server_default="1"),
+)
+
+# Отпечаток счётчиков по деятельностям: единственная строка, version только растёт —
+# её увеличивают триггеры на activity_organization_counts при любом изменении строк
+activity_counts_version = Table(
+    "activity_counts_version", Base.metadata,
+    Column("id", Integer, primary_key=True, server_default="1"),
+    Column("version", BigInteger, nullable=False, server_default="1"),
+    CheckConstraint("id = 1", name="ck_activity_counts_version_single_row"),
+)
+
+# Число организаций в здании (db/counts.py)
+building_organization_counts = Table(
+    "building_organization_counts", Base.metadata,
+    Column("building_id", Integer, ForeignKey("buildings.id", ondelete="CASCADE"), primary_key=True),
+    Column("organizations", Integer, nullable=False, server_default="0"),
 )
 
 class Building(Base):
@@ -19,17 +54,32 @@ class Building(Base):
     address = Column(String(255), nullable=False)
     latitude = Column(Float, nullable=False)
     longitude = Column(Float, nullable=False)
+    version = Column(Integer, nullable=False, server_default="1")
 
     organizations = relationship("Organization", back_populates="building")
 
+    # Поиск здания по адресу и координатам при импорте (import_data.py)
+    __table_args__ = (
+        Index("ix_buildings_address_coords", "address", "latitude", "longitude"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 class Activity(Base):
     __tablename__ = "activities"
 
     id = Column(Integer, primary_key=True)
     name = Column(String(200), nullable=False, unique=True)
     parent_id = Column(Integer, ForeignKey("activities.id", ondelete="SET NULL"), nullable=True)
+    version = Column(Integer, nullable=False, server_default="1")
 
-    parent = relationship("Activity", remote_side=[id], backref="children")
+    # Иерархию отдаёт db.activity_tree; ленивые загрузки по дереву запрещены, а детей
+    # при удалении отвязывает delete_activity_handler одним UPDATE без их загрузки
+    parent = relationship(
+        "Activity", remote_side=[id], lazy="raise",
+        backref=backref("children", lazy="raise", passive_deletes=True),
+    )
+
+    __mapper_args__ = {"version_id_col": version}
 
 class OrganizationPhone(Base):
     __tablename__ = "organization_phones"
@@ -37,6 +87,12 @@ class OrganizationPhone(Base):
     id = Column(Integer, primary_key=True)
     organization_id = Column(Integer, ForeignKey("organizations.id", ondelete="CASCADE"), nullable=False)
     phone = Column(String(50), nullable=False)
+    version = Column(Integer, nullable=False, server_default="1")
+
+    __table_args__ = (
+        Index("ix_organization_phones_organization_id", "organization_id"),
+    )
+    __mapper_args__ = {"version_id_col": version}
 
 class Organization(Base):
     __tablename__ = "organizations"
@@ -44,6 +100,7 @@ class Organization(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(255), nullable=False)
     building_id = Column(Integer, ForeignKey("buildings.id", ondelete="RESTRICT"), nullable=False)
+    version = Column(Integer, nullable=False, server_default="1")
 
     building = relationship("Building", back_populates="organizations")
     phones = relationship("OrganizationPhone", cascade="all, delete-orphan")
@@ -51,4 +108,12 @@ class Organization(Base):
 
     __table_args__ = (
         UniqueConstraint("name", "building_id", name="uix_name_building"),
-    )
\ No newline at end of file
+        Index("ix_organizations_building_id", "building_id"),
+        Index(
+            "ix_organizations_name_trgm", "name",
+            postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+    # Версия увеличивается при каждом UPDATE через ORM; изменения телефонов и
+    # связей поднимают её явно (см. bump_organization_version)
+    __mapper_args__ = {"version_id_col": version}
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Keyset-пагинация списков
+"""
+import base64
+import json
+
+from sqlalchemy import bindparam
+
+from exception.request import InvalidCursorError
+
+
+def encode_cursor(*values) -> str:
+    """Упаковать ключ последней строки страницы в непрозрачный курсор"""
+    raw = json.dumps(list(values), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int = 1) -> list:
+    """Распаковать курсор обратно в значения ключа"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        raise InvalidCursorError()
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursorError()
+    return values
+
+
+def cursor_id(cursor: str | None) -> int | None:
+    """id последней строки предыдущей страницы (None — первая страница)"""
+    if cursor is None:
+        return None
+    (last,) = decode_cursor(cursor)
+    if not isinstance(last, int):
+        raise InvalidCursorError()
+    return last
+
+
+def after_cursor(query, column, cursor: str | None):
+    """Продолжить выборку после строки, на которую указывает курсор"""
+    last = cursor_id(cursor)
+    return query if last is None else query.where(column > last)
+
+
+def keyset_statement(query, column, after: bool):
+    """Страница запроса по возрастанию column; значения — bindparam after и limit.
+    limit на одну строку больше страницы, чтобы понять, есть ли продолжение"""
+    if after:
+        query = query.where(column > bindparam("after"))
+    return query.order_by(column).limit(bindparam("limit"))
+
+
+def keyset_params(limit: int, cursor: str | None, **params) -> dict:
+    last = cursor_id(cursor)
+    if last is not None:
+        params["after"] = last
+    return {**params, "limit": limit + 1}
+
+
+def split_page(rows: list, limit: int, key) -> tuple[list, str | None]:
+    """Отрезать лишнюю строку и построить курсор следующей страницы; key может вернуть кортеж для составного ключа"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = key(rows[-1])
+    return rows, encode_cursor(*last) if isinstance(last, tuple) else encode_cursor(last)
+
+
+def page(items: list, next_cursor: str | None) -> dict:
+    return {"items": items, "next_cursor": next_cursor}
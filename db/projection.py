@@ -0,0 +1,106 @@
+"""
+Разреженные наборы полей (параметр fields=)
+
+Вместо select(Organization) с загрузкой всех связей выбираются только нужные
+колонки, а телефоны и деятельности — коррелированным json_agg, и только если
+запрошены. Строки приходят кортежами и собираются в словари без ORM-гидратации.
+
+id сущности присутствует всегда, а id здания — если запрошено хоть одно его поле:
+на них держатся курсоры и теги кеша (utils.cache.organization_tags).
+"""
+from typing import Iterable
+
+from sqlalchemy import JSON, func, literal_column, select
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from db.models import Activity, Building, Organization, OrganizationPhone, org_activity
+
+BUILDING_FIELDS = ("id", "address", "latitude", "longitude")
+ACTIVITY_FIELDS = ("id", "name", "parent_id")
+ORGANIZATION_FIELDS = ("id", "name", *(f"building.{name}" for name in BUILDING_FIELDS), "phones", "activities")
+
+
+def normalize_fields(requested: Iterable[str], allowed: tuple[str, ...]) -> tuple[str, ...]:
+    """Канонический набор в порядке allowed; "building" раскрывается во все поля здания.
+    Неизвестное поле — ValueError с его именем"""
+    selected = {"id"}
+    for field in requested:
+        if field == "building" and "building.id" in allowed:
+            selected.update(name for name in allowed if name.startswith("building."))
+        elif field in allowed:
+            selected.add(field)
+        else:
+            raise ValueError(field)
+    if any(name.startswith("building.") for name in selected):
+        selected.add("building.id")
+    return tuple(name for name in allowed if name in selected)
+
+
+def phones_json():
+    """Телефоны организации json-массивом, по порядку id (коррелированный подзапрос)"""
+    return (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(OrganizationPhone.phone, OrganizationPhone.id)),
+            literal_column("'[]'::json"),
+            type_=JSON,
+        ))
+        .where(OrganizationPhone.organization_id == Organization.id)
+        .correlate(Organization)
+        .scalar_subquery()
+    )
+
+
+def activities_json():
+    """Названия деятельностей организации json-массивом, по порядку id"""
+    return (
+        select(func.coalesce(
+            func.json_agg(aggregate_order_by(Activity.name, Activity.id)),
+            literal_column("'[]'::json"),
+            type_=JSON,
+        ))
+        .select_from(org_activity.join(Activity, Activity.id == org_activity.c.activity_id))
+        .where(org_activity.c.organization_id == Organization.id)
+        .correlate(Organization)
+        .scalar_subquery()
+    )
+
+
+def entity_projection(model, fields: tuple[str, ...]):
+    return select(*(getattr(model, name) for name in fields))
+
+
+def entity_rows(rows, fields: tuple[str, ...]) -> list[dict]:
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def organization_projection(query, fields: tuple[str, ...]):
+    """Тот же select(Organization)... (фильтры, порядок, limit), но только колонки fields"""
+    columns = []
+    for name in fields:
+        if name.startswith("building."):
+            columns.append(getattr(Building, name.removeprefix("building.")))
+        elif name == "phones":
+            columns.append(phones_json())
+        elif name == "activities":
+            columns.append(activities_json())
+        else:
+            columns.append(getattr(Organization, name))
+    projected = query.with_only_columns(*columns, maintain_column_froms=True)
+    if "building.id" in fields:
+        projected = projected.outerjoin(Building, Building.id == Organization.building_id)
+    return projected
+
+
+def organization_rows(rows, fields: tuple[str, ...]) -> list[dict]:
+    organizations = []
+    for row in rows:
+        org = {}
+        for name, value in zip(fields, row):
+            if name.startswith("building."):
+                org.setdefault("building", {})[name.removeprefix("building.")] = value
+            else:
+                org[name] = value
+        if "building" in org and org["building"]["id"] is None:
+            org["building"] = None
+        organizations.append(org)
+    return organizations
@@ -0,0 +1,309 @@
+"""
+Пространственный индекс зданий в памяти процесса
+
+Точки хранятся как единичные векторы на сфере и раскладываются по кубической
+сетке в 3D. Расстояние по хорде монотонно связано с расстоянием по дуге,
+поэтому радиус-запрос превращается в поиск по шару, а антимеридиан и полюса не
+требуют особых случаев: в 3D у сферы нет швов.
+"""
+import asyncio
+import itertools
+import math
+import time
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import SPATIAL_CELL_KM, SPATIAL_INDEX_TTL
+from db.models import Building
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    R = EARTH_RADIUS_KM
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def normalize_lon(lon: float) -> float:
+    """Привести долготу к [-180, 180)"""
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def lon_in_range(lon: float, min_lon: float, max_lon: float) -> bool:
+    """Попадание в диапазон долгот; min_lon > max_lon означает переход через антимеридиан"""
+    if max_lon - min_lon >= 360.0:
+        return True
+    lon, min_lon, max_lon = normalize_lon(lon), normalize_lon(min_lon), normalize_lon(max_lon)
+    if min_lon <= max_lon:
+        return min_lon <= lon <= max_lon
+    return lon >= min_lon or lon <= max_lon
+
+
+def to_unit_vector(lat: float, lon: float) -> tuple[float, float, float]:
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    cos_phi = math.cos(phi)
+    return cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi)
+
+
+def chord_for_distance(distance_km: float) -> float:
+    """Длина хорды единичной сферы для расстояния по дуге"""
+    angle = min(distance_km / EARTH_RADIUS_KM, math.pi)
+    return 2.0 * math.sin(angle / 2.0)
+
+
+def ring_count(cell_km: float) -> int:
+    """Сколько колец перебирает BuildingIndex.nearest: удвоения радиуса от ячейки до всей сферы"""
+    chord, rings = chord_for_distance(cell_km), 1
+    while chord < 2.0:
+        chord, rings = min(chord * 2.0, 2.0), rings + 1
+    return rings
+
+
+def distance_for_chord(chord: float) -> float:
+    return 2.0 * EARTH_RADIUS_KM * math.asin(min(chord / 2.0, 1.0))
+
+
+def haversine_many(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """haversine от одной точки до массива точек за один векторный проход"""
+    phi1 = math.radians(lat)
+    phi2 = np.radians(lats)
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(lons) - math.radians(lon)
+    a = np.sin(d_phi / 2) ** 2 + math.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def lon_in_range_many(lons: np.ndarray, min_lon: float, max_lon: float) -> np.ndarray:
+    if max_lon - min_lon >= 360.0:
+        return np.ones(len(lons), dtype=bool)
+    lons = (lons + 180.0) % 360.0 - 180.0
+    min_lon, max_lon = normalize_lon(min_lon), normalize_lon(max_lon)
+    if min_lon <= max_lon:
+        return (lons >= min_lon) & (lons <= max_lon)
+    return (lons >= min_lon) | (lons <= max_lon)
+
+
+class _Cell:
+    """Здания одной ячейки: словарь для обновлений и массивы для векторных запросов"""
+    __slots__ = ("rows", "_ids", "_data")
+
+    def __init__(self):
+        self.rows: dict[int, tuple[float, float, float, float, float]] = {}
+        self._ids = None
+        self._data = None
+
+    def changed(self):
+        self._ids = self._data = None
+
+    def arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        """(ids, [[x, y, z, lat, lon], ...]); строятся лениво и живут до изменения ячейки"""
+        if self._ids is None:
+            self._ids = np.fromiter(self.rows.keys(), dtype=np.int64, count=len(self.rows))
+            self._data = np.array(list(self.rows.values()), dtype=np.float64).reshape(-1, 5)
+        return self._ids, self._data
+
+
+class BuildingIndex:
+    """Сетка кубов со стороной cell_km (в единицах хорды) над единичными векторами зданий"""
+
+    def __init__(self, cell_km: float):
+        self.cell = chord_for_distance(cell_km)
+        self.cells: dict[tuple[int, int, int], _Cell] = {}
+        self.points: dict[int, tuple[float, float, tuple[int, int, int]]] = {}
+
+    def __len__(self):
+        return len(self.points)
+
+    def _key(self, vector) -> tuple[int, int, int]:
+        return tuple(math.floor(v / self.cell) for v in vector)
+
+    def add(self, building_id: int, latitude: float, longitude: float):
+        """Добавить здание или перенести его на новые координаты"""
+        self.remove(building_id)
+        vector = to_unit_vector(latitude, longitude)
+        key = self._key(vector)
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = _Cell()
+        cell.rows[building_id] = (*vector, latitude, longitude)
+        cell.changed()
+        self.points[building_id] = (latitude, longitude, key)
+
+    def remove(self, building_id: int):
+        point = self.points.pop(building_id, None)
+        if point is None:
+            return
+        cell = self.cells[point[2]]
+        del cell.rows[building_id]
+        cell.changed()
+        if not cell.rows:
+            del self.cells[point[2]]
+
+    def _cells_near(self, center, chord: float):
+        """Непустые ячейки, пересекающие шар радиуса chord вокруг center.
+
+        Перебираем ключи куба, описанного вокруг шара, пока это дешевле, чем
+        пройти по всем непустым ячейкам; иначе проверяем все ячейки.
+        """
+        bounds = [
+            (math.floor((c - chord) / self.cell), math.floor((c + chord) / self.cell))
+            for c in center
+        ]
+        volume = math.prod(hi - lo + 1 for lo, hi in bounds)
+        if volume <= len(self.cells):
+            for key in itertools.product(*(range(lo, hi + 1) for lo, hi in bounds)):
+                cell = self.cells.get(key)
+                if cell is not None:
+                    yield cell
+            return
+
+        for key, cell in self.cells.items():
+            gap = 0.0
+            for c, k in zip(center, key):
+                lo = k * self.cell
+                d = lo - c if c < lo else c - (lo + self.cell) if c > lo + self.cell else 0.0
+                gap += d * d
+            if gap <= chord * chord:
+                yield cell
+
+    def _gather(self, center, chord: float) -> tuple[np.ndarray, np.ndarray]:
+        parts = [cell.arrays() for cell in self._cells_near(center, chord)]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, 5), dtype=np.float64)
+        return np.concatenate([ids for ids, _ in parts]), np.concatenate([data for _, data in parts])
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> tuple[np.ndarray, np.ndarray]:
+        """(building_ids, distances_km) для зданий не дальше radius_km"""
+        center = to_unit_vector(lat, lon)
+        chord = chord_for_distance(radius_km)
+        ids, data = self._gather(center, chord)
+        d2 = ((data[:, :3] - np.array(center)) ** 2).sum(axis=1)
+        mask = d2 <= chord * chord
+        distances = 2.0 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(d2[mask]) / 2.0, 1.0))
+        return ids[mask], distances
+
+    def nearest(self, lat: float, lon: float, only: np.ndarray | None = None):
+        """Здания в порядке неубывания расстояния, по кольцу за раз: (building_ids, distances_km).
+
+        Радиус поиска удваивается от размера ячейки; каждое кольцо (прошлый радиус,
+        текущий] сортируется целиком, поэтому следующие кольца не ближе уже
+        отданных, и потребитель может остановиться после любого. Пустые кольца
+        пропускаются; всего колец не больше ring_count(SPATIAL_CELL_KM).
+        only — отдавать только эти здания.
+        """
+        center = np.array(to_unit_vector(lat, lon))
+        inner, chord = -1.0, self.cell
+        while True:
+            ids, data = self._gather(center, chord)
+            d = np.sqrt(((data[:, :3] - center) ** 2).sum(axis=1))
+            mask = (d > inner) & (d <= chord)
+            if only is not None:
+                mask &= np.isin(ids, only)
+            ring_ids, ring_d = ids[mask], d[mask]
+            order = np.lexsort((ring_ids, ring_d))
+            ring_ids, ring_d = ring_ids[order], ring_d[order]
+            if len(ring_ids):
+                yield ring_ids, 2.0 * EARTH_RADIUS_KM * np.arcsin(np.minimum(ring_d / 2.0, 1.0))
+            if chord >= 2.0:
+                return
+            inner, chord = chord, min(chord * 2.0, 2.0)
+
+    def within_bbox(self, min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> np.ndarray:
+        """Здания внутри прямоугольника широт/долгот (min_lon > max_lon — через антимеридиан)"""
+        # Кандидаты берём из описанной шапки. Пока полуширина по долготе не больше
+        # 90°, дальняя от центра точка прямоугольника — один из углов; для более
+        # широких прямоугольников берём всю сферу
+        span = (max_lon - min_lon) % 360.0 if max_lon - min_lon < 360.0 else 360.0
+        center_lat = (min_lat + max_lat) / 2.0
+        center_lon = min_lon + span / 2.0
+        if span <= 180.0:
+            radius = max(
+                haversine(center_lat, center_lon, corner_lat, corner_lon)
+                for corner_lat in (min_lat, max_lat)
+                for corner_lon in (min_lon, min_lon + span)
+            )
+        else:
+            radius = math.pi * EARTH_RADIUS_KM
+        center = to_unit_vector(center_lat, center_lon)
+        ids, data = self._gather(center, chord_for_distance(radius * 1.000001 + 1e-6))
+        mask = (
+            (data[:, 3] >= min_lat) & (data[:, 3] <= max_lat)
+            & lon_in_range_many(data[:, 4], min_lon, max_lon)
+        )
+        return ids[mask]
+
+
+building_index = BuildingIndex(SPATIAL_CELL_KM)
+_loaded_at: float | None = None
+# Изменения, пришедшие во время перечитывания: применяются к новому индексу после загрузки
+_pending: list | None = None
+_lock = asyncio.Lock()
+
+
+async def ensure_building_index(session: AsyncSession) -> BuildingIndex:
+    """Загрузить индекс при первом обращении и перечитывать его раз в SPATIAL_INDEX_TTL.
+
+    Собственные записи процесса применяются сразу (см. index_building); периодическое
+    перечитывание подбирает изменения, сделанные другими воркерами.
+    """
+    global building_index, _loaded_at, _pending
+    if _loaded_at is not None and time.monotonic() - _loaded_at < SPATIAL_INDEX_TTL:
+        return building_index
+    async with _lock:
+        if _loaded_at is not None and time.monotonic() - _loaded_at < SPATIAL_INDEX_TTL:
+            return building_index
+        started_at = time.monotonic()
+        index = BuildingIndex(SPATIAL_CELL_KM)
+        _pending = []
+        try:
+            result = await session.stream(
+                select(Building.id, Building.latitude, Building.longitude).execution_options(yield_per=10000)
+            )
+            async for rows in result.partitions():
+                for building_id, latitude, longitude in rows:
+                    index.add(building_id, latitude, longitude)
+            for apply in _pending:
+                apply(index)
+            building_index, _loaded_at = index, started_at
+        finally:
+            _pending = None
+    return building_index
+
+
+def _apply(change):
+    if _pending is not None:
+        _pending.append(change)
+    if _loaded_at is not None:
+        change(building_index)
+
+
+def index_building(building: Building):
+    """Отразить в индексе созданное или изменённое здание (после commit)"""
+    index_buildings([(building.id, building.latitude, building.longitude)])
+
+
+def index_buildings(rows: list[tuple[int, float, float]]):
+    """То же для пачки (id, latitude, longitude)"""
+    rows = list(rows)
+
+    def change(index: BuildingIndex):
+        for building_id, latitude, longitude in rows:
+            index.add(building_id, latitude, longitude)
+
+    _apply(change)
+
+
+def unindex_building(building_id: int):
+    _apply(lambda index: index.remove(building_id))
@@ -0,0 +1,265 @@
+"""
+Кластеры зданий и организаций для тайлов карты (GET /organizations/tiles/{z}/{x}/{y})
+
+Тайлы — Web Mercator в нумерации OSM. Тайл z/x/y делится на 2^TILE_GRID_BITS ячеек
+по стороне, и каждая ячейка — это тайл уровня z + TILE_GRID_BITS. Для всех таких
+уровней до TILE_CLUSTER_MAX_ZOOM + TILE_GRID_BITS хранится словарь
+«ячейка -> [зданий, организаций, сумма широт, сумма долгот]». Добавление, перенос
+или удаление здания меняет по одной ячейке на уровень, а тайл собирается из не более
+чем 4^TILE_GRID_BITS ячеек, сколько бы зданий в нём ни было.
+
+Глубже TILE_CLUSTER_MAX_ZOOM отдаются сами здания: они разложены по ячейкам самого
+мелкого уровня, и тайл перебирает только свои ячейки.
+
+Число организаций здания — из building_organization_counts (db/counts.py). Как и
+пространственный индекс, структура живёт в памяти процесса: свои записи применяются
+сразу, чужие подхватываются перечитыванием раз в SPATIAL_INDEX_TTL.
+"""
+import asyncio
+import math
+import time
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import SPATIAL_INDEX_TTL, TILE_CLUSTER_MAX_ZOOM, TILE_GRID_BITS
+from db.models import Building, building_organization_counts
+
+# Граница проекции Web Mercator: тайлы квадратные только до этой широты
+MAX_LATITUDE = 85.05112878
+
+
+def tile_coords(lat: float, lon: float, zoom: int) -> tuple[int, int]:
+    """Тайл уровня zoom, в который попадает точка"""
+    n = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return min(max(int(x), 0), n - 1), min(max(int(y), 0), n - 1)
+
+
+def tile_coords_many(lats: np.ndarray, lons: np.ndarray, zoom: int) -> tuple[np.ndarray, np.ndarray]:
+    n = 1 << zoom
+    lats = np.clip(lats, -MAX_LATITUDE, MAX_LATITUDE)
+    x = (lons + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(np.radians(lats))) / np.pi) / 2.0 * n
+    return np.clip(x.astype(np.int64), 0, n - 1), np.clip(y.astype(np.int64), 0, n - 1)
+
+
+def cell_key(x: int, y: int) -> int:
+    return x << 32 | y
+
+
+class TileIndex:
+
+    def __init__(self, grid_bits: int, cluster_max_zoom: int):
+        self.grid_bits = grid_bits
+        self.cluster_max_zoom = cluster_max_zoom
+        self.max_level = cluster_max_zoom + grid_bits
+        # Уровень -> ячейка -> [зданий, организаций, сумма широт, сумма долгот]; уровни < grid_bits не нужны
+        self.levels: list[dict[int, list]] = [{} for _ in range(self.max_level + 1)]
+        # id -> (широта, долгота, организаций, ячейка самого мелкого уровня); ячейка запоминается,
+        # чтобы удаление попало ровно туда же, куда добавление
+        self.buildings: dict[int, tuple[float, float, int, int]] = {}
+        # Ячейка самого мелкого уровня -> id зданий в ней
+        self.points: dict[int, set[int]] = {}
+
+    @classmethod
+    def from_arrays(cls, grid_bits: int, cluster_max_zoom: int, ids: np.ndarray, lats: np.ndarray, lons: np.ndarray, organizations: np.ndarray) -> "TileIndex":
+        """Построить все уровни сразу: по уровню — одна группировка numpy вместо цикла по зданиям"""
+        index = cls(grid_bits, cluster_max_zoom)
+        xs, ys = tile_coords_many(lats, lons, index.max_level)
+        finest = xs << 32 | ys
+        for level in range(grid_bits, index.max_level + 1):
+            shift = index.max_level - level
+            keys, inverse, buildings = np.unique(
+                (xs >> shift) << 32 | (ys >> shift), return_inverse=True, return_counts=True,
+            )
+            index.levels[level] = {
+                key: [count, orgs, lat_sum, lon_sum]
+                for key, count, orgs, lat_sum, lon_sum in zip(
+                    keys.tolist(),
+                    buildings.tolist(),
+                    np.bincount(inverse, weights=organizations).astype(np.int64).tolist(),
+                    np.bincount(inverse, weights=lats).tolist(),
+                    np.bincount(inverse, weights=lons).tolist(),
+                )
+            }
+        for key, building_id in zip(finest.tolist(), ids.tolist()):
+            index.points.setdefault(key, set()).add(building_id)
+        index.buildings = dict(zip(
+            ids.tolist(), zip(lats.tolist(), lons.tolist(), organizations.tolist(), finest.tolist()),
+        ))
+        return index
+
+    def _adjust(self, key: int, lat: float, lon: float, buildings: int, organizations: int):
+        # Ячейка крупного уровня — сдвиг ячейки мелкого: floor(v·2^a) = floor(v·2^b) >> (b - a)
+        x, y = key >> 32, key & 0xFFFFFFFF
+        for level in range(self.grid_bits, self.max_level + 1):
+            shift = self.max_level - level
+            key = cell_key(x >> shift, y >> shift)
+            cells = self.levels[level]
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = [0, 0, 0.0, 0.0]
+            cell[0] += buildings
+            cell[1] += organizations
+            cell[2] += lat * buildings
+            cell[3] += lon * buildings
+            if cell[0] <= 0:
+                del cells[key]
+
+    def add(self, building_id: int, lat: float, lon: float, organizations: int | None = None):
+        """Добавить или перенести здание; у перенесённого число организаций сохраняется"""
+        previous = self.remove(building_id)
+        if organizations is None:
+            organizations = previous or 0
+        key = cell_key(*tile_coords(lat, lon, self.max_level))
+        self._adjust(key, lat, lon, 1, organizations)
+        self.buildings[building_id] = (lat, lon, organizations, key)
+        self.points.setdefault(key, set()).add(building_id)
+
+    def remove(self, building_id: int) -> int | None:
+        """Убрать здание; возвращает его число организаций"""
+        building = self.buildings.pop(building_id, None)
+        if building is None:
+            return None
+        lat, lon, organizations, key = building
+        self._adjust(key, lat, lon, -1, -organizations)
+        bucket = self.points.get(key)
+        if bucket is not None:
+            bucket.discard(building_id)
+            if not bucket:
+                del self.points[key]
+        return organizations
+
+    def set_organizations(self, building_id: int, count: int):
+        building = self.buildings.get(building_id)
+        if building is None:
+            return
+        lat, lon, organizations, key = building
+        self._adjust(key, lat, lon, 0, count - organizations)
+        self.buildings[building_id] = (lat, lon, count, key)
+
+    def tile(self, z: int, x: int, y: int) -> dict:
+        """Кластеры тайла, а глубже cluster_max_zoom — здания"""
+        if z <= self.cluster_max_zoom:
+            return {"clusters": self._clusters(z, x, y), "points": []}
+        return {"clusters": [], "points": self._points(z, x, y)}
+
+    def _clusters(self, z: int, x: int, y: int) -> list[dict]:
+        cells = self.levels[z + self.grid_bits]
+        size = 1 << self.grid_bits
+        clusters = []
+        for cx in range(x * size, (x + 1) * size):
+            for cy in range(y * size, (y + 1) * size):
+                cell = cells.get(cell_key(cx, cy))
+                if cell is not None:
+                    buildings, organizations, lat_sum, lon_sum = cell
+                    clusters.append({
+                        "latitude": lat_sum / buildings,
+                        "longitude": lon_sum / buildings,
+                        "buildings": buildings,
+                        "organizations": organizations,
+                    })
+        return clusters
+
+    def _points(self, z: int, x: int, y: int) -> list[dict]:
+        if z <= self.max_level:
+            shift = self.max_level - z
+            keys = [
+                cell_key(cx, cy)
+                for cx in range(x << shift, (x + 1) << shift)
+                for cy in range(y << shift, (y + 1) << shift)
+            ]
+            exact = False
+        else:
+            # Тайл меньше ячейки: берём её целиком и отсекаем здания вне тайла
+            shift = z - self.max_level
+            keys = [cell_key(x >> shift, y >> shift)]
+            exact = True
+        points = []
+        for key in keys:
+            for building_id in sorted(self.points.get(key, ())):
+                lat, lon, organizations, _ = self.buildings[building_id]
+                if exact and tile_coords(lat, lon, z) != (x, y):
+                    continue
+                points.append({"id": building_id, "latitude": lat, "longitude": lon, "organizations": organizations})
+        return points
+
+
+tile_index = TileIndex(TILE_GRID_BITS, TILE_CLUSTER_MAX_ZOOM)
+_loaded_at: float | None = None
+# Изменения, пришедшие во время перечитывания: применяются к новой структуре после загрузки
+_pending: list | None = None
+_lock = asyncio.Lock()
+
+
+async def ensure_tile_index(session: AsyncSession) -> TileIndex:
+    """Загрузить агрегаты при первом обращении и перечитывать их раз в SPATIAL_INDEX_TTL"""
+    global tile_index, _loaded_at, _pending
+    if _loaded_at is not None and time.monotonic() - _loaded_at < SPATIAL_INDEX_TTL:
+        return tile_index
+    async with _lock:
+        if _loaded_at is not None and time.monotonic() - _loaded_at < SPATIAL_INDEX_TTL:
+            return tile_index
+        started_at = time.monotonic()
+        _pending = []
+        try:
+            counts = building_organization_counts.c
+            result = await session.stream(
+                select(Building.id, Building.latitude, Building.longitude, func.coalesce(counts.organizations, 0))
+                .outerjoin(building_organization_counts, counts.building_id == Building.id)
+                .execution_options(yield_per=10000)
+            )
+            rows = [row async for rows in result.partitions() for row in rows]
+            columns = np.array(rows, dtype=np.float64).reshape(-1, 4)
+            # Сборка — доли секунды на сотню тысяч зданий: в потоке, чтобы event loop не вставал
+            index = await asyncio.to_thread(
+                TileIndex.from_arrays, TILE_GRID_BITS, TILE_CLUSTER_MAX_ZOOM,
+                columns[:, 0].astype(np.int64), columns[:, 1], columns[:, 2], columns[:, 3].astype(np.int64),
+            )
+            for apply in _pending:
+                apply(index)
+            tile_index, _loaded_at = index, started_at
+        finally:
+            _pending = None
+    return tile_index
+
+
+def _apply(change):
+    if _pending is not None:
+        _pending.append(change)
+    if _loaded_at is not None:
+        change(tile_index)
+
+
+def tile_buildings(rows: list[tuple[int, float, float]]):
+    """Отразить созданные или перенесённые здания (id, latitude, longitude) после commit"""
+    rows = list(rows)
+
+    def change(index: TileIndex):
+        for building_id, latitude, longitude in rows:
+            index.add(building_id, latitude, longitude)
+
+    _apply(change)
+
+
+def untile_building(building_id: int):
+    _apply(lambda index: index.remove(building_id))
+
+
+def tile_organizations(per_building: dict[int, int]):
+    """Новые организации: building_id -> сколько их в здании после commit.
+
+    Значения абсолютные, а не прибавка: при повторе из _pending поверх
+    перечитанной структуры, которая уже видела эту запись, счёт не удвоится.
+    """
+    per_building = dict(per_building)
+
+    def change(index: TileIndex):
+        for building_id, count in per_building.items():
+            index.set_organizations(building_id, count)
+
+    _apply(change)
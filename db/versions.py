@@ -0,0 +1,21 @@
+"""
+Версии сущностей для ETag
+
+Building, Activity, OrganizationPhone и Organization получают новую версию при
+каждом UPDATE через ORM (version_id_col). Ответ по организации включает её
+телефоны, поэтому их добавление и удаление поднимает версию организации явно.
+"""
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import Organization
+
+
+async def bump_organization_version(organization_id: int, session: AsyncSession):
+    # Атомарный UPDATE в той же транзакции, что и изменение телефона
+    await session.execute(
+        update(Organization)
+        .where(Organization.id == organization_id)
+        .values(version=Organization.version + 1)
+        .execution_options(synchronize_session=False)
+    )
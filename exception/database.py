@@ -1,8 +1,14 @@
 from fastapi import HTTPException
-from starlette.status import HTTP_404_NOT_FOUND
+from starlette.status import HTTP_404_NOT_FOUND, HTTP_409_CONFLICT
 
 
 class NotFoundedError(HTTPException):
     def __init__(self) -> None:
         self.status_code = HTTP_404_NOT_FOUND
-        self.detail = "not found"
\ No newline at end of file
+        self.detail = "not found"
+
+
+class ActivityCycleError(HTTPException):
+    def __init__(self) -> None:
+        self.status_code = HTTP_409_CONFLICT
+        self.detail = "activity cannot be moved under its own descendant"
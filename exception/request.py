@@ -0,0 +1,46 @@
+from fastapi import HTTPException
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_422_UNPROCESSABLE_CONTENT
+
+
+class InvalidCursorError(HTTPException):
+    def __init__(self) -> None:
+        self.status_code = HTTP_400_BAD_REQUEST
+        self.detail = "invalid cursor"
+        self.headers = None
+
+
+class BulkValidationError(HTTPException):
+    """Ошибки пакетной вставки: по одной записи на каждую отклонённую строку"""
+    def __init__(self, errors: list[dict]) -> None:
+        self.status_code = HTTP_422_UNPROCESSABLE_CONTENT
+        self.detail = errors
+        self.headers = None
+
+
+class InvalidFieldsError(HTTPException):
+    def __init__(self, field: str) -> None:
+        self.status_code = HTTP_400_BAD_REQUEST
+        self.detail = f"unknown field: {field}"
+        self.headers = None
+
+
+class InvalidTileError(HTTPException):
+    def __init__(self) -> None:
+        self.status_code = HTTP_400_BAD_REQUEST
+        self.detail = "tile x and y must be in [0, 2^z)"
+        self.headers = None
+
+
+class InvalidQueryError(HTTPException):
+    """Несовместимые или неполные фильтры /organizations/query"""
+    def __init__(self, detail: str) -> None:
+        self.status_code = HTTP_400_BAD_REQUEST
+        self.detail = detail
+        self.headers = None
+
+
+class InvalidIdsError(HTTPException):
+    def __init__(self, detail: str) -> None:
+        self.status_code = HTTP_400_BAD_REQUEST
+        self.detail = detail
+        self.headers = None
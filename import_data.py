@@ -0,0 +1,315 @@
+"""
+Потоковый импорт справочника организаций из CSV или NDJSON
+
+    python import_data.py organizations.ndjson
+    python import_data.py organizations.csv --chunk-size 20000
+    python import_data.py organizations.csv --restart     # начать заново, игнорируя контрольную точку
+
+Одна запись — одна организация:
+
+    NDJSON: {"name": "...", "address": "...", "latitude": 55.75, "longitude": 37.61,
+             "phones": ["8-800-..."], "activities": ["Еда/Мясная продукция"]}
+    CSV:    name,address,latitude,longitude,phones,activities
+            телефоны и деятельности разделяются "|", уровни деятельности — "/"
+
+Файл читается пачками по --chunk-size записей. Пачка копируется через COPY во
+временные таблицы и переносится в основные таблицы несколькими INSERT ... SELECT
+в одной транзакции, поэтому память ограничена размером пачки. Вставки идемпотентны:
+здания, телефоны и связи задаются всеми своими колонками, и существующие пропускаются;
+существующей организации (имя + здание) повышается версия (ON CONFLICT DO UPDATE);
+существующая деятельность остаётся на месте, даже если в файле у неё другой
+родитель — переносы делаются через API. Поэтому после сбоя импорт продолжается
+с контрольной точки — последней закоммиченной пачки — и повтор недоделанной
+пачки ничего не дублирует.
+
+Кеш ответов работающего сервиса сбрасывается только с CACHE_BACKEND=redis:
+кеш в памяти (memory) принадлежит процессу сервиса и импорту недоступен.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+from db.closure import add_activity_paths_many
+from db.counts import recount_activities, recount_buildings
+from db.config import get_database_config
+from utils.cache import geo_tag, invalidate
+
+CSV_FIELDS = ("name", "address", "latitude", "longitude", "phones", "activities")
+
+STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS import_orgs (
+    line bigint PRIMARY KEY,
+    name text NOT NULL,
+    address text NOT NULL,
+    latitude float8 NOT NULL,
+    longitude float8 NOT NULL,
+    building_id integer,
+    organization_id integer
+);
+CREATE TEMP TABLE IF NOT EXISTS import_phones (line bigint NOT NULL, phone text NOT NULL);
+CREATE TEMP TABLE IF NOT EXISTS import_activities (line bigint NOT NULL, path text[] NOT NULL);
+"""
+
+INSERT_BUILDINGS = text("""
+INSERT INTO buildings (address, latitude, longitude)
+SELECT DISTINCT s.address, s.latitude, s.longitude
+FROM import_orgs s
+WHERE NOT EXISTS (
+    SELECT 1 FROM buildings b
+    WHERE b.address = s.address AND b.latitude = s.latitude AND b.longitude = s.longitude
+)
+""")
+
+RESOLVE_BUILDINGS = text("""
+UPDATE import_orgs s SET building_id = b.id
+FROM buildings b
+WHERE b.address = s.address AND b.latitude = s.latitude AND b.longitude = s.longitude
+""")
+
+# Уровень :depth всех путей пачки (элемент массива, не срез); родитель уже вставлен
+# на предыдущем уровне. Существующая деятельность не переносится: перенос меняет
+# замыкание и счётчики и проверяется на циклы — это делает PUT /activities/{id}
+INSERT_ACTIVITIES = text("""
+INSERT INTO activities (name, parent_id)
+SELECT DISTINCT ON (a.path[CAST(:depth AS int)]) a.path[CAST(:depth AS int)], p.id
+FROM import_activities a
+LEFT JOIN activities p ON p.name = a.path[CAST(:depth AS int) - 1]
+WHERE cardinality(a.path) >= CAST(:depth AS int)
+ORDER BY a.path[CAST(:depth AS int)]
+ON CONFLICT (name) DO NOTHING
+RETURNING id, parent_id
+""")
+
+# Имя и здание — весь ключ организации, поэтому обновлять у существующей нечего,
+# кроме версии: телефоны и деятельности входят в ответ по ней, и её ETag должен смениться
+INSERT_ORGANIZATIONS = text("""
+INSERT INTO organizations (name, building_id)
+SELECT DISTINCT name, building_id FROM import_orgs
+ON CONFLICT ON CONSTRAINT uix_name_building DO UPDATE SET version = organizations.version + 1
+""")
+
+RESOLVE_ORGANIZATIONS = text("""
+UPDATE import_orgs s SET organization_id = o.id
+FROM organizations o
+WHERE o.name = s.name AND o.building_id = s.building_id
+""")
+
+INSERT_PHONES = text("""
+INSERT INTO organization_phones (organization_id, phone)
+SELECT DISTINCT s.organization_id, p.phone
+FROM import_phones p
+JOIN import_orgs s ON s.line = p.line
+WHERE NOT EXISTS (
+    SELECT 1 FROM organization_phones x
+    WHERE x.organization_id = s.organization_id AND x.phone = p.phone
+)
+""")
+
+INSERT_LINKS = text("""
+INSERT INTO org_activity (organization_id, activity_id)
+SELECT DISTINCT s.organization_id, a.id
+FROM import_activities ia
+JOIN import_orgs s ON s.line = ia.line
+JOIN activities a ON a.name = ia.path[cardinality(ia.path)]
+ON CONFLICT DO NOTHING
+""")
+
+TOUCHED = text("SELECT DISTINCT organization_id, building_id, latitude, longitude FROM import_orgs")
+
+# Деятельности, чьи поддеревья могли получить организации пачки. Вставки идемпотентны,
+# поэтому счётчики не прибавляются, а пересчитываются
+TOUCHED_ACTIVITIES = text("""
+SELECT DISTINCT c.ancestor_id
+FROM import_activities ia
+JOIN activities a ON a.name = ia.path[cardinality(ia.path)]
+JOIN activity_closure c ON c.descendant_id = a.id
+""")
+
+
+class RejectedRecord(ValueError):
+    pass
+
+
+def split_list(value) -> list[str]:
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split("|") if item.strip()]
+    return [str(item).strip() for item in value if str(item).strip()]
+
+
+def parse_record(raw: dict) -> tuple[str, str, float, float, list[str], list[list[str]]]:
+    try:
+        name = str(raw["name"]).strip()
+        address = str(raw["address"]).strip()
+        latitude = float(raw["latitude"])
+        longitude = float(raw["longitude"])
+    except (KeyError, TypeError, ValueError) as e:
+        raise RejectedRecord(f"bad field: {e}")
+    if not name or len(name) > 255:
+        raise RejectedRecord("name must be 1..255 characters")
+    if not address or len(address) > 255:
+        raise RejectedRecord("address must be 1..255 characters")
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise RejectedRecord("coordinates out of range")
+    phones = split_list(raw.get("phones"))
+    if any(len(phone) > 50 for phone in phones):
+        raise RejectedRecord("phone longer than 50 characters")
+    paths = [[level.strip() for level in path.split("/")] for path in split_list(raw.get("activities"))]
+    if any(not all(path) or any(len(level) > 200 for level in path) for path in paths):
+        raise RejectedRecord("activity names must be 1..200 characters")
+    return name, address, latitude, longitude, phones, paths
+
+
+def read_records(path: str):
+    """(номер записи, сырой словарь) без загрузки файла целиком"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".csv"):
+            reader = csv.DictReader(f)
+            if reader.fieldnames is None or set(CSV_FIELDS[:4]) - set(reader.fieldnames):
+                raise SystemExit(f"CSV header must contain: {', '.join(CSV_FIELDS)}")
+            yield from enumerate(reader)
+        else:
+            for line, row in enumerate(f):
+                if row.strip():
+                    try:
+                        yield line, json.loads(row)
+                    except json.JSONDecodeError as e:
+                        yield line, e
+
+
+def checkpoint_path(source: str) -> str:
+    return source + ".checkpoint"
+
+
+def load_checkpoint(source: str) -> int:
+    """Сколько записей уже импортировано, если файл не менялся с прошлого запуска"""
+    try:
+        with open(checkpoint_path(source)) as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return 0
+    if state.get("size") != os.path.getsize(source):
+        raise SystemExit("source file changed since the checkpoint was written; rerun with --restart")
+    return state["records"]
+
+
+def save_checkpoint(source: str, records: int):
+    # Запись через временный файл: контрольная точка не бывает наполовину записанной
+    tmp = checkpoint_path(source) + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"size": os.path.getsize(source), "records": records}, f)
+    os.replace(tmp, checkpoint_path(source))
+
+
+async def load_chunk(conn: AsyncConnection, orgs: list, phones: list, activities: list) -> set[str]:
+    """Перенести одну пачку в основные таблицы; возвращает теги кеша затронутых сущностей"""
+    await conn.execute(text("TRUNCATE import_orgs, import_phones, import_activities"))
+    raw = (await conn.get_raw_connection()).driver_connection
+    await raw.copy_records_to_table("import_orgs", records=orgs, columns=("line", "name", "address", "latitude", "longitude"))
+    if phones:
+        await raw.copy_records_to_table("import_phones", records=phones, columns=("line", "phone"))
+    if activities:
+        await raw.copy_records_to_table("import_activities", records=activities, columns=("line", "path"))
+    await conn.execute(text("ANALYZE import_orgs, import_phones, import_activities"))
+
+    await conn.execute(INSERT_BUILDINGS)
+    await conn.execute(RESOLVE_BUILDINGS)
+    for depth in range(1, max((len(path) for _, path in activities), default=0) + 1):
+        created = (await conn.execute(INSERT_ACTIVITIES, {"depth": depth})).all()
+        if created:
+            await add_activity_paths_many([(row.id, row.parent_id) for row in created], conn)
+    await conn.execute(INSERT_ORGANIZATIONS)
+    await conn.execute(RESOLVE_ORGANIZATIONS)
+    await conn.execute(INSERT_PHONES)
+    await conn.execute(INSERT_LINKS)
+
+    tags = {"organizations", "buildings", "activities", "geo:*"}
+    building_ids = set()
+    for organization_id, building_id, latitude, longitude in await conn.execute(TOUCHED):
+        tags.update((f"org:{organization_id}", f"building:{building_id}", geo_tag(latitude, longitude)))
+        building_ids.add(building_id)
+    await recount_buildings(list(building_ids), conn)
+    await recount_activities(list(await conn.scalars(TOUCHED_ACTIVITIES)), conn)
+    return tags
+
+
+async def import_file(source: str, chunk_size: int, restart: bool):
+    if restart and os.path.exists(checkpoint_path(source)):
+        os.remove(checkpoint_path(source))
+    done = load_checkpoint(source)
+    if done:
+        print(f"resuming after {done} records", file=sys.stderr)
+
+    url = os.getenv("DATABASE_URL") or get_database_config().database_url
+    engine = create_async_engine(url, echo=False)
+    records = islice(read_records(source), done, None)
+    imported = rejected = 0
+    started_at = time.monotonic()
+    try:
+        async with engine.connect() as conn:
+            for statement in STAGING.split(";"):
+                if statement.strip():
+                    await conn.execute(text(statement))
+            await conn.commit()
+
+            while True:
+                chunk = list(islice(records, chunk_size))
+                if not chunk:
+                    break
+                orgs, phones, activities = [], [], []
+                for line, raw in chunk:
+                    try:
+                        if not isinstance(raw, dict):
+                            raise RejectedRecord(str(raw))
+                        name, address, latitude, longitude, org_phones, paths = parse_record(raw)
+                    except RejectedRecord as e:
+                        rejected += 1
+                        print(f"record {line}: {e}", file=sys.stderr)
+                        continue
+                    orgs.append((line, name, address, latitude, longitude))
+                    phones.extend((line, phone) for phone in org_phones)
+                    activities.extend((line, path) for path in paths)
+
+                tags = set()
+                if orgs:
+                    tags = await load_chunk(conn, orgs, phones, activities)
+                await conn.commit()
+                await invalidate(*tags)
+                done += len(chunk)
+                imported += len(orgs)
+                save_checkpoint(source, done)
+
+                elapsed = time.monotonic() - started_at
+                print(
+                    f"{done} records, {imported} imported, {rejected} rejected, "
+                    f"{imported / elapsed if elapsed else 0:.0f} rows/s",
+                    file=sys.stderr,
+                )
+    finally:
+        await engine.dispose()
+
+    if os.path.exists(checkpoint_path(source)):
+        os.remove(checkpoint_path(source))
+    print(f"✅ Импорт завершён: {imported} организаций, {rejected} отклонено", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковый импорт организаций из CSV или NDJSON")
+    parser.add_argument("source", help="файл .csv или .ndjson")
+    parser.add_argument("--chunk-size", type=int, default=50000, help="записей в одной транзакции")
+    parser.add_argument("--restart", action="store_true", help="игнорировать контрольную точку")
+    args = parser.parse_args()
+    asyncio.run(import_file(args.source, args.chunk_size, args.restart))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,96 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Query, Request, Response
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.engine import get_db
-from db.handler.get import get_activities_handler, get_activity_by_id_handler
-from db.handler.create import create_activity_handler
+from db.engine import get_db, get_read_db
+from db.handler.get import get_activities_handler, stream_activities_handler, get_activity_by_id_handler, get_activities_version_handler, get_activity_version_handler, get_activity_tree_handler, get_activity_counts_version_handler, get_activities_batch_handler
+from db.handler.create import create_activity_handler, create_activities_bulk_handler
 from db.handler.update import update_activity_handler
 from db.handler.delete import delete_activity_handler
-from shemas.activity import ActivityCreate, ActivityUpdate
+from shemas.activity import ActivityBulkCreate, ActivityBulkCreated, ActivityCreate, ActivityNode, ActivityOut, ActivityPage, ActivityUpdate
+from config import BULK_MAX_ROWS, PAGE_SIZE, PAGE_SIZE_MAX
+from utils.streaming import wants_ndjson, ndjson_response
+from utils.querystats import query_budget
+from utils.etag import etag_matches, make_etag, not_modified
+from utils.fields import activity_fields, sparse_response
+from utils.ids import batch_ids
 
 router = APIRouter(prefix="/activities", tags=["activities"])
 
-@router.get("/")
-async def get_activities(db: AsyncSession = Depends(get_db)):
+@router.get("/", response_model=ActivityPage)
+@query_budget(2)
+async def get_activities(request: Request, response: Response, limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None, stream: bool = False, db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(activity_fields)):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_activities_handler(session, cursor, fields))
     async with db() as session:
-        activities = await get_activities_handler(session)
-    return activities
+        version = await get_activities_version_handler(session)
+        etag = make_etag("activities", version, limit, cursor, fields)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+        activities = await get_activities_handler(session, limit, cursor, version, fields=fields)
+    return sparse_response(activities, fields, {"ETag": etag})
+
+
+# Объявлен до /{activity_id}, иначе "tree" разбирался бы как id
+@router.get("/tree", response_model=list[ActivityNode])
+# Два отпечатка + перечитывание дерева и счётчиков, если они устарели
+@query_budget(4)
+async def get_activity_tree(request: Request, root_id: int | None = None, max_depth: int | None = Query(None, ge=0), counts: bool = False, db: AsyncSession = Depends(get_read_db)):
+    async with db() as session:
+        version = await get_activities_version_handler(session)
+        counts_version = await get_activity_counts_version_handler(session) if counts else None
+        etag = make_etag("activity_tree", version, counts_version, root_id, max_depth)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        tree = await get_activity_tree_handler(session, version, root_id, max_depth, counts_version)
+    # Узлы уже собраны словарями нужной формы: без повторной проверки вложенной модели
+    return ORJSONResponse(tree, headers={"ETag": etag})
 
 
-@router.get("/{activity_id}")
-async def get_activity(activity_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/batch", response_model=list[ActivityOut])
+@query_budget(1)
+async def get_activities_batch(ids: list[int] = Depends(batch_ids), db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(activity_fields)):
     async with db() as session:
-        activity = await get_activity_by_id_handler(activity_id, session)
+        activities = await get_activities_batch_handler(ids, session, fields)
+    return sparse_response(activities, fields)
+
+
+@router.get("/{activity_id}", response_model=ActivityOut | None)
+@query_budget(2)
+async def get_activity(activity_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
+    async with db() as session:
+        version = await get_activity_version_handler(activity_id, session)
+        if version is not None:
+            etag = make_etag("activity", activity_id, version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
+        activity = await get_activity_by_id_handler(activity_id, session, version)
     return activity
 
 
-@router.post("/")
+@router.post("/", response_model=ActivityOut)
 async def create_activity(activity: ActivityCreate, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         activity = await create_activity_handler(activity.name, activity.parent_id, session)
     return activity
 
 
-@router.put("/{activity_id}")
+@router.post("/bulk", response_model=list[ActivityBulkCreated])
+async def create_activities_bulk(activities: list[ActivityBulkCreate] = Body(..., min_length=1, max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    async with db() as session:
+        activities = await create_activities_bulk_handler(activities, session)
+    return activities
+
+
+@router.put("/{activity_id}", response_model=ActivityOut | None)
 async def update_activity(activity_id: int, activity: ActivityUpdate, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         activity = await update_activity_handler(activity_id, activity.name, activity.parent_id, session)
     return activity
 
 
-@router.delete("/{activity_id}")
+@router.delete("/{activity_id}", response_model=ActivityOut | None)
 async def delete_activity(activity_id: int, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         activity = await delete_activity_handler(activity_id, session)
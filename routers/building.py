@@ -1,43 +1,74 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.engine import get_db
-from db.handler.get import get_buildings_handler, get_building_by_id_handler
-from db.handler.create import create_building_handler
+from db.engine import get_db, get_read_db
+from db.handler.get import get_buildings_handler, stream_buildings_handler, get_building_by_id_handler, get_building_version_handler, get_buildings_batch_handler
+from db.handler.create import create_building_handler, create_buildings_bulk_handler
 from db.handler.update import update_building_handler
 from db.handler.delete import delete_building_handler
-from shemas.building import BuildingCreate, BuildingUpdate
+from shemas.building import BuildingCreate, BuildingOut, BuildingPage, BuildingUpdate
+from config import BULK_MAX_ROWS, PAGE_SIZE, PAGE_SIZE_MAX
+from utils.streaming import wants_ndjson, ndjson_response
+from utils.querystats import query_budget
+from utils.etag import etag_matches, make_etag, not_modified
+from utils.fields import building_fields, sparse_response
+from utils.ids import batch_ids
 
 router = APIRouter(prefix="/buildings", tags=["buildings"])
 
-@router.get("/")
-async def get_buildings(db: AsyncSession = Depends(get_db)):
+@router.get("/", response_model=BuildingPage)
+@query_budget(1)
+async def get_buildings(request: Request, limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None, stream: bool = False, db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(building_fields)):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_buildings_handler(session, cursor, fields))
     async with db() as session:
-        buildings = await get_buildings_handler(session)
-    return buildings
+        buildings = await get_buildings_handler(session, limit, cursor, fields=fields)
+    return sparse_response(buildings, fields)
+
+
+@router.get("/batch", response_model=list[BuildingOut])
+@query_budget(1)
+async def get_buildings_batch(ids: list[int] = Depends(batch_ids), db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(building_fields)):
+    async with db() as session:
+        buildings = await get_buildings_batch_handler(ids, session, fields)
+    return sparse_response(buildings, fields)
 
 
-@router.get("/{building_id}")
-async def get_building(building_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/{building_id}", response_model=BuildingOut | None)
+@query_budget(2)
+async def get_building(building_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     async with db() as session:
-        building = await get_building_by_id_handler(building_id, session)
+        version = await get_building_version_handler(building_id, session)
+        if version is not None:
+            etag = make_etag("building", building_id, version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
+        building = await get_building_by_id_handler(building_id, session, version)
     return building
 
 
-@router.post("/")
+@router.post("/", response_model=BuildingOut)
 async def create_building(building: BuildingCreate, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         building = await create_building_handler(building.address, building.latitude, building.longitude, session)
     return building
 
 
-@router.put("/{building_id}")
+@router.post("/bulk", response_model=list[BuildingOut])
+async def create_buildings_bulk(buildings: list[BuildingCreate] = Body(..., min_length=1, max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    async with db() as session:
+        buildings = await create_buildings_bulk_handler(buildings, session)
+    return buildings
+
+
+@router.put("/{building_id}", response_model=BuildingOut | None)
 async def update_building(building_id: int, building: BuildingUpdate, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         building = await update_building_handler(building_id, building.address, building.latitude, building.longitude, session)
     return building
 
 
-@router.delete("/{building_id}")
+@router.delete("/{building_id}", response_model=BuildingOut | None)
 async def delete_building(building_id: int, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         building = await delete_building_handler(building_id, session)
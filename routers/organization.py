@@ -1,87 +1,257 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Body, Depends, Path, Query, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from db.engine import get_db
+from db.engine import get_db, get_read_db
 from db.handler.get import (get_organizations_handler, get_organization_by_id_handler, search_organizations_handler, 
 get_organizations_by_building_id_handler, get_organizations_by_activity_id_handler, get_organizations_by_activity_tree_handler,
-get_organizations_nearby_handler, get_phones_by_organization_handler)
-from db.handler.create import create_phone_handler
+get_organizations_nearby_handler, get_nearest_organizations_handler, get_organization_version_handler, autocomplete_organizations_handler, get_phones_by_organization_handler, stream_organizations_handler,
+count_organizations_by_building_handler, count_organizations_by_activity_handler, get_tile_handler, query_organizations_handler, get_organizations_batch_handler,
+stream_organizations_nearby_handler, organizations_query, search_query, by_building_query, by_activity_query, by_activity_tree_query)
+from db.handler.create import create_phone_handler, create_phones_bulk_handler, create_organizations_bulk_handler
 from db.handler.delete import delete_phone_handler
+from config import BULK_MAX_ROWS, PAGE_SIZE, PAGE_SIZE_MAX, SPATIAL_CELL_KM, TILE_MAX_ZOOM
+from db.spatial import ring_count
+from exception.request import InvalidTileError
+from shemas.organization import (NearbyOrganizationPage, OrganizationCount, OrganizationCreate, OrganizationCreated, OrganizationOut,
+OrganizationPage, OrganizationQueryPage, OrganizationSuggestion, PhoneCreated, PhoneOut, Tile)
+from utils.streaming import wants_ndjson, ndjson_response
+from utils.querystats import query_budget
+from utils.etag import etag_matches, make_etag, not_modified
+from utils.fields import organization_fields, sparse_response
+from utils.ids import batch_ids
 
 router = APIRouter(prefix="/organizations", tags=["organizations"])
 
-@router.get("/")
-async def get_organizations(db: AsyncSession = Depends(get_db)):
+@router.get("/", response_model=OrganizationPage)
+@query_budget(3)
+async def get_organizations(request: Request, limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None, stream: bool = False, db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(organization_fields)):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_organizations_handler(organizations_query(), "list", session, cursor, fields))
     async with db() as session:
-        organizations = await get_organizations_handler(session)
-    return organizations
+        organizations = await get_organizations_handler(session, limit, cursor, fields=fields)
+    return sparse_response(organizations, fields)
 
 
-@router.get("/search")
-async def search_organizations(name: str, db: AsyncSession = Depends(get_db)):
+@router.get("/search", response_model=OrganizationPage)
+@query_budget(4)
+async def search_organizations(request: Request, name: str, limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None, stream: bool = False, db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(organization_fields)):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_organizations_handler(search_query(name), "search", session, cursor, fields))
     async with db() as session:
-        organizations = await search_organizations_handler(name, session)
-    return organizations
+        organizations = await search_organizations_handler(name, session, limit, cursor, fields=fields)
+    return sparse_response(organizations, fields)
+
+
+@router.get("/autocomplete", response_model=list[OrganizationSuggestion])
+@query_budget(1)
+async def autocomplete_organizations(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=50),
+    db: AsyncSession = Depends(get_read_db),
+):
+    async with db() as session:
+        suggestions = await autocomplete_organizations_handler(q, session, limit)
+    return suggestions
 
 
-@router.get("/nearby")
+@router.get("/nearby", response_model=NearbyOrganizationPage, response_model_exclude_unset=True)
+@query_budget(5)
 async def get_organizations_nearby(
+    request: Request,
     lat: float,
     lon: float,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     radius: float = None,
     min_lat: float = None,
     max_lat: float = None,
     min_lon: float = None,
-    max_lon: float = None
+    max_lon: float = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX),
+    cursor: str | None = None,
+    max_results: int | None = Query(None, ge=1),
+    stream: bool = False,
+    fields: tuple[str, ...] | None = Depends(organization_fields),
 ):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_organizations_nearby_handler(
+            lat, lon, session, radius, min_lat, max_lat, min_lon, max_lon, cursor, max_results, fields
+        ))
     async with db() as session:
-        organizations = await get_organizations_nearby_handler(lat, lon, session, radius, min_lat, max_lat, min_lon, max_lon)
-    return organizations
+        organizations = await get_organizations_nearby_handler(lat, lon, session, radius, min_lat, max_lat, min_lon, max_lon, limit, cursor, max_results, fields=fields)
+    return sparse_response(organizations, fields)
+
+
+@router.get("/nearest", response_model=NearbyOrganizationPage)
+# Индекс + здания деятельности + по запросу на кольцо поиска (удвоения радиуса до всей сферы)
+# + загрузка (до 3 при selectin)
+@query_budget(2 + ring_count(SPATIAL_CELL_KM) + 3)
+async def get_nearest_organizations(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(10, ge=1, le=PAGE_SIZE_MAX),
+    activity_id: int | None = None,
+    db: AsyncSession = Depends(get_read_db),
+    fields: tuple[str, ...] | None = Depends(organization_fields),
+):
+    async with db() as session:
+        organizations = await get_nearest_organizations_handler(lat, lon, k, session, activity_id, fields=fields)
+    return sparse_response(organizations, fields)
+
+
+@router.get("/query", response_model=OrganizationQueryPage, response_model_exclude_unset=True)
+# Индекс зданий + страница + число при total=true + догрузка связей
+@query_budget(5)
+async def query_organizations(
+    name: str | None = Query(None, min_length=1),
+    activity_id: int | None = None,
+    building_id: int | None = None,
+    phone: str | None = Query(None, min_length=1),
+    lat: float | None = Query(None, ge=-90, le=90),
+    lon: float | None = Query(None, ge=-180, le=180),
+    radius: float | None = Query(None, gt=0),
+    min_lat: float | None = None,
+    max_lat: float | None = None,
+    min_lon: float | None = None,
+    max_lon: float | None = None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX),
+    cursor: str | None = None,
+    total: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    fields: tuple[str, ...] | None = Depends(organization_fields),
+):
+    async with db() as session:
+        organizations = await query_organizations_handler(
+            session, name, activity_id, building_id, phone, lat, lon, radius, min_lat, max_lat, min_lon, max_lon,
+            limit, cursor, total, fields,
+        )
+    return sparse_response(organizations, fields)
+
+
+@router.get("/batch", response_model=list[OrganizationOut])
+@query_budget(3)
+async def get_organizations_batch(
+    ids: list[int] = Depends(batch_ids),
+    db: AsyncSession = Depends(get_read_db),
+    fields: tuple[str, ...] | None = Depends(organization_fields),
+):
+    async with db() as session:
+        organizations = await get_organizations_batch_handler(ids, session, fields)
+    return sparse_response(organizations, fields)
+
+
+@router.get("/tiles/{z}/{x}/{y}", response_model=Tile)
+# Только (пере)загрузка агрегатов; размер ответа ограничен тайлом, а не числом зданий
+@query_budget(1)
+async def get_tile(
+    z: int = Path(..., ge=0, le=TILE_MAX_ZOOM),
+    x: int = Path(..., ge=0),
+    y: int = Path(..., ge=0),
+    db: AsyncSession = Depends(get_read_db),
+):
+    if x >= 1 << z or y >= 1 << z:
+        raise InvalidTileError()
+    async with db() as session:
+        tile = await get_tile_handler(z, x, y, session)
+    return tile
 
 
-@router.get("/{organization_id}")
-async def get_organization(organization_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/{organization_id}", response_model=OrganizationOut | None)
+@query_budget(4)
+async def get_organization(organization_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     async with db() as session:
-        organization = await get_organization_by_id_handler(organization_id, session)
+        # Версию читаем до тела: если между запросами прошла запись, ETag окажется
+        # старше тела и следующий запрос просто получит ответ целиком
+        version = await get_organization_version_handler(organization_id, session)
+        if version is not None:
+            etag = make_etag("organization", organization_id, version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
+        organization = await get_organization_by_id_handler(organization_id, session, version)
     return organization
 
 
-@router.get("/by-building/{building_id}")
-async def get_organizations_by_building(building_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/by-building/{building_id}", response_model=OrganizationPage)
+@query_budget(3)
+async def get_organizations_by_building(request: Request, building_id: int, limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None, stream: bool = False, db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(organization_fields)):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_organizations_handler(by_building_query(building_id), "by_building", session, cursor, fields))
     async with db() as session:
-        organizations = await get_organizations_by_building_id_handler(building_id, session)
-    return organizations
+        organizations = await get_organizations_by_building_id_handler(building_id, session, limit, cursor, fields=fields)
+    return sparse_response(organizations, fields)
 
 
-@router.get("/by-activity/{activity_id}")
-async def get_organizations_by_activity(activity_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/by-building/{building_id}/count", response_model=OrganizationCount | None)
+@query_budget(1)
+async def count_organizations_by_building(building_id: int, db: AsyncSession = Depends(get_read_db)):
     async with db() as session:
-        organizations = await get_organizations_by_activity_id_handler(activity_id, session)
-    return organizations
+        count = await count_organizations_by_building_handler(building_id, session)
+    return None if count is None else {"count": count}
 
 
-@router.get("/by_activity_tree/{activity_name}")
-async def get_organizations_by_activity_tree(activity_name: str, db: AsyncSession = Depends(get_db)):
+@router.get("/by-activity/{activity_id}", response_model=OrganizationPage)
+@query_budget(3)
+async def get_organizations_by_activity(request: Request, activity_id: int, limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None, stream: bool = False, db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(organization_fields)):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_organizations_handler(by_activity_query(activity_id), "by_activity", session, cursor, fields))
     async with db() as session:
-        organizations = await get_organizations_by_activity_tree_handler(activity_name, session)
-    return organizations
+        organizations = await get_organizations_by_activity_id_handler(activity_id, session, limit, cursor, fields=fields)
+    return sparse_response(organizations, fields)
+
+
+@router.get("/by-activity/{activity_id}/count", response_model=OrganizationCount | None)
+@query_budget(1)
+async def count_organizations_by_activity(activity_id: int, db: AsyncSession = Depends(get_read_db)):
+    async with db() as session:
+        count = await count_organizations_by_activity_handler(activity_id, session)
+    return None if count is None else {"count": count}
+
+
+@router.get("/by_activity_tree/{activity_name}", response_model=OrganizationPage)
+@query_budget(3)
+async def get_organizations_by_activity_tree(request: Request, activity_name: str, limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE_MAX), cursor: str | None = None, stream: bool = False, db: AsyncSession = Depends(get_read_db), fields: tuple[str, ...] | None = Depends(organization_fields)):
+    if wants_ndjson(request, stream):
+        return await ndjson_response(db, lambda session: stream_organizations_handler(by_activity_tree_query(activity_name), "by_activity_tree", session, cursor, fields))
+    async with db() as session:
+        organizations = await get_organizations_by_activity_tree_handler(activity_name, session, limit, cursor, fields=fields)
+    return sparse_response(organizations, fields)
 
 
-@router.get("/{organization_id}/phones")
-async def get_phones_by_organization(organization_id: int, db: AsyncSession = Depends(get_db)):
+@router.get("/{organization_id}/phones", response_model=list[str])
+@query_budget(2)
+async def get_phones_by_organization(organization_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_read_db)):
     async with db() as session:
-        phones = await get_phones_by_organization_handler(organization_id, session)
+        version = await get_organization_version_handler(organization_id, session)
+        if version is not None:
+            etag = make_etag("phones", organization_id, version)
+            if etag_matches(request, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
+        phones = await get_phones_by_organization_handler(organization_id, session, version)
     return phones
 
 
-@router.post("/{organization_id}/phones")
+@router.post("/{organization_id}/phones", response_model=PhoneOut)
 async def create_phone(organization_id: int, phone: str, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         phone = await create_phone_handler(organization_id, phone, session)
     return phone
 
 
-@router.delete("/{organization_id}/phones/{phone_id}")
+@router.post("/{organization_id}/phones/bulk", response_model=list[PhoneCreated])
+async def create_phones_bulk(organization_id: int, phones: list[str] = Body(..., min_length=1, max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    async with db() as session:
+        phones = await create_phones_bulk_handler(organization_id, phones, session)
+    return phones
+
+
+@router.post("/bulk", response_model=list[OrganizationCreated])
+async def create_organizations_bulk(organizations: list[OrganizationCreate] = Body(..., min_length=1, max_length=BULK_MAX_ROWS), db: AsyncSession = Depends(get_db)):
+    async with db() as session:
+        organizations = await create_organizations_bulk_handler(organizations, session)
+    return organizations
+
+
+@router.delete("/{organization_id}/phones/{phone_id}", response_model=PhoneOut | None)
 async def delete_phone(organization_id: int, phone_id: int, db: AsyncSession = Depends(get_db)):
     async with db() as session:
         phone = await delete_phone_handler(organization_id, phone_id, session)
@@ -8,6 +8,8 @@ from sqlalchemy import text
 load_dotenv()
 
 from db.models import Base, Building, Activity, Organization, OrganizationPhone
+from db.closure import rebuild_activity_closure
+from db.counts import rebuild_counts
 
 # ⚙️ Настройка подключения
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -60,6 +62,9 @@ async def seed_data():
         org4.activities = [cars]
 
         session.add_all([org1, org2, org3, org4])
+        await session.flush()
+        await rebuild_activity_closure(session)
+        await rebuild_counts(session)
         await session.commit()
         print("✅ Тестовые данные с координатами успешно добавлены.")
 
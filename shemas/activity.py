@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class ActivityCreate(BaseModel):
@@ -8,4 +8,38 @@ class ActivityCreate(BaseModel):
 
 class ActivityUpdate(BaseModel):
     name: str | None = None
-    parent_id: int | None = None
\ No newline at end of file
+    parent_id: int | None = None
+
+class ActivityBulkCreate(BaseModel):
+    """Строка пакетной вставки: родитель — существующий parent_id или ref другой строки того же пакета"""
+    name: str
+    parent_id: int | None = None
+    ref: str | None = None
+    parent_ref: str | None = None
+
+
+class ActivityOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    name: str
+    parent_id: int | None
+
+
+class ActivityBulkCreated(ActivityOut):
+    ref: str | None
+
+
+class ActivityNode(BaseModel):
+    """Узел дерева деятельностей (GET /activities/tree)"""
+    id: int
+    name: str
+    parent_id: int | None
+    # Только с counts=true: различные организации в поддереве узла
+    organizations: int | None = None
+    children: list["ActivityNode"]
+
+
+class ActivityPage(BaseModel):
+    items: list[ActivityOut]
+    next_cursor: str | None
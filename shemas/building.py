@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 class BuildingCreate(BaseModel):
     address: str
@@ -9,4 +9,18 @@ class BuildingCreate(BaseModel):
 class BuildingUpdate(BaseModel):
     address: str | None = None
     latitude: float | None = None
-    longitude: float | None = None
\ No newline at end of file
+    longitude: float | None = None
+
+
+class BuildingOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    address: str
+    latitude: float
+    longitude: float
+
+
+class BuildingPage(BaseModel):
+    items: list[BuildingOut]
+    next_cursor: str | None
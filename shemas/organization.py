@@ -0,0 +1,90 @@
+from pydantic import BaseModel, ConfigDict
+
+from shemas.building import BuildingCreate, BuildingOut
+
+
+class OrganizationCreate(BaseModel):
+    """Организация вместе с телефонами и деятельностями; здание — существующее (building_id) или новое (building)"""
+    name: str
+    building_id: int | None = None
+    building: BuildingCreate | None = None
+    phones: list[str] = []
+    activity_ids: list[int] = []
+
+
+class OrganizationOut(BaseModel):
+    """Форма serialize_organization и json-загрузчика (db/handler/loader.py)"""
+    id: int
+    name: str
+    building: BuildingOut | None
+    phones: list[str]
+    activities: list[str]
+
+
+class NearbyOrganizationOut(OrganizationOut):
+    # Только при поиске по радиусу; маршрут отдаёт поле, лишь когда оно задано
+    distance_km: float | None = None
+
+
+class OrganizationPage(BaseModel):
+    items: list[OrganizationOut]
+    next_cursor: str | None
+
+
+class NearbyOrganizationPage(BaseModel):
+    items: list[NearbyOrganizationOut]
+    next_cursor: str | None
+
+
+class OrganizationQueryPage(OrganizationPage):
+    # Только с total=true: число организаций под фильтрами без учёта страниц
+    total: int | None = None
+
+
+class OrganizationSuggestion(BaseModel):
+    id: int
+    name: str
+
+
+class TileCluster(BaseModel):
+    """Ячейка тайла: центр масс её зданий и сколько в ней зданий и организаций"""
+    latitude: float
+    longitude: float
+    buildings: int
+    organizations: int
+
+
+class TilePoint(BaseModel):
+    """Здание на тайле крупного масштаба"""
+    id: int
+    latitude: float
+    longitude: float
+    organizations: int
+
+
+class Tile(BaseModel):
+    clusters: list[TileCluster]
+    points: list[TilePoint]
+
+
+class OrganizationCount(BaseModel):
+    count: int
+
+
+class OrganizationCreated(BaseModel):
+    id: int
+    name: str
+    building_id: int
+
+
+class PhoneOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    organization_id: int
+    phone: str
+
+
+class PhoneCreated(BaseModel):
+    id: int
+    phone: str
@@ -0,0 +1,16 @@
+"""
+Тесты без базы данных: структуры в памяти, разбор параметров и маршруты,
+которые отвечают, не обращаясь к Postgres. Движок создаётся при импорте
+db.engine, но соединение открывается только при первом запросе.
+"""
+import os
+
+import pytest
+
+os.environ.setdefault("DB_ECHO", "false")
+
+
+@pytest.fixture
+def anyio_backend():
+    # Асинхронные тесты — через плагин anyio (pytest.mark.anyio), только на asyncio
+    return "asyncio"
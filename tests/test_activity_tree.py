@@ -0,0 +1,81 @@
+from db.activity_tree import ActivityTree
+
+ROWS = [
+    (1, "Еда", None, 1),
+    (2, "Мясная продукция", 1, 1),
+    (3, "Молочная продукция", 1, 2),
+    (4, "Автомобили", None, 1),
+    (5, "Грузовые", 4, 1),
+    (6, "Запчасти", 5, 3),
+]
+
+
+def assert_same(tree: ActivityTree, rows):
+    """Инкрементальные изменения дают то же, что перечитывание строк из базы"""
+    expected = ActivityTree.from_rows(sorted(rows))
+    assert tree.nodes == expected.nodes
+    assert {k: v for k, v in tree.children.items() if v} == expected.children
+    assert tree.version == expected.version
+    assert tree.render() == expected.render()
+
+
+def test_render_nested_and_limited():
+    tree = ActivityTree.from_rows(ROWS)
+    assert [node["id"] for node in tree.render()] == [1, 4]
+    assert [child["id"] for child in tree.render()[0]["children"]] == [2, 3]
+    assert tree.render(root_id=4, max_depth=1) == [{
+        "id": 4, "name": "Автомобили", "parent_id": None,
+        "children": [{"id": 5, "name": "Грузовые", "parent_id": 4, "children": []}],
+    }]
+    assert tree.render(root_id=404) == []
+
+
+def test_render_counts_and_memoization():
+    tree = ActivityTree.from_rows(ROWS)
+    tree.set_counts({1: 7, 2: 3}, "1")
+    nodes = tree.render(max_depth=1, counts=True)
+    assert [(node["id"], node["organizations"]) for node in nodes] == [(1, 7), (4, 0)]
+    assert tree.render(max_depth=1, counts=True) is nodes
+    tree.add(7, "Легковые", 4, 1)
+    assert tree.render(max_depth=1, counts=True) is not nodes
+
+
+def test_add():
+    tree = ActivityTree.from_rows(ROWS)
+    tree.add(7, "Легковые", 4, 1)
+    assert_same(tree, ROWS + [(7, "Легковые", 4, 1)])
+
+
+def test_update_rename_and_move():
+    tree = ActivityTree.from_rows(ROWS)
+    tree.update(6, "Шины", 4, 1)
+    tree.update(2, "Мясо", 1, 1)
+    rows = [row for row in ROWS if row[0] not in (2, 6)] + [(2, "Мясо", 1, 2), (6, "Шины", 4, 4)]
+    assert_same(tree, rows)
+
+
+def test_remove_makes_children_roots():
+    tree = ActivityTree.from_rows(ROWS)
+    tree.remove(4, 1)
+    # delete_activity_handler поднимает версию каждого ребёнка, ставшего корнем
+    rows = [row for row in ROWS if row[0] not in (4, 5)] + [(5, "Грузовые", None, 2)]
+    assert_same(tree, rows)
+    assert [node["id"] for node in tree.render()] == [1, 5]
+
+
+def test_version_changes_on_every_change():
+    tree = ActivityTree.from_rows(ROWS)
+    seen = {tree.version}
+    tree.add(7, "Легковые", 4, 1)
+    seen.add(tree.version)
+    tree.update(7, "Легковые", 5, 1)
+    seen.add(tree.version)
+    tree.remove(7, 2)
+    seen.add(tree.version)
+    assert len(seen) == 4
+
+
+def test_cycle_in_data_does_not_hang():
+    tree = ActivityTree.from_rows([(1, "a", 2, 1), (2, "b", 1, 1)])
+    assert tree.render() == []
+    assert [node["id"] for node in tree.render(root_id=1)] == [1]
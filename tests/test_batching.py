@@ -0,0 +1,75 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db.batching import BatchLoader
+from utils.querystats import current_stats, track_queries
+
+pytestmark = pytest.mark.anyio
+
+
+class Recorder:
+    def __init__(self, missing=()):
+        self.calls = []
+        self.missing = set(missing)
+
+    async def __call__(self, ids, session):
+        self.calls.append(sorted(ids))
+        return {i: f"value-{i}" for i in ids if i not in self.missing}
+
+
+# Движки без соединений: fetch в тестах к БД не обращается
+ENGINES = {name: create_async_engine(f"postgresql+asyncpg://{name}/test") for name in ("primary", "replica")}
+
+
+def session(bind="primary"):
+    # load() берёт от сессии только bind
+    return SimpleNamespace(bind=ENGINES[bind])
+
+
+async def test_concurrent_loads_share_one_fetch():
+    fetch = Recorder(missing={3})
+    loader = BatchLoader(fetch, window=0.01)
+    results = await asyncio.gather(*(loader.load(i, session()) for i in (1, 2, 3, 1)))
+    assert results == ["value-1", "value-2", None, "value-1"]
+    assert fetch.calls == [[1, 2, 3]]
+
+
+async def test_full_batch_dispatches_before_window():
+    fetch = Recorder()
+    loader = BatchLoader(fetch, window=10, max_batch=2)
+    results = await asyncio.wait_for(asyncio.gather(loader.load(1, session()), loader.load(2, session())), 1)
+    assert results == ["value-1", "value-2"]
+    assert fetch.calls == [[1, 2]]
+
+
+async def test_batches_are_per_bind():
+    fetch = Recorder()
+    loader = BatchLoader(fetch, window=0.01)
+    await asyncio.gather(loader.load(1, session("primary")), loader.load(2, session("replica")))
+    assert sorted(fetch.calls) == [[1], [2]]
+
+
+async def test_fetch_error_reaches_every_waiter():
+    async def fetch(ids, session):
+        raise RuntimeError("boom")
+
+    loader = BatchLoader(fetch, window=0.01)
+    results = await asyncio.gather(loader.load(1, session()), loader.load(2, session()), return_exceptions=True)
+    assert [str(e) for e in results] == ["boom", "boom"]
+
+
+async def test_batch_runs_outside_caller_query_stats():
+    seen = []
+
+    async def fetch(ids, session):
+        seen.append(current_stats.get())
+        return {}
+
+    loader = BatchLoader(fetch, window=0.01)
+    with track_queries() as stats:
+        await loader.load(1, session())
+    assert seen == [None]
+    assert stats.statements == 0
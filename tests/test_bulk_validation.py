@@ -0,0 +1,80 @@
+import pytest
+
+from db.handler.create import RowErrors, create_activities_bulk_handler
+from exception.request import BulkValidationError
+from shemas.activity import ActivityBulkCreate
+
+pytestmark = pytest.mark.anyio
+
+
+class LookupSession:
+    """Отвечает на проверочные запросы пакета: существующие имена, затем существующие parent_id"""
+
+    def __init__(self, existing_names=(), existing_parents=()):
+        self.answers = [list(existing_names), list(existing_parents)]
+
+    async def scalars(self, statement, *args):
+        return self.answers.pop(0)
+
+
+def test_row_errors_grouped_by_row_in_order():
+    errors = RowErrors()
+    errors.raise_if_any()
+    errors.add(3, "b")
+    errors.add(1, "a")
+    errors.add(3, "c")
+    with pytest.raises(BulkValidationError) as error:
+        errors.raise_if_any()
+    assert error.value.status_code == 422
+    assert error.value.detail == [{"index": 1, "errors": ["a"]}, {"index": 3, "errors": ["b", "c"]}]
+
+
+async def rejected(rows, session=None) -> dict[int, list[str]]:
+    with pytest.raises(BulkValidationError) as error:
+        await create_activities_bulk_handler([ActivityBulkCreate(**row) for row in rows], session or LookupSession())
+    return {item["index"]: item["errors"] for item in error.value.detail}
+
+
+async def test_parent_ref_cycle():
+    errors = await rejected([
+        {"name": "root", "ref": "r"},
+        {"name": "a", "ref": "a", "parent_ref": "b"},
+        {"name": "b", "ref": "b", "parent_ref": "c"},
+        {"name": "c", "ref": "c", "parent_ref": "a"},
+        {"name": "self", "ref": "s", "parent_ref": "s"},
+        {"name": "leaf", "parent_ref": "r"},
+    ])
+    assert errors == {index: ["parent_ref forms a cycle"] for index in (1, 2, 3, 4)}
+
+
+async def test_row_below_a_cycle_is_rejected_too():
+    errors = await rejected([
+        {"name": "a", "ref": "a", "parent_ref": "b"},
+        {"name": "b", "ref": "b", "parent_ref": "a"},
+        {"name": "child", "parent_ref": "a"},
+    ])
+    assert set(errors) == {0, 1, 2}
+
+
+async def test_row_level_errors():
+    errors = await rejected(
+        [
+            {"name": "", "ref": "x"},
+            {"name": "dup", "ref": "x"},
+            {"name": "dup"},
+            {"name": "both", "parent_id": 1, "parent_ref": "x"},
+            {"name": "orphan", "parent_ref": "missing"},
+            {"name": "taken"},
+            {"name": "lost", "parent_id": 404},
+        ],
+        LookupSession(existing_names=["taken"], existing_parents=[1]),
+    )
+    assert errors == {
+        0: ["name must be 1..200 characters"],
+        1: ["duplicate ref in batch (row 0)"],
+        2: ["duplicate name in batch (row 1)"],
+        3: ["parent_id and parent_ref are mutually exclusive"],
+        4: ["parent_ref 'missing' not found in batch"],
+        5: ["activity with this name already exists"],
+        6: ["parent_id 404 not found"],
+    }
@@ -0,0 +1,76 @@
+import pytest
+
+from utils import cache
+from utils.cache import MemoryBackend, cached, invalidate, make_backend
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def memory(monkeypatch):
+    backend = MemoryBackend(max_entries=100)
+    monkeypatch.setattr(cache, "backend", backend)
+    return backend
+
+
+def counting_handler(tags):
+    calls = []
+
+    @cached("test", lambda result, item_id, **params: tags(item_id))
+    async def handler(item_id: int, session=None):
+        calls.append(item_id)
+        return {"id": item_id, "call": len(calls)}
+
+    return handler, calls
+
+
+async def test_hit_until_tag_invalidated(memory):
+    handler, calls = counting_handler(lambda item_id: {f"org:{item_id}"})
+    assert await handler(1) == await handler(1, session=object())
+    await handler(2)
+    assert calls == [1, 2]
+
+    await invalidate("org:1")
+    assert (await handler(1))["call"] == 3
+    assert (await handler(2))["call"] == 2
+
+
+async def test_shared_tag_invalidates_every_entry(memory):
+    handler, calls = counting_handler(lambda item_id: {f"org:{item_id}", "activities"})
+    await handler(1)
+    await handler(2)
+    await invalidate("activities")
+    await handler(1)
+    await handler(2)
+    assert calls == [1, 2, 1, 2]
+
+
+async def test_write_during_read_is_not_stored(memory):
+    calls = []
+
+    @cached("test", lambda result, item_id, **params: {f"org:{item_id}"})
+    async def handler(item_id: int):
+        calls.append(item_id)
+        if len(calls) == 1:
+            await invalidate("org:1")
+        return len(calls)
+
+    assert await handler(1) == 1
+    assert await handler(1) == 2
+    assert await handler(1) == 2
+
+
+async def test_lru_evicts_oldest(memory):
+    memory.max_entries = 2
+    handler, calls = counting_handler(lambda item_id: {f"org:{item_id}"})
+    for item_id in (1, 2, 1, 3, 1, 2):
+        await handler(item_id)
+    assert calls == [1, 2, 3, 2]
+
+
+def test_memory_backend_disabled_for_several_workers():
+    assert isinstance(make_backend("memory", workers=1), MemoryBackend)
+    assert make_backend("memory", workers=4) is None
+    assert make_backend("none") is None
+    with pytest.raises(ValueError):
+        make_backend("memcached")
@@ -0,0 +1,74 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from utils import compression
+from utils.compression import CompressedCache, CompressionMiddleware, choose_encoding
+
+
+@pytest.fixture
+def encoders(monkeypatch):
+    monkeypatch.setattr(compression, "ENCODERS", {name: compression.AVAILABLE[name] for name in ("zstd", "br", "gzip")})
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("gzip, br, zstd", "zstd"),
+    ("zstd;q=0.5, gzip", "gzip"),
+    ("GZIP;q=0.8, br;q=0.9", "br"),
+    ("*", "zstd"),
+    ("*;q=0.1, gzip;q=0.2", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=abc", None),
+])
+def test_choose_encoding(encoders, header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_cache_evicts_least_recent_by_size():
+    cache = CompressedCache(max_bytes=80)
+    for key in "abcdefgh":
+        cache.put(key, b"x" * 10)
+    assert cache.size == 80
+    assert cache.get("a") is not None
+    cache.put("i", b"x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.size == 80
+
+
+def test_cache_replaces_and_skips_large_bodies():
+    cache = CompressedCache(max_bytes=80)
+    cache.put("a", b"x" * 10)
+    cache.put("a", b"x" * 5)
+    assert cache.size == 5
+    cache.put("big", b"x" * 11)
+    assert cache.get("big") is None
+    assert cache.size == 5
+
+
+@pytest.mark.anyio
+async def test_middleware_compresses_large_json(encoders):
+    inner = FastAPI()
+    payload = [{"id": i, "name": f"organization {i}"} for i in range(500)]
+
+    @inner.get("/items")
+    async def items():
+        return payload
+
+    @inner.get("/small")
+    async def small():
+        return {"id": 1}
+
+    transport = httpx.ASGITransport(app=CompressionMiddleware(inner))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        response = await client.get("/items", headers={"accept-encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == payload
+        assert response.num_bytes_downloaded < len(response.content) / 2
+
+        response = await client.get("/small", headers={"accept-encoding": "gzip"})
+        assert "content-encoding" not in response.headers
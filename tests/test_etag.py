@@ -0,0 +1,56 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from sqlalchemy.orm.exc import StaleDataError
+from starlette.requests import Request
+
+import app as application
+from utils.etag import etag_matches, make_etag, not_modified
+
+
+def request_with(if_none_match: str | None) -> Request:
+    headers = [] if if_none_match is None else [(b"if-none-match", if_none_match.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_make_etag_is_strong_and_depends_on_every_part():
+    etag = make_etag("organization", 5, "3:1:2")
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == make_etag("organization", 5, "3:1:2")
+    assert etag != make_etag("organization", 5, "4:1:2")
+    assert etag != make_etag("organization", 6, "3:1:2")
+
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ("", False),
+    ('"other"', False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", W/"abc"', True),
+    ("*", True),
+])
+def test_if_none_match(header, matches):
+    assert etag_matches(request_with(header), '"abc"') is matches
+
+
+def test_not_modified():
+    response = not_modified('"abc"')
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"abc"'
+    assert response.body == b""
+
+
+@pytest.mark.anyio
+async def test_concurrent_version_conflict_is_409():
+    inner = FastAPI()
+    inner.add_exception_handler(StaleDataError, application.stale_data_handler)
+
+    @inner.put("/r")
+    async def update():
+        raise StaleDataError("UPDATE statement on table 'organizations' expected to update 1 row(s); 0 were matched.")
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=inner), base_url="http://test") as client:
+        response = await client.put("/r")
+    assert response.status_code == 409
+    assert response.json() == {"detail": "resource was modified concurrently, retry"}
@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from db.handler import get
+from db.projection import BUILDING_FIELDS, ORGANIZATION_FIELDS, normalize_fields, organization_rows
+from exception.request import InvalidFieldsError
+from utils.fields import parse_fields
+
+ALLOWED = (*ORGANIZATION_FIELDS, "building")
+
+
+def test_id_is_always_selected_in_canonical_order():
+    assert normalize_fields(["phones", "name"], ALLOWED) == ("id", "name", "phones")
+    assert normalize_fields([], ALLOWED) == ("id",)
+
+
+def test_building_expands_and_building_field_adds_building_id():
+    assert normalize_fields(["building"], ALLOWED) == ("id", *(f"building.{name}" for name in BUILDING_FIELDS))
+    assert normalize_fields(["building.latitude"], ALLOWED) == ("id", "building.id", "building.latitude")
+
+
+def test_unknown_field():
+    with pytest.raises(ValueError, match="rating"):
+        normalize_fields(["name", "rating"], ALLOWED)
+    with pytest.raises(InvalidFieldsError):
+        parse_fields("name,rating", ALLOWED)
+    assert parse_fields(" name , ,id", ALLOWED) == ("id", "name")
+    assert parse_fields(None, ALLOWED) is None
+
+
+def test_missing_building_becomes_none():
+    fields = ("id", "building.id", "building.address")
+    assert organization_rows([(1, None, None), (2, 7, "Lenina 1")], fields) == [
+        {"id": 1, "building": None},
+        {"id": 2, "building": {"id": 7, "address": "Lenina 1"}},
+    ]
+
+
+@pytest.mark.parametrize("loader", ["joined", "json"])
+def test_bbox_page_selects_only_requested_columns(loader):
+    statement = get.query_statement(("bbox",), loader, False, ("id", "name"))
+    assert [column.name for column in statement.selected_columns] == ["id", "name"]
+    sql = str(statement.compile(dialect=postgresql.dialect()))
+    columns, conditions = sql.split("WHERE", 1)
+    assert "buildings" not in columns
+    # Точная область проверяется в SQL, до LIMIT
+    assert "buildings.latitude BETWEEN" in conditions.split("LIMIT")[0]
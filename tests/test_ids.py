@@ -0,0 +1,21 @@
+import pytest
+
+from config import BATCH_MAX_IDS
+from exception.request import InvalidIdsError
+from utils.ids import parse_ids
+
+
+def test_comma_and_repeated_params_keep_first_order():
+    assert parse_ids(["3,1", "2", "1, 4,"]) == [3, 1, 2, 4]
+
+
+@pytest.mark.parametrize("raw, message", [
+    ([""], "must not be empty"),
+    ([",,"], "must not be empty"),
+    (["1,x"], "invalid id: x"),
+    ([",".join(map(str, range(BATCH_MAX_IDS + 1)))], f"at most {BATCH_MAX_IDS}"),
+])
+def test_invalid_ids(raw, message):
+    with pytest.raises(InvalidIdsError) as error:
+        parse_ids(raw)
+    assert message in error.value.detail
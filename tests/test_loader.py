@@ -0,0 +1,41 @@
+from sqlalchemy import select
+
+from db.handler import loader
+from db.handler.loader import organization_json, organizations_statement, serialize_organization
+from db.models import Activity, Building, Organization, OrganizationPhone
+
+
+def test_serialize_organization():
+    org = Organization(
+        id=1, name="Рога и копыта",
+        building=Building(id=7, address="Ленина 1", latitude=55.75, longitude=37.61),
+        phones=[OrganizationPhone(phone="2-222-222"), OrganizationPhone(phone="8-923-666-13-13")],
+        activities=[Activity(name="Еда")],
+    )
+    assert serialize_organization(org) == {
+        "id": 1,
+        "name": "Рога и копыта",
+        "building": {"id": 7, "address": "Ленина 1", "latitude": 55.75, "longitude": 37.61},
+        "phones": ["2-222-222", "8-923-666-13-13"],
+        "activities": ["Еда"],
+    }
+    assert serialize_organization(Organization(id=2, name="x"))["building"] is None
+
+
+def test_json_loader_builds_the_same_keys():
+    keys = [clause.value for clause in list(organization_json().clauses)[::2]]
+    assert keys == list(serialize_organization(Organization(id=1, name="x")))
+
+
+def test_statement_shape_per_loader():
+    query = select(Organization)
+    assert len(organizations_statement(query, "json").selected_columns) == 1
+    assert len(organizations_statement(query, "joined")._with_options) == 3
+    assert [c.name for c in organizations_statement(query, "selectin", ("id", "name")).selected_columns] == ["id", "name"]
+
+
+def test_loader_override(monkeypatch):
+    monkeypatch.setattr(loader, "ORG_LOADERS", {"search": "json"})
+    monkeypatch.setattr(loader, "ORG_LOADER", "selectin")
+    assert loader.loader_for("search") == "json"
+    assert loader.loader_for("list") == "selectin"
@@ -0,0 +1,57 @@
+import time
+
+import httpx
+import pytest
+
+import app as application
+import db.tiles
+from db.tiles import TileIndex
+from utils.metrics import Counter, Histogram, Registry, statement_operation
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency", "help", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/a")
+    assert list(histogram.samples()) == [
+        ("latency_bucket", '{route="/a",le="0.1"}', 2),
+        ("latency_bucket", '{route="/a",le="1.0"}', 3),
+        ("latency_bucket", '{route="/a",le="+Inf"}', 4),
+        ("latency_sum", '{route="/a"}', 3.65),
+        ("latency_count", '{route="/a"}', 4),
+    ]
+
+
+def test_render_exposition_format_and_escaping():
+    registry = Registry()
+    counter = registry.register(Counter("requests_total", "Requests", ("path",)))
+    counter.inc('/a"b\\')
+    counter.inc('/a"b\\', amount=2)
+    assert registry.render() == (
+        "# HELP requests_total Requests\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="/a\\"b\\\\"} 3.0\n'
+    )
+
+
+@pytest.mark.parametrize("statement, operation", [
+    ("  select 1", "SELECT"),
+    ("WITH x AS (SELECT 1) SELECT * FROM x", "WITH"),
+    ("INSERT INTO t VALUES (1)", "INSERT"),
+    ("ANALYZE t", "OTHER"),
+    ("", "OTHER"),
+])
+def test_statement_operation(statement, operation):
+    assert statement_operation(statement) == operation
+
+
+@pytest.mark.anyio
+async def test_requests_are_labelled_by_route_template(monkeypatch):
+    monkeypatch.setattr(db.tiles, "tile_index", TileIndex(db.tiles.TILE_GRID_BITS, db.tiles.TILE_CLUSTER_MAX_ZOOM))
+    monkeypatch.setattr(db.tiles, "_loaded_at", time.monotonic())
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=application.app), base_url="http://test") as client:
+        await client.get("/organizations/tiles/1/1/0")
+        metrics = await client.get("/metrics")
+    assert metrics.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'http_requests_total{method="GET",route="/organizations/tiles/{z}/{x}/{y}",status="200"}' in metrics.text
+    assert "/organizations/tiles/1/1/0" not in metrics.text
@@ -0,0 +1,109 @@
+import time
+
+import numpy as np
+import pytest
+
+import db.spatial
+from db.handler import get
+from db.spatial import BuildingIndex, haversine
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """Организации (id, building_id, activity_id) в памяти; считает запросы"""
+
+    def __init__(self, buildings: dict, organizations: list[tuple[int, int, int]]):
+        self.buildings, self.organizations = buildings, organizations
+        self.statements = []
+
+    async def scalars(self, statement, params):
+        assert statement is get.activity_buildings_statement()
+        self.statements.append(("activity_buildings", None))
+        return sorted({building for _, building, activity in self.organizations if activity == params["activity_id"]})
+
+    async def execute(self, statement, params):
+        self.statements.append(("points", len(params["building_ids"])))
+        wanted = set(params["building_ids"])
+        return FakeResult([
+            (org_id, *self.buildings[building])
+            for org_id, building, activity in self.organizations
+            if building in wanted and params.get("activity_id", activity) == activity
+        ])
+
+
+@pytest.fixture
+def city(monkeypatch):
+    rng = np.random.default_rng(3)
+    buildings = {
+        building_id: (55.0 + lat, 37.0 + lon)
+        for building_id, (lat, lon) in enumerate(zip(rng.uniform(0, 2, 3000).tolist(), rng.uniform(0, 2, 3000).tolist()))
+    }
+    index = BuildingIndex(2.0)
+    for building_id, (lat, lon) in buildings.items():
+        index.add(building_id, lat, lon)
+    monkeypatch.setattr(db.spatial, "building_index", index)
+    monkeypatch.setattr(db.spatial, "_loaded_at", time.monotonic())
+
+    async def load(ids, distances, session, fields=None):
+        return [{"id": int(org_id), "distance_km": float(distance)} for org_id, distance in zip(ids, distances)]
+
+    monkeypatch.setattr(get, "load_organizations_with_distance", load)
+    # Редкая деятельность 2 — в трёх далёких зданиях, у остальных организаций деятельность 1
+    organizations = [(building_id, building_id, 1) for building_id in buildings if building_id % 10 == 0]
+    organizations += [(10_000 + n, building_id, 2) for n, building_id in enumerate((1, 2, 3))]
+    return buildings, organizations
+
+
+def expected(buildings, organizations, lat, lon, k, activity_id=None):
+    rows = sorted(
+        (haversine(lat, lon, *buildings[building]), org_id)
+        for org_id, building, activity in organizations
+        if activity_id is None or activity == activity_id
+    )
+    return [org_id for _, org_id in rows[:k]]
+
+
+nearest = get.get_nearest_organizations_handler.__wrapped__
+
+
+async def test_nearest_matches_brute_force(city):
+    buildings, organizations = city
+    session = FakeSession(buildings, organizations)
+    result = await nearest(56.0, 38.0, 15, session)
+    assert [org["id"] for org in result["items"]] == expected(buildings, organizations, 56.0, 38.0, 15)
+
+
+async def test_sparse_activity_filters_candidates_first(city):
+    buildings, organizations = city
+    session = FakeSession(buildings, organizations)
+    result = await nearest(55.0, 37.0, 5, session, activity_id=2)
+    assert [org["id"] for org in result["items"]] == expected(buildings, organizations, 55.0, 37.0, 5, 2)
+    # Один запрос за зданиями деятельности, а в кольца уходят только её три здания
+    assert session.statements[0] == ("activity_buildings", None)
+    assert sum(size for kind, size in session.statements if kind == "points") == 3
+
+
+async def test_unknown_activity_needs_one_query(city):
+    buildings, organizations = city
+    session = FakeSession(buildings, organizations)
+    assert (await nearest(55.0, 37.0, 5, session, activity_id=99))["items"] == []
+    assert len(session.statements) == 1
+
+
+async def test_candidate_cap_bounds_what_is_sent(city, monkeypatch):
+    buildings, organizations = city
+    monkeypatch.setattr(get, "NEAREST_MAX_CANDIDATES", 50)
+    session = FakeSession(buildings, organizations)
+    result = await nearest(56.0, 38.0, 1000, session)
+    assert sum(size for _, size in session.statements) == 50
+    # Найденное — точные ближайшие среди просмотренных зданий
+    assert [org["distance_km"] for org in result["items"]] == sorted(org["distance_km"] for org in result["items"])
@@ -0,0 +1,47 @@
+import pytest
+
+from db.pagination import cursor_id, decode_cursor, encode_cursor, keyset_params, split_page
+from exception.request import InvalidCursorError
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42)) == [42]
+    assert decode_cursor(encode_cursor(1.5, 7), 2) == [1.5, 7]
+
+
+@pytest.mark.parametrize("cursor", ["!!!", "bm90IGpzb24", encode_cursor(1, 2)])
+def test_decode_cursor_rejects_garbage(cursor):
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor)
+
+
+def test_cursor_id_requires_int():
+    assert cursor_id(None) is None
+    assert cursor_id(encode_cursor(5)) == 5
+    with pytest.raises(InvalidCursorError):
+        cursor_id(encode_cursor("5"))
+    with pytest.raises(InvalidCursorError):
+        cursor_id(encode_cursor({"a": 1}))
+
+
+def test_keyset_params_fetch_one_extra_row():
+    assert keyset_params(10, None, name="x") == {"name": "x", "limit": 11}
+    assert keyset_params(10, encode_cursor(3)) == {"after": 3, "limit": 11}
+
+
+def test_split_page_last_page_has_no_cursor():
+    rows = [{"id": 1}, {"id": 2}]
+    assert split_page(rows, 2, lambda row: row["id"]) == (rows, None)
+
+
+def test_split_page_cuts_extra_row_and_points_at_last_kept():
+    rows = [{"id": 1}, {"id": 2}, {"id": 3}]
+    items, cursor = split_page(rows, 2, lambda row: row["id"])
+    assert items == rows[:2]
+    assert cursor_id(cursor) == 2
+
+
+def test_split_page_composite_key():
+    rows = [(0.5, 1), (0.7, 2), (0.9, 3)]
+    _, cursor = split_page(rows, 2, lambda row: row)
+    assert decode_cursor(cursor, 2) == [0.7, 2]
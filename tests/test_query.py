@@ -0,0 +1,56 @@
+import time
+
+import httpx
+import pytest
+
+import app as application
+import db.spatial
+from config import SPATIAL_CELL_KM
+from db.spatial import BuildingIndex
+from utils.querystats import assert_route_within_budget
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def client(monkeypatch):
+    # Индекс с одним зданием в Москве: область в другом месте пуста и обходится без БД
+    index = BuildingIndex(SPATIAL_CELL_KM)
+    index.add(1, 55.75, 37.61)
+    monkeypatch.setattr(db.spatial, "building_index", index)
+    monkeypatch.setattr(db.spatial, "_loaded_at", time.monotonic())
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=application.app), base_url="http://test") as client:
+        yield client
+
+
+@pytest.mark.parametrize("query, detail", [
+    ("radius=5", "radius requires lat and lon"),
+    ("lat=55&radius=5", "radius requires lat and lon"),
+    ("lat=55&lon=37&radius=5&min_lat=1", "radius and bbox cannot be combined"),
+    ("min_lat=1&max_lat=2&min_lon=3", "bbox requires min_lat, max_lat, min_lon and max_lon"),
+    ("lat=55&lon=37", "lat and lon require radius"),
+])
+async def test_incompatible_filters_are_400(client, query, detail):
+    response = await client.get(f"/organizations/query?{query}")
+    assert response.status_code == 400
+    assert response.json() == {"detail": detail}
+
+
+async def test_unknown_field_is_400(client):
+    response = await client.get("/organizations/query?fields=id,rating")
+    assert response.status_code == 400
+    assert response.json() == {"detail": "unknown field: rating"}
+
+
+@pytest.mark.parametrize("query", [
+    "lat=-33.9&lon=151.2&radius=10&total=true",
+    "min_lat=-34&max_lat=-33&min_lon=151&max_lon=152&total=true",
+    # Здание вне области
+    "lat=55.75&lon=37.61&radius=1&building_id=2&total=true",
+])
+async def test_empty_area_answers_without_queries(client, query):
+    response = await assert_route_within_budget(client, "GET", f"/organizations/query?{query}")
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+    assert response.json()["total"] == 0
+    assert response.headers["x-db-queries"] == "0"
@@ -0,0 +1,75 @@
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+import app as application
+import db.tiles
+from db.tiles import TileIndex
+from utils.querystats import (
+    QueryBudgetExceeded,
+    QueryStatsMiddleware,
+    assert_route_within_budget,
+    current_stats,
+    expect_queries,
+    query_budget,
+)
+
+pytestmark = pytest.mark.anyio
+
+
+def client_for(asgi_app):
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app), base_url="http://test")
+
+
+@pytest.fixture
+def warm_tiles(monkeypatch):
+    index = TileIndex(db.tiles.TILE_GRID_BITS, db.tiles.TILE_CLUSTER_MAX_ZOOM)
+    monkeypatch.setattr(db.tiles, "tile_index", index)
+    monkeypatch.setattr(db.tiles, "_loaded_at", time.monotonic())
+    return index
+
+
+async def test_tile_route_within_budget(warm_tiles):
+    async with client_for(application.app) as client:
+        response = await assert_route_within_budget(client, "GET", "/organizations/tiles/0/0/0")
+    assert response.status_code == 200
+    assert int(response.headers["x-db-queries"]) <= int(response.headers["x-db-query-budget"])
+
+
+def budget_app(statements: int, budget: int | None):
+    inner = FastAPI()
+
+    async def endpoint():
+        for i in range(statements):
+            current_stats.get().record(f"SELECT {i}", 1, 0.0)
+        return {}
+
+    if budget is not None:
+        endpoint = query_budget(budget)(endpoint)
+    inner.get("/r")(endpoint)
+    inner.add_middleware(QueryStatsMiddleware)
+    return inner
+
+
+async def test_route_over_budget_raises():
+    async with client_for(budget_app(statements=3, budget=2)) as client:
+        with pytest.raises(QueryBudgetExceeded, match="3 SQL statements, budget 2"):
+            await assert_route_within_budget(client, "GET", "/r")
+
+
+async def test_route_without_budget_raises():
+    async with client_for(budget_app(statements=0, budget=None)) as client:
+        with pytest.raises(QueryBudgetExceeded, match="declares no query budget"):
+            await assert_route_within_budget(client, "GET", "/r")
+
+
+def test_expect_queries_lists_statements():
+    with pytest.raises(QueryBudgetExceeded, match="SELECT 2"):
+        with expect_queries(1):
+            for i in range(3):
+                current_stats.get().record(f"SELECT {i}", 0, 0.0)
+    with expect_queries(1) as stats:
+        current_stats.get().record("SELECT 1", 0, 0.0)
+    assert stats.statements == 1
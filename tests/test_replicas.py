@@ -0,0 +1,56 @@
+import time
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.requests import Request
+
+import db.engine
+from config import READ_YOUR_WRITES_SECONDS
+from db.engine import READ_YOUR_WRITES_HEADER, ReplicaSet, reads_from_primary
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db.engine.time, "monotonic", lambda: now[0])
+    return now
+
+
+def replica_set(count: int) -> ReplicaSet:
+    # Движки без соединений: ReplicaSet только выбирает, к кому идти
+    return ReplicaSet([create_async_engine(f"postgresql+asyncpg://replica-{i}/test") for i in range(count)], retry_after=5)
+
+
+def test_round_robin_starts_at_next_replica(clock):
+    replicas = replica_set(3)
+    assert [list(replicas.candidates()) for _ in range(4)] == [[0, 1, 2], [1, 2, 0], [2, 0, 1], [0, 1, 2]]
+
+
+def test_down_replica_is_skipped_until_retry(clock):
+    replicas = replica_set(2)
+    replicas.mark_down(0)
+    assert list(replicas.candidates()) == [1]
+    assert list(replicas.candidates()) == [1]
+    clock[0] += 5
+    assert list(replicas.candidates()) == [0, 1]
+
+
+def test_no_replicas():
+    assert list(replica_set(0).candidates()) == []
+
+
+def request_with(value: str | None) -> Request:
+    headers = [] if value is None else [(READ_YOUR_WRITES_HEADER.lower().encode(), value.encode())]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("offset, pinned", [
+    (None, False),
+    (-1, False),
+    (READ_YOUR_WRITES_SECONDS / 2, True),
+    (READ_YOUR_WRITES_SECONDS + 60, False),
+])
+def test_read_your_writes_window(offset, pinned):
+    value = None if offset is None else str(time.time() + offset)
+    assert reads_from_primary(request_with(value)) is pinned
+    assert reads_from_primary(request_with("garbage")) is False
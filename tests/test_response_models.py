@@ -0,0 +1,30 @@
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+
+import app as application
+from db.models import Activity, Building
+from shemas.activity import ActivityOut
+from shemas.building import BuildingOut
+
+
+def api_routes():
+    return [route for route in application.app.routes if isinstance(route, APIRoute) and route.include_in_schema]
+
+
+def test_every_route_declares_a_response_model():
+    missing = [f"{sorted(route.methods)} {route.path}" for route in api_routes() if route.response_model is None]
+    assert missing == []
+
+
+def test_orjson_is_the_default_response_class():
+    assert application.app.router.default_response_class is ORJSONResponse
+    assert all(getattr(route.response_class, "value", route.response_class) is ORJSONResponse for route in api_routes())
+
+
+def test_version_column_is_not_exposed():
+    building = Building(id=1, address="Ленина 1", latitude=55.75, longitude=37.61, version=3)
+    activity = Activity(id=2, name="Еда", parent_id=None, version=5)
+    assert BuildingOut.model_validate(building).model_dump() == {
+        "id": 1, "address": "Ленина 1", "latitude": 55.75, "longitude": 37.61,
+    }
+    assert "version" not in ActivityOut.model_validate(activity).model_dump()
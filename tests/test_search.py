@@ -0,0 +1,16 @@
+from sqlalchemy.dialects import postgresql
+
+from db.handler.get import contains_pattern, like_escape, name_contains
+
+
+def test_like_wildcards_are_escaped():
+    assert like_escape("100%_a/b") == "100/%/_a//b"
+    assert contains_pattern("100%") == "%100/%%"
+    assert contains_pattern("Рога и копыта") == "%Рога и копыта%"
+
+
+def test_name_contains_uses_escape_char():
+    clause = name_contains("50%")
+    sql = str(clause.compile(dialect=postgresql.dialect()))
+    assert sql.endswith("ESCAPE '/'")
+    assert clause.right.value == "%50/%%"
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from db.spatial import BuildingIndex, haversine, haversine_many, lon_in_range, lon_in_range_many
+
+
+@pytest.fixture
+def world():
+    """Здания по всему шару, со сгущениями у антимеридиана и у полюсов"""
+    rng = np.random.default_rng(7)
+    lats = np.concatenate([rng.uniform(-90, 90, 600), rng.uniform(-5, 5, 200), rng.uniform(85, 90, 100), rng.uniform(-90, -85, 100)])
+    lons = np.concatenate([rng.uniform(-180, 180, 600), rng.uniform(175, 185, 200) % 360 - 180, rng.uniform(-180, 180, 200)])
+    index = BuildingIndex(50.0)
+    for building_id, (lat, lon) in enumerate(zip(lats.tolist(), lons.tolist())):
+        index.add(building_id, lat, lon)
+    return index, lats, lons
+
+
+def brute_radius(lats, lons, lat, lon, radius):
+    distances = haversine_many(lat, lon, lats, lons)
+    return set(np.nonzero(distances <= radius)[0].tolist())
+
+
+@pytest.mark.parametrize("lat, lon, radius", [
+    (0.0, 179.9, 300.0),     # через антимеридиан
+    (89.9, 0.0, 500.0),      # полюс
+    (-89.0, 120.0, 400.0),
+    (45.0, 10.0, 2000.0),
+    (10.0, -60.0, 1.0),
+])
+def test_within_radius_matches_brute_force(world, lat, lon, radius):
+    index, lats, lons = world
+    ids, distances = index.within_radius(lat, lon, radius)
+    assert set(ids.tolist()) == brute_radius(lats, lons, lat, lon, radius)
+    assert np.all(distances <= radius + 1e-6)
+
+
+@pytest.mark.parametrize("bbox", [
+    (-5.0, 5.0, 170.0, -170.0),   # min_lon > max_lon — через антимеридиан
+    (80.0, 90.0, -180.0, 180.0),  # полярная шапка
+    (-90.0, -85.0, 0.0, 90.0),
+    (-10.0, 10.0, -30.0, 30.0),
+    (-90.0, 90.0, 0.0, 360.0),    # весь шар
+])
+def test_within_bbox_matches_brute_force(world, bbox):
+    index, lats, lons = world
+    min_lat, max_lat, min_lon, max_lon = bbox
+    expected = np.nonzero((lats >= min_lat) & (lats <= max_lat) & lon_in_range_many(lons, min_lon, max_lon))[0]
+    assert set(index.within_bbox(*bbox).tolist()) == set(expected.tolist())
+
+
+def test_lon_in_range_wraps():
+    assert lon_in_range(179.0, 170.0, -170.0)
+    assert lon_in_range(-179.0, 170.0, -170.0)
+    assert not lon_in_range(0.0, 170.0, -170.0)
+    assert lon_in_range(0.0, -180.0, 180.0)
+
+
+def test_move_and_remove():
+    index = BuildingIndex(2.0)
+    index.add(1, 55.75, 37.61)
+    index.add(1, 59.93, 30.33)
+    assert len(index) == 1
+    assert index.within_radius(55.75, 37.61, 10.0)[0].tolist() == []
+    assert index.within_radius(59.93, 30.33, 10.0)[0].tolist() == [1]
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0 and not index.cells
+
+
+def test_haversine_known_distance():
+    # Москва — Санкт-Петербург, около 634 км
+    assert haversine(55.7558, 37.6173, 59.9343, 30.3351) == pytest.approx(634, abs=5)
+
+
+def test_nearest_yields_rings_in_distance_order(world):
+    index, lats, lons = world
+    rings = list(index.nearest(10.0, 179.0))
+    ids = np.concatenate([ring_ids for ring_ids, _ in rings])
+    distances = np.concatenate([ring_distances for _, ring_distances in rings])
+    assert sorted(ids.tolist()) == list(range(len(lats)))
+    assert np.all(np.diff(distances) >= -1e-9)
+    assert all(len(ring_ids) for ring_ids, _ in rings)
+
+
+def test_nearest_only_restricts_buildings(world):
+    index, _, _ = world
+    only = np.array([5, 50, 500])
+    ids = np.concatenate([ring_ids for ring_ids, _ in index.nearest(0.0, 0.0, only)])
+    assert sorted(ids.tolist()) == [5, 50, 500]
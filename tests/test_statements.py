@@ -0,0 +1,21 @@
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from bench.compile import cases
+from db.handler.loader import LOADERS
+
+REQUEST_PARAMS = {
+    "limit", "after", "last_id", "last_rank", "ids", "building_ids", "id", "organization_id", "building_id",
+    "activity_id", "activity_name", "q", "pattern", "name", "phone_pattern",
+    "lat", "lon", "radius", "min_lat", "max_lat", "min_lon", "max_lon",
+}
+CASES = [(loader, *case) for loader in LOADERS for case in cases(loader)]
+
+
+@pytest.mark.parametrize("loader, name, build, args", CASES, ids=[f"{c[0]}: {c[1]}" for c in CASES])
+def test_hot_statement_is_built_once_and_compiles(loader, name, build, args):
+    statement = build(*args)
+    assert build(*args) is statement
+    compiled = statement.compile(dialect=postgresql.dialect())
+    # Значения запроса приходят при execute: в собранной конструкции их нет (константы SQL — не в счёт)
+    assert all(compiled.params[key] is None for key in compiled.params.keys() & REQUEST_PARAMS)
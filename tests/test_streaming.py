@@ -0,0 +1,74 @@
+from contextlib import asynccontextmanager
+
+import orjson
+import pytest
+from starlette.requests import Request
+
+from utils.streaming import NDJSON_MEDIA_TYPE, ndjson_response, wants_ndjson
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeDB:
+    """Фабрика сессий, как get_db: запоминает, открыта ли сессия"""
+
+    def __init__(self):
+        self.open = False
+
+    @asynccontextmanager
+    async def __call__(self):
+        self.open = True
+        try:
+            yield "session"
+        finally:
+            self.open = False
+
+
+async def body_of(response) -> bytes:
+    return b"".join([chunk async for chunk in response.body_iterator])
+
+
+async def test_batches_become_lines_and_session_lives_with_the_stream():
+    db = FakeDB()
+
+    async def produce(session):
+        yield [{"id": 1}, {"id": 2, "name": "Рога"}]
+        yield []
+        assert db.open
+        yield [{"id": 3}]
+
+    response = await ndjson_response(db, produce)
+    assert response.media_type == NDJSON_MEDIA_TYPE
+    assert db.open
+    lines = (await body_of(response)).splitlines()
+    assert [orjson.loads(line) for line in lines] == [{"id": 1}, {"id": 2, "name": "Рога"}, {"id": 3}]
+    assert not db.open
+
+
+async def test_empty_stream():
+    async def produce(session):
+        return
+        yield
+
+    assert await body_of(await ndjson_response(FakeDB(), produce)) == b""
+
+
+async def test_error_before_first_batch_is_raised_not_streamed():
+    async def produce(session):
+        raise ValueError("bad cursor")
+        yield
+
+    db = FakeDB()
+    with pytest.raises(ValueError, match="bad cursor"):
+        await ndjson_response(db, produce)
+    assert not db.open
+
+
+@pytest.mark.parametrize("accept, stream, expected", [
+    ("application/json", False, False),
+    ("application/json", True, True),
+    ("application/x-ndjson", False, True),
+])
+def test_wants_ndjson(accept, stream, expected):
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [(b"accept", accept.encode())]})
+    assert wants_ndjson(request, stream) is expected
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from db.tiles import TileIndex, tile_coords
+
+GRID_BITS, CLUSTER_MAX_ZOOM = 2, 4
+
+
+def build(buildings: dict[int, tuple[float, float, int]]) -> TileIndex:
+    ids = np.array(sorted(buildings), dtype=np.int64)
+    lats, lons, organizations = (np.array(column, dtype=float) for column in zip(*(buildings[i] for i in ids)))
+    return TileIndex.from_arrays(GRID_BITS, CLUSTER_MAX_ZOOM, ids, lats, lons, organizations)
+
+
+def assert_same(index: TileIndex, buildings: dict[int, tuple[float, float, int]]):
+    """Инкрементальные изменения дают те же уровни, что построение с нуля"""
+    expected = build(buildings)
+    for level in range(GRID_BITS, index.max_level + 1):
+        cells, expected_cells = index.levels[level], expected.levels[level]
+        assert cells.keys() == expected_cells.keys()
+        for key, (count, organizations, lat_sum, lon_sum) in expected_cells.items():
+            assert cells[key][:2] == [count, organizations]
+            assert cells[key][2:] == pytest.approx([lat_sum, lon_sum])
+    assert index.points == expected.points
+    assert {i: b[:3] for i, b in index.buildings.items()} == {i: b[:3] for i, b in expected.buildings.items()}
+
+
+@pytest.fixture
+def city():
+    rng = np.random.default_rng(7)
+    return {
+        int(i): (float(lat), float(lon), int(orgs))
+        for i, lat, lon, orgs in zip(
+            range(1, 201), rng.uniform(55.5, 56.0, 200), rng.uniform(37.3, 37.9, 200), rng.integers(0, 5, 200),
+        )
+    }
+
+
+def test_add_remove_move_match_rebuild(city):
+    index = build(city)
+    index.add(500, 55.7, 37.6, 3)
+    index.remove(1)
+    # Перенос сохраняет число организаций
+    organizations = city[2][2]
+    index.add(2, -33.9, 151.2)
+    buildings = {i: b for i, b in city.items() if i != 1} | {500: (55.7, 37.6, 3), 2: (-33.9, 151.2, organizations)}
+    assert_same(index, buildings)
+    assert index.remove(404) is None
+
+
+def test_set_organizations_is_absolute(city):
+    index = build(city)
+    index.set_organizations(3, 10)
+    index.set_organizations(3, 10)
+    index.set_organizations(404, 1)
+    assert_same(index, city | {3: (*city[3][:2], 10)})
+
+
+def test_removing_every_building_empties_levels(city):
+    index = build(city)
+    for building_id in city:
+        index.remove(building_id)
+    assert all(not cells for cells in index.levels)
+    assert index.points == {}
+
+
+def test_clusters_and_points(city):
+    index = build(city)
+    clusters = index.tile(0, 0, 0)["clusters"]
+    assert sum(c["buildings"] for c in clusters) == len(city)
+    assert sum(c["organizations"] for c in clusters) == sum(orgs for _, _, orgs in city.values())
+
+    # Глубже cluster_max_zoom и глубже самого мелкого уровня — здания своего тайла
+    for z in (CLUSTER_MAX_ZOOM + 1, index.max_level + 3):
+        lat, lon, _ = city[5]
+        x, y = tile_coords(lat, lon, z)
+        points = index.tile(z, x, y)["points"]
+        assert 5 in {p["id"] for p in points}
+        assert all(tile_coords(p["latitude"], p["longitude"], z) == (x, y) for p in points)
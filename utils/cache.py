@@ -0,0 +1,271 @@
+"""
+Кеш ответов обработчиков чтения
+
+Запись кеша хранит результат и снимок версий своих тегов (org:5, building:3,
+geo:55:37, ...). Запись на изменение данных не удаляет ключи, а увеличивает
+общий счётчик seq и ставит затронутым тегам версию = seq, поэтому любая запись,
+зависящая от этих тегов, при следующем чтении считается устаревшей.
+
+Порядок, который исключает отдачу устаревших данных:
+  писатель: commit -> seq += 1 -> версии тегов = seq;
+  читатель: s0 = seq -> запрос к БД -> снимок версий тегов -> сохранить, только если seq == s0.
+
+С репликами чтения этого мало: читатель может выполнить запрос на реплике, ещё не
+получившей запись, уже после сброса тегов. Поэтому при включённых репликах
+(db.engine вызывает reinvalidate_after) теги сбрасываются ещё раз, когда отставание
+реплики гарантированно прошло.
+
+Сбросить записи можно только через тот же backend: MemoryBackend виден одному
+процессу, поэтому с несколькими воркерами он отключается, а импорт
+(import_data.py) сбрасывает кеш работающего сервиса только с CACHE_BACKEND=redis.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import json
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable
+
+from config import CACHE_BACKEND, CACHE_MAX_ENTRIES, REDIS_DB, REDIS_HOST, REDIS_PORT, REDIS_TTL, WEB_CONCURRENCY
+
+PREFIX = "orgsvc"
+SEQ_KEY = f"{PREFIX}:seq"
+logger = logging.getLogger()
+
+# Запросы, покрывающие больше клеток 1°×1°, помечаются одним общим гео-тегом
+MAX_GEO_TAGS = 256
+
+
+class MemoryBackend:
+    """LRU в памяти процесса; годится только для одного воркера: записи других процессов его не сбрасывают"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        # Версии тегов не вытесняются: потеря версии не должна оживлять старые записи
+        self.values: dict[str, int] = {}
+
+    async def get_entry(self, key: str) -> str | None:
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set_entry(self, key: str, value: str, ttl: int):
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_values(self, keys: list[str]) -> list[int | None]:
+        return [self.values.get(key) for key in keys]
+
+    async def set_missing_values(self, keys: list[str], value: int):
+        for key in keys:
+            self.values.setdefault(key, value)
+
+    async def bump(self, keys: list[str]) -> int:
+        seq = self.values.get(SEQ_KEY, 0) + 1
+        self.values[SEQ_KEY] = seq
+        for key in keys:
+            self.values[key] = seq
+        return seq
+
+
+class RedisBackend:
+    """Общий кеш для всех воркеров в Redis (REDIS_HOST/REDIS_PORT/REDIS_DB)"""
+
+    def __init__(self, host: str, port: int, db: int):
+        import redis.asyncio as redis
+
+        self.redis = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+
+    async def get_entry(self, key: str) -> str | None:
+        return await self.redis.get(key)
+
+    async def set_entry(self, key: str, value: str, ttl: int):
+        await self.redis.set(key, value, ex=ttl)
+
+    async def get_values(self, keys: list[str]) -> list[int | None]:
+        if not keys:
+            return []
+        return [int(value) if value is not None else None for value in await self.redis.mget(keys)]
+
+    async def set_missing_values(self, keys: list[str], value: int):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.set(key, value, nx=True)
+            await pipe.execute()
+
+    async def bump(self, keys: list[str]) -> int:
+        seq = await self.redis.incr(SEQ_KEY)
+        if keys:
+            await self.redis.mset({key: seq for key in keys})
+        return seq
+
+
+def make_backend(kind: str = CACHE_BACKEND, workers: int = WEB_CONCURRENCY):
+    if kind == "redis":
+        return RedisBackend(REDIS_HOST, REDIS_PORT, REDIS_DB)
+    if kind == "memory":
+        if workers > 1:
+            logger.warning(f"⚠️ CACHE_BACKEND=memory is per-process, disabled for {workers} workers; use redis")
+            return None
+        return MemoryBackend(CACHE_MAX_ENTRIES)
+    if kind == "none":
+        return None
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+backend = make_backend()
+
+
+def tag_key(tag: str) -> str:
+    return f"{PREFIX}:t:{tag}"
+
+
+async def current_seq() -> int:
+    (seq,) = await backend.get_values([SEQ_KEY])
+    return seq or 0
+
+
+async def lookup(key: str):
+    """(True, value) при попадании в кеш с актуальными тегами, иначе (False, None)"""
+    raw = await backend.get_entry(key)
+    if raw is None:
+        return False, None
+    entry = json.loads(raw)
+    tags = list(entry["t"])
+    versions = await backend.get_values([tag_key(tag) for tag in tags])
+    if any(version is None or version != entry["t"][tag] for tag, version in zip(tags, versions)):
+        return False, None
+    return True, entry["v"]
+
+
+async def store(key: str, value, tags: Iterable[str], seq: int):
+    tags = sorted(set(tags))
+    keys = [tag_key(tag) for tag in tags]
+    versions = await backend.get_values(keys)
+    missing = [k for k, version in zip(keys, versions) if version is None]
+    if missing:
+        await backend.set_missing_values(missing, seq)
+        versions = await backend.get_values(keys)
+    # Пока считали результат, прошла запись: результат мог её не увидеть
+    if await current_seq() != seq or any(version is None for version in versions):
+        return
+    entry = {"t": dict(zip(tags, versions)), "v": value}
+    await backend.set_entry(key, json.dumps(entry, ensure_ascii=False, separators=(",", ":")), REDIS_TTL)
+
+
+# Задержка повторного сброса тегов (сек); 0 — без реплик повтор не нужен
+reinvalidate_delay = 0.0
+pending_bumps: set[asyncio.Task] = set()
+
+
+def reinvalidate_after(delay: float):
+    global reinvalidate_delay
+    reinvalidate_delay = delay
+
+
+async def delayed_bump(keys: list[str]):
+    await asyncio.sleep(reinvalidate_delay)
+    try:
+        await backend.bump(keys)
+    except Exception as e:
+        logger.warning(f"⚠️ Delayed cache invalidation failed: {e}")
+
+
+async def invalidate(*tags: str):
+    """Вызывается обработчиками записи после commit"""
+    if backend is None:
+        return
+    keys = [tag_key(tag) for tag in set(tags)]
+    await backend.bump(keys)
+    if reinvalidate_delay > 0:
+        task = asyncio.create_task(delayed_bump(keys))
+        pending_bumps.add(task)
+        task.add_done_callback(pending_bumps.discard)
+
+
+def make_key(name: str, params: dict) -> str:
+    normalized = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    digest = hashlib.sha1(normalized.encode()).hexdigest()
+    return f"{PREFIX}:e:{name}:{digest}"
+
+
+def cached(name: str, tags: Callable[..., Iterable[str]]):
+    """Кешировать результат обработчика чтения.
+
+    Ключ — имя и нормализованные параметры без session; tags(result, **params)
+    перечисляет, от каких сущностей зависит результат.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if backend is None:
+                return await func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            params = {key: value for key, value in bound.arguments.items() if key != "session"}
+            key = make_key(name, params)
+            hit, value = await lookup(key)
+            if hit:
+                return value
+            seq = await current_seq()
+            result = await func(*args, **kwargs)
+            await store(key, result, tags(result, **params), seq)
+            return result
+
+        return wrapper
+    return decorator
+
+
+def organization_tags(organizations: Iterable[dict]) -> set[str]:
+    """Теги содержимого сериализованных организаций"""
+    tags = set()
+    for org in organizations:
+        tags.add(f"org:{org['id']}")
+        if org.get("building"):
+            tags.add(f"building:{org['building']['id']}")
+        if org.get("activities"):
+            tags.add("activities")
+    return tags
+
+
+def geo_tag(lat: float, lon: float) -> str:
+    return f"geo:{math.floor(lat)}:{math.floor((lon + 180.0) % 360.0 - 180.0)}"
+
+
+def geo_tags(min_lat: float, max_lat: float, min_lon: float, max_lon: float) -> set[str]:
+    """Клетки 1°×1°, которые задевает область (min_lon > max_lon — через антимеридиан)"""
+    lat_cells = range(max(math.floor(min_lat), -90), min(math.floor(max_lat), 89) + 1)
+    span = (max_lon - min_lon) % 360.0 if max_lon - min_lon < 360.0 else 360.0
+    lon_cells = min(math.floor(min_lon + span) - math.floor(min_lon) + 1, 360)
+    if len(lat_cells) * lon_cells > MAX_GEO_TAGS:
+        return {"geo:*"}
+    return {
+        geo_tag(lat, math.floor(min_lon) + step)
+        for lat in lat_cells
+        for step in range(lon_cells)
+    }
+
+
+def radius_geo_tags(lat: float, lon: float, radius_km: float) -> set[str]:
+    """Гео-теги для шапки радиуса radius_km вокруг точки"""
+    angle = radius_km / 6371.0
+    d_lat = math.degrees(angle)
+    if lat + d_lat >= 90.0 or lat - d_lat <= -90.0 or angle >= math.pi / 2:
+        return geo_tags(max(lat - d_lat, -90.0), min(lat + d_lat, 90.0), -180.0, 180.0)
+    d_lon = math.degrees(math.asin(min(math.sin(angle) / math.cos(math.radians(lat)), 1.0)))
+    return geo_tags(lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon)
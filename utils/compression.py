@@ -0,0 +1,250 @@
+"""
+Сжатие ответов по Accept-Encoding: zstd, br, gzip
+
+Кодировка выбирается по q-значениям клиента, при равных — по порядку
+COMPRESSION_ENCODINGS. br и zstd доступны, если установлены brotli и zstandard;
+gzip (zlib) есть всегда. Тела меньше COMPRESSION_MIN_SIZE, ответы 204/304 и
+не текстовые типы уходят как есть.
+
+Сжатые тела хранятся в LRU до COMPRESSION_CACHE_BYTES. Ключ — кодировка, путь с query и
+ETag ответа, в котором уже стоит версия сущности: после изменения ETag другой и
+старая запись просто вытесняется. У крупных ответов без ETag (списки) ключом
+служит хеш тела — он на порядок дешевле повторного сжатия.
+
+Потоковые ответы (NDJSON) сжимаются по частям со сбросом после каждой,
+чтобы клиент получал строки сразу.
+"""
+import hashlib
+import zlib
+from collections import OrderedDict
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from config import (
+    COMPRESSION_BROTLI_QUALITY,
+    COMPRESSION_CACHE_BYTES,
+    COMPRESSION_ENCODINGS,
+    COMPRESSION_GZIP_LEVEL,
+    COMPRESSION_MIN_SIZE,
+    COMPRESSION_ZSTD_LEVEL,
+)
+from utils.metrics import http_compressed
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+# Ответы без ETag меньше этого размера сжимаются заново: хеш и поиск не окупаются
+DIGEST_MIN_SIZE = 16 * 1024
+
+
+class GzipStream:
+    def __init__(self):
+        self.compressor = zlib.compressobj(COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+class BrotliStream:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=COMPRESSION_BROTLI_QUALITY)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.flush()
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.process(data) + self.compressor.finish()
+
+
+class ZstdStream:
+    def __init__(self):
+        self.compressor = zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self, data: bytes) -> bytes:
+        return self.compressor.compress(data) + self.compressor.flush()
+
+
+def gzip_compress(data: bytes) -> bytes:
+    return zlib.compress(data, COMPRESSION_GZIP_LEVEL, wbits=31)
+
+
+def brotli_compress(data: bytes) -> bytes:
+    return brotli.compress(data, quality=COMPRESSION_BROTLI_QUALITY)
+
+
+def zstd_compress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=COMPRESSION_ZSTD_LEVEL).compress(data)
+
+
+AVAILABLE = {"gzip": (gzip_compress, GzipStream)}
+if brotli is not None:
+    AVAILABLE["br"] = (brotli_compress, BrotliStream)
+if zstandard is not None:
+    AVAILABLE["zstd"] = (zstd_compress, ZstdStream)
+
+# Кодировка -> (сжатие целиком, потоковый компрессор), в порядке предпочтения сервера
+ENCODERS = {encoding: AVAILABLE[encoding] for encoding in COMPRESSION_ENCODINGS if encoding in AVAILABLE}
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Кодировка с наибольшим q у клиента; при равенстве — первая в ENCODERS"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODERS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compressible(status: int, headers: Headers) -> bool:
+    if status < 200 or status in (204, 206, 304) or "content-encoding" in headers:
+        return False
+    return headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressedCache:
+    """LRU сжатых тел с ограничением по суммарному размеру"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries: OrderedDict[tuple, bytes] = OrderedDict()
+
+    def get(self, key: tuple) -> bytes | None:
+        body = self.entries.get(key)
+        if body is not None:
+            self.entries.move_to_end(key)
+        return body
+
+    def put(self, key: tuple, body: bytes):
+        # Одно тело не должно вытеснять весь кеш
+        if len(body) > self.max_bytes // 8:
+            return
+        previous = self.entries.pop(key, None)
+        if previous is not None:
+            self.size -= len(previous)
+        self.entries[key] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+compressed_cache = CompressedCache(COMPRESSION_CACHE_BYTES)
+
+
+def cache_key(encoding: str, target: str, etag: str | None, body: bytes) -> tuple | None:
+    if etag:
+        return encoding, target, etag
+    if len(body) >= DIGEST_MIN_SIZE:
+        return encoding, hashlib.blake2b(body, digest_size=16).digest()
+    return None
+
+
+def compress_body(encoding: str, target: str, etag: str | None, body: bytes) -> bytes:
+    key = cache_key(encoding, target, etag, body) if compressed_cache.max_bytes else None
+    if key is not None:
+        compressed = compressed_cache.get(key)
+        if compressed is not None:
+            http_compressed.inc(encoding, "hit")
+            return compressed
+    compressed = ENCODERS[encoding][0](body)
+    if key is not None:
+        compressed_cache.put(key, compressed)
+    http_compressed.inc(encoding, "miss" if key is not None else "uncached")
+    return compressed
+
+
+def weak_etag(etag: str) -> str:
+    """Сжатое представление не побайтно равно исходному — ETag становится слабым;
+    utils.etag.etag_matches сравнивает без W/, так что 304 продолжают работать"""
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+class CompressionMiddleware:
+    """ASGI-middleware: придерживает http.response.start до первой части тела,
+    решает, сжимать ли, и подменяет заголовки"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ENCODERS:
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            return await self.app(scope, receive, send)
+
+        start = None
+        stream = None
+
+        async def send_wrapper(message):
+            nonlocal start, stream
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                return await send(message)
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is None:
+                if stream is None:
+                    return await send(message)
+                data = stream.compress(body) if more_body else stream.finish(body)
+                return await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+            headers = MutableHeaders(raw=list(start["headers"]))
+            if not compressible(start["status"], headers) or (not more_body and len(body) < COMPRESSION_MIN_SIZE):
+                if compressible(start["status"], headers):
+                    headers.add_vary_header("Accept-Encoding")
+                    start = {**start, "headers": headers.raw}
+                await send(start)
+                start = None
+                return await send(message)
+
+            headers["Content-Encoding"] = encoding
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag:
+                headers["ETag"] = weak_etag(etag)
+            if more_body:
+                del headers["Content-Length"]
+                stream = ENCODERS[encoding][1]()
+                data = stream.compress(body)
+                http_compressed.inc(encoding, "stream")
+            else:
+                target = f'{scope["path"]}?{scope["query_string"].decode("latin-1")}'
+                data = compress_body(encoding, target, etag, body)
+                headers["Content-Length"] = str(len(data))
+            await send({**start, "headers": headers.raw})
+            start = None
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,27 @@
+"""
+Условные GET: сильные ETag и 304 Not Modified
+"""
+import hashlib
+
+from fastapi import Request, Response
+from starlette.status import HTTP_304_NOT_MODIFIED
+
+
+def make_etag(*parts) -> str:
+    """Сильный ETag из версий сущностей и параметров запроса"""
+    raw = "|".join(str(part) for part in parts)
+    return '"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match сравнивается слабо (RFC 9110, 13.1.2): префикс W/ не учитывается"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,39 @@
+"""
+Параметр fields= у списков: fields=id,name,building.latitude
+
+Разобранный набор передаётся обработчику (проекция в db/projection.py) и входит
+в ключ кеша. Ответ с неполным набором полей не соответствует response_model
+маршрута, поэтому отдаётся напрямую через ORJSONResponse.
+"""
+from fastapi import Query
+from fastapi.responses import ORJSONResponse
+
+from db.projection import ACTIVITY_FIELDS, BUILDING_FIELDS, ORGANIZATION_FIELDS, normalize_fields
+from exception.request import InvalidFieldsError
+
+
+def parse_fields(raw: str | None, allowed: tuple[str, ...]) -> tuple[str, ...] | None:
+    if raw is None:
+        return None
+    try:
+        return normalize_fields((field.strip() for field in raw.split(",") if field.strip()), allowed)
+    except ValueError as e:
+        raise InvalidFieldsError(str(e))
+
+
+def fields_dependency(allowed: tuple[str, ...]):
+    description = f"Только перечисленные поля (id всегда): {', '.join(allowed)}"
+
+    def dependency(fields: str | None = Query(None, description=description)):
+        return parse_fields(fields, allowed)
+    return dependency
+
+
+organization_fields = fields_dependency((*ORGANIZATION_FIELDS, "building"))
+building_fields = fields_dependency(BUILDING_FIELDS)
+activity_fields = fields_dependency(ACTIVITY_FIELDS)
+
+
+def sparse_response(result, fields: tuple[str, ...] | None, headers: dict | None = None):
+    """headers — те, что маршрут выставил в response: у отдельного ответа они не подхватятся"""
+    return result if fields is None else ORJSONResponse(result, headers=headers)
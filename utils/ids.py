@@ -0,0 +1,31 @@
+"""
+Параметр ids= у /batch: ids=1,2,3 или ids=1&ids=2 (можно вперемешку)
+
+Повторы убираются с сохранением порядка первого появления — в нём же идёт ответ.
+"""
+from fastapi import Query
+
+from config import BATCH_MAX_IDS
+from exception.request import InvalidIdsError
+
+
+def parse_ids(raw: list[str]) -> list[int]:
+    ids = {}
+    for part in raw:
+        for value in part.split(","):
+            value = value.strip()
+            if not value:
+                continue
+            try:
+                ids[int(value)] = None
+            except ValueError:
+                raise InvalidIdsError(f"invalid id: {value}")
+    if not ids:
+        raise InvalidIdsError("ids must not be empty")
+    if len(ids) > BATCH_MAX_IDS:
+        raise InvalidIdsError(f"at most {BATCH_MAX_IDS} ids per request")
+    return list(ids)
+
+
+def batch_ids(ids: list[str] = Query(..., description=f"id через запятую, не больше {BATCH_MAX_IDS}")) -> list[int]:
+    return parse_ids(ids)
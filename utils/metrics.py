@@ -0,0 +1,189 @@
+"""
+Метрики в формате Prometheus
+
+Счётчики живут в памяти процесса: запись — несколько операций со словарём без
+блокировок (всё выполняется в одном потоке event loop). При нескольких воркерах
+каждый отдаёт свои значения, Prometheus собирает их по отдельности.
+"""
+import bisect
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.querystats import current_stats
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        # labels -> [счётчики по корзинам (не накопительные), сумма, количество]
+        self.values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        state = self.values.get(labels)
+        if state is None:
+            state = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def samples(self):
+        for labels, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                yield f"{self.name}_bucket", format_labels((*self.labels, "le"), (*labels, le)), cumulative
+            yield f"{self.name}_sum", format_labels(self.labels, labels), total
+            yield f"{self.name}_count", format_labels(self.labels, labels), count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {value}" for name, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP requests by route template and status", ("method", "route", "status"),
+))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte", ("method", "route"),
+))
+http_response_size = registry.register(Histogram(
+    "http_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS,
+))
+http_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being processed",
+))
+db_duration = registry.register(Histogram(
+    "db_statement_duration_seconds", "SQL statement execution time by operation", ("operation",),
+))
+db_errors = registry.register(Counter(
+    "db_statement_errors_total", "SQL statements that raised", ("operation",),
+))
+db_read_sessions = registry.register(Counter(
+    "db_read_sessions_total", "Read sessions by target (replica-N, primary) and routing reason", ("target", "reason"),
+))
+http_compressed = registry.register(Counter(
+    "http_compressed_responses_total", "Compressed responses by encoding and precompressed cache result",
+    ("encoding", "cache"),
+))
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: задержка, статус, размер ответа и число запросов в работе.
+
+    Маршрут берётся из шаблона (/organizations/{organization_id}), а не из пути,
+    чтобы число временных рядов не росло с числом id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "<unmatched>"
+            method = scope["method"]
+            http_duration.observe(time.perf_counter() - started, method, route)
+            http_response_size.observe(size, method, route)
+            http_requests.inc(method, route, status)
+
+
+def statement_operation(statement: str) -> str:
+    head = statement.lstrip()[:8].split(None, 1)
+    operation = head[0].upper() if head else ""
+    return operation if operation in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY") else "OTHER"
+
+
+def instrument_engine(engine: Engine):
+    """Время каждого SQL-запроса через события движка (для async — engine.sync_engine);
+    заодно пополняет QueryStats текущего HTTP-запроса (utils.querystats)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        db_duration.observe(elapsed, statement_operation(statement))
+        stats = current_stats.get()
+        if stats is not None:
+            stats.record(statement, cursor.rowcount, elapsed)
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        db_errors.inc(statement_operation(exception_context.statement or ""))
@@ -0,0 +1,129 @@
+"""
+SQL-запросы в рамках одного HTTP-запроса
+
+События движка (utils.metrics.instrument_engine) добавляют каждый выполненный
+запрос в QueryStats текущего контекста. contextvars доходят и до синхронного
+кода SQLAlchemy: его greenlet наследует контекст задачи asyncio.
+
+Вне production ответы получают заголовки X-DB-Queries, X-DB-Rows и Server-Timing
+(а маршруты чтения — X-DB-Target: replica-N или primary), а маршруты с объявленным бюджетом (query_budget) — ещё X-DB-Query-Budget.
+assert_route_within_budget проверяет бюджет в тестах: добавленное обращение к
+связи в serialize_organization, превратившее один запрос в N, сразу его превысит.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from config import QUERY_STATS_HEADERS
+
+logger = logging.getLogger()
+
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    rows: int = 0
+    db_time: float = 0.0
+    # Куда ушла сессия чтения (db.engine.read_session)
+    target: str | None = None
+    # Текст запросов — только для сообщений об ошибке в тестах
+    log: list[str] | None = None
+
+    def record(self, statement: str, rows: int, elapsed: float):
+        self.statements += 1
+        self.rows += max(rows, 0)
+        self.db_time += elapsed
+        if self.log is not None:
+            self.log.append(statement)
+
+
+current_stats: ContextVar[QueryStats | None] = ContextVar("current_stats", default=None)
+
+
+@contextmanager
+def track_queries(log: bool = False):
+    stats = QueryStats(log=[] if log else None)
+    token = current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_stats.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_statements: int):
+    """Объявить для маршрута предельное число SQL-запросов (при любой стратегии загрузки и холодном кеше)"""
+    def decorator(func):
+        func.__query_budget__ = max_statements
+        return func
+    return decorator
+
+
+@contextmanager
+def expect_queries(max_statements: int):
+    """Проверка бюджета вокруг прямого вызова обработчика: with expect_queries(3): await handler(...)"""
+    with track_queries(log=True) as stats:
+        yield stats
+    if stats.statements > max_statements:
+        raise QueryBudgetExceeded(
+            f"{stats.statements} SQL statements, budget {max_statements}:\n" + "\n---\n".join(stats.log)
+        )
+
+
+async def assert_route_within_budget(client, method: str, url: str, **kwargs):
+    """Запрос через httpx-клиент к app; падает, если маршрут выполнил больше запросов, чем объявил"""
+    response = await client.request(method, url, **kwargs)
+    budget = response.headers.get("x-db-query-budget")
+    if budget is None:
+        raise QueryBudgetExceeded(f"{method} {url}: route declares no query budget (or headers are disabled)")
+    queries = int(response.headers["x-db-queries"])
+    if queries > int(budget):
+        raise QueryBudgetExceeded(f"{method} {url}: {queries} SQL statements, budget {budget}")
+    return response
+
+
+class QueryStatsMiddleware:
+    """Считает запросы к БД для каждого HTTP-запроса и пишет их в заголовки ответа.
+
+    Для потоковых ответов в заголовки попадает то, что выполнено до их отправки
+    (первая пачка).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not QUERY_STATS_HEADERS:
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                total = (time.perf_counter() - started) * 1000
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.statements).encode()))
+                headers.append((b"x-db-rows", str(stats.rows).encode()))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.db_time * 1000:.2f};desc="{stats.statements} queries", app;dur={total:.2f}'.encode(),
+                ))
+                if stats.target is not None:
+                    headers.append((b"x-db-target", stats.target.encode()))
+                budget = getattr(getattr(scope.get("route"), "endpoint", None), "__query_budget__", None)
+                if budget is not None:
+                    headers.append((b"x-db-query-budget", str(budget).encode()))
+                    if stats.statements > budget:
+                        logger.warning(
+                            f"⚠️ {scope['method']} {scope['path']}: {stats.statements} SQL statements, budget {budget}"
+                        )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with track_queries() as stats:
+            await self.app(scope, receive, send_wrapper)
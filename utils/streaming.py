@@ -0,0 +1,43 @@
+from typing import AsyncIterator, Callable
+
+import orjson
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(request: Request, stream: bool = False) -> bool:
+    """Потоковый режим включается через ?stream=1 или Accept: application/x-ndjson"""
+    return stream or NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+async def ndjson_response(db, produce: Callable[..., AsyncIterator[list]]) -> StreamingResponse:
+    """Отдать результат построчно, по мере прихода пачек с серверного курсора.
+
+    Сессия открывается внутри генератора: она должна жить, пока идёт ответ,
+    а не только пока выполняется обработчик маршрута. Первую пачку читаем до
+    отправки заголовков, чтобы ошибки запроса (например, битый курсор) вернулись
+    обычным HTTP-ответом, а не оборванным потоком.
+    """
+    async def body():
+        async with db() as session:
+            async for items in produce(session):
+                if items:
+                    yield b"".join(orjson.dumps(item, option=orjson.OPT_APPEND_NEWLINE) for item in items)
+
+    chunks = body()
+    try:
+        first = await chunks.__anext__()
+    except StopAsyncIteration:
+        return StreamingResponse(iter(()), media_type=NDJSON_MEDIA_TYPE)
+
+    async def rest():
+        try:
+            yield first
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            await chunks.aclose()
+
+    return StreamingResponse(rest(), media_type=NDJSON_MEDIA_TYPE)